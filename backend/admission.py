@@ -0,0 +1,181 @@
+"""
+Admission control for /chat, per model backend (the prefix get_llm parses: ollama, gemini).
+
+Each backend admits at most MAX_IN_FLIGHT requests at a time. Up to QUEUE_SIZE more wait
+(first come, first served) for at most QUEUE_TIMEOUT_SECONDS; anything beyond that is
+rejected right away with Overloaded, which /chat turns into a 429. A local Ollama then works
+through a bounded backlog instead of every request timing out together.
+"""
+import asyncio
+import math
+import os
+import threading
+import time
+import logging
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# backend: (max in flight, queue size). A local Ollama serves one or two generations at a
+# time; hosted models take many more. Override with FINMATE_<BACKEND>_MAX_IN_FLIGHT and
+# FINMATE_<BACKEND>_QUEUE_SIZE, e.g. FINMATE_OLLAMA_MAX_IN_FLIGHT=1.
+DEFAULT_LIMITS = {"ollama": (2, 8), "gemini": (16, 64)}
+
+# Backend of a model named without a known prefix: ChatRequest's default "qwen3", or an
+# Ollama tag such as "qwen3:8b", both served by the local Ollama (as /ollama does)
+DEFAULT_BACKEND = "ollama"
+
+# Longest a request waits in the queue before it is rejected
+QUEUE_TIMEOUT_SECONDS = float(os.getenv("FINMATE_QUEUE_TIMEOUT_SECONDS", "30"))
+
+
+class Overloaded(Exception):
+    """The backend's queue is full, or the request waited past its deadline."""
+
+    def __init__(self, backend: str, reason: str, retry_after: int):
+        super().__init__(f"{backend} is overloaded: {reason}")
+        self.backend = backend
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def backend_of(model: str) -> str:
+    """'gemini' for 'gemini:gemini-2.5-flash'; 'ollama' for 'ollama:qwen3', 'qwen3' and 'qwen3:8b'."""
+    prefix = model.split(":", 1)[0].strip().lower()
+    return prefix if ":" in model and prefix in DEFAULT_LIMITS else DEFAULT_BACKEND
+
+
+def _limit(backend: str, name: str, default: int) -> int:
+    return int(os.getenv(f"FINMATE_{backend.upper()}_{name}", str(default)))
+
+
+class Slot:
+    """An admitted request; release() frees it for the next one and may be called more than once."""
+
+    def __init__(self, limiter, admitted_at: float):
+        self._limiter = limiter
+        self._admitted_at = admitted_at
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._limiter._release(time.perf_counter() - self._admitted_at)
+
+
+class Limiter:
+    def __init__(self, backend: str, max_in_flight: int, queue_size: int, timeout: float = None):
+        self.backend = backend
+        self.max_in_flight = max_in_flight
+        self.queue_size = queue_size
+        self.timeout = QUEUE_TIMEOUT_SECONDS if timeout is None else timeout
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self._in_flight = 0
+        self._waiting = 0
+        self._max_waiting = 0
+        # Moving average of how long an admitted request holds its slot, for Retry-After
+        self._avg_hold = 0.0
+        self._counts = {"admitted": 0, "rejected": 0, "timed_out": 0}
+
+    def _metric(self, name: str) -> str:
+        return f"admission.{self.backend}.{name}"
+
+    def _retry_after(self) -> int:
+        # Time for the requests ahead to drain, at the observed hold time per request
+        waves = (self._waiting + self._in_flight) / self.max_in_flight
+        return max(1, math.ceil(self._avg_hold * waves))
+
+    def _reject(self, key: str, reason: str):
+        self._counts[key] += 1
+        metrics.incr(self._metric(key))
+        logger.warning(f"Rejected a {self.backend} request: {reason} "
+                       f"({self._in_flight} in flight, {self._waiting} waiting)")
+        raise Overloaded(self.backend, reason, self._retry_after())
+
+    async def acquire(self) -> Slot:
+        """Waits for a free slot. Raises Overloaded when the queue is full or the deadline passes."""
+        if self._semaphore.locked() and self._waiting >= self.queue_size:
+            self._reject("rejected", f"queue full ({self.queue_size} waiting)")
+        self._waiting += 1
+        self._max_waiting = max(self._max_waiting, self._waiting)
+        metrics.gauge(self._metric("queue_depth"), self._waiting)
+        start = time.perf_counter()
+        # Shielded: wait_for could otherwise time out after the acquire went through, losing the permit
+        acquiring = asyncio.ensure_future(self._semaphore.acquire())
+        try:
+            await asyncio.wait_for(asyncio.shield(acquiring), self.timeout)
+        except asyncio.TimeoutError:
+            self._abandon(acquiring)
+            self._reject("timed_out", f"no slot within {self.timeout:g}s")
+        except asyncio.CancelledError:
+            # The client went away while queued
+            self._abandon(acquiring)
+            raise
+        finally:
+            self._waiting -= 1
+            metrics.gauge(self._metric("queue_depth"), self._waiting)
+        metrics.observe(self._metric("wait"), time.perf_counter() - start)
+        self._in_flight += 1
+        self._counts["admitted"] += 1
+        metrics.incr(self._metric("admitted"))
+        return Slot(self, time.perf_counter())
+
+    def _abandon(self, acquiring: asyncio.Future):
+        """Cancels an acquire nobody waits for any more, giving its permit back if it got one."""
+        def give_back(task):
+            if not task.cancelled() and task.exception() is None:
+                self._semaphore.release()
+
+        acquiring.cancel()
+        acquiring.add_done_callback(give_back)
+
+    def _release(self, held: float):
+        self._in_flight -= 1
+        self._avg_hold = held if not self._avg_hold else 0.8 * self._avg_hold + 0.2 * held
+        self._semaphore.release()
+
+    def stats(self) -> dict:
+        return {
+            "max_in_flight": self.max_in_flight,
+            "queue_size": self.queue_size,
+            "queue_timeout_seconds": self.timeout,
+            "in_flight": self._in_flight,
+            "waiting": self._waiting,
+            "max_waiting": self._max_waiting,
+            "avg_hold_seconds": round(self._avg_hold, 3),
+            **self._counts,
+        }
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def limiter_for(model: str) -> Limiter:
+    """The process-wide limiter of the backend serving `model`."""
+    backend = backend_of(model)
+    with _limiters_lock:
+        limiter = _limiters.get(backend)
+        if limiter is None:
+            max_in_flight, queue_size = DEFAULT_LIMITS[backend]
+            limiter = _limiters[backend] = Limiter(
+                backend, _limit(backend, "MAX_IN_FLIGHT", max_in_flight), _limit(backend, "QUEUE_SIZE", queue_size)
+            )
+        return limiter
+
+
+async def admit(model: str) -> Slot:
+    return await limiter_for(model).acquire()
+
+
+def stats() -> dict:
+    with _limiters_lock:
+        limiters = dict(_limiters)
+    return {backend: limiter.stats() for backend, limiter in limiters.items()}
+
+
+def reset():
+    """Forgets every limiter, e.g. between tests running on different event loops."""
+    with _limiters_lock:
+        _limiters.clear()
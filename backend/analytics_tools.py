@@ -0,0 +1,207 @@
+from datetime import date, datetime, timedelta
+import logging
+
+from langchain.tools import tool
+
+import duckdb_tools
+from db_pool import with_db_executor
+
+logger = logging.getLogger(__name__)
+
+# Accepted period sizes; the value is what DuckDB's date_trunc expects
+GRANULARITIES = {"day": "day", "week": "week", "month": "month", "quarter": "quarter", "year": "year"}
+TRANSACTION_TYPES = ("DEBIT", "CREDIT")
+MAX_LIMIT = 100
+
+ACCOUNT_FILTER = "upper(bank) = upper(?) AND account_no = ? AND date BETWEEN ? AND ?"
+
+SPEND_BY_PERIOD_SQL = f"""
+    SELECT CAST(date_trunc(?, date) AS DATE) AS period, count(*) AS transactions, round(sum(amount), 2) AS total
+    FROM transactions
+    WHERE {ACCOUNT_FILTER} AND upper(type) = ?
+    GROUP BY 1 ORDER BY 1
+"""
+
+# Whole months are answered from the much smaller monthly_rollup table
+SPEND_BY_MONTH_ROLLUP_SQL = """
+    SELECT CAST(date_trunc(?, month) AS DATE) AS period, sum(txn_count) AS transactions,
+           round(sum(total_amount), 2) AS total
+    FROM monthly_rollup
+    WHERE upper(bank) = upper(?) AND account_no = ? AND month BETWEEN ? AND ? AND upper(type) = ?
+    GROUP BY 1 ORDER BY 1
+"""
+
+TOP_RECEIVERS_SQL = f"""
+    SELECT coalesce(nullif(receiver, ''), 'UNKNOWN') AS receiver, count(*) AS transactions,
+           round(sum(amount), 2) AS total
+    FROM transactions
+    WHERE {ACCOUNT_FILTER} AND upper(type) = ?
+    GROUP BY 1 ORDER BY total DESC, receiver LIMIT ?
+"""
+
+BALANCE_TREND_SQL = f"""
+    SELECT CAST(date_trunc(?, date) AS DATE) AS period,
+           last(balance ORDER BY date, seq) AS closing_balance,
+           min(balance) AS lowest_balance, max(balance) AS highest_balance
+    FROM transactions
+    WHERE {ACCOUNT_FILTER} AND balance IS NOT NULL
+    GROUP BY 1 ORDER BY 1
+"""
+
+MODE_BREAKDOWN_SQL = f"""
+    SELECT coalesce(nullif(mode, ''), 'UNKNOWN') AS mode, count(*) AS transactions, round(sum(amount), 2) AS total,
+           round(100 * sum(amount) / sum(sum(amount)) OVER (), 1) AS share_pct
+    FROM transactions
+    WHERE {ACCOUNT_FILTER} AND upper(type) = ?
+    GROUP BY 1 ORDER BY total DESC
+"""
+
+
+def parse_date(value: str) -> date:
+    """dd-mm-yyyy (the format used across FinMate) or yyyy-mm-dd."""
+    for fmt in ("%d-%m-%Y", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(value.strip(), fmt).date()
+        except ValueError:
+            pass
+    raise ValueError(f"Invalid date '{value}', expected dd-mm-yyyy")
+
+
+def _range(start_date: str, end_date: str):
+    start, end = parse_date(start_date), parse_date(end_date)
+    if start > end:
+        raise ValueError(f"start_date {start_date} is after end_date {end_date}")
+    return start, end
+
+
+def _granularity(value: str) -> str:
+    key = (value or "").strip().lower()
+    if key not in GRANULARITIES:
+        raise ValueError(f"Invalid granularity '{value}', expected one of {', '.join(GRANULARITIES)}")
+    return GRANULARITIES[key]
+
+
+def _type(value: str) -> str:
+    key = (value or "").strip().upper()
+    if key not in TRANSACTION_TYPES:
+        raise ValueError(f"Invalid type '{value}', expected DEBIT or CREDIT")
+    return key
+
+
+def _whole_months(start: date, end: date) -> bool:
+    return start.day == 1 and (end + timedelta(days=1)).day == 1
+
+
+def run_query(sql: str, params: list) -> str:
+    """Runs a parameterized query on the finance database, encoded like query_duckdb_tool results."""
+    return duckdb_tools.run_read_query(sql, params, limit=MAX_LIMIT, source="analytics_tools")
+
+
+def spend_by_period(bank, account_no, start_date, end_date, granularity="month", type="DEBIT") -> str:
+    start, end = _range(start_date, end_date)
+    unit, kind = _granularity(granularity), _type(type)
+    if unit in ("month", "quarter", "year") and _whole_months(start, end):
+        return run_query(SPEND_BY_MONTH_ROLLUP_SQL, [unit, bank, account_no, start, end, kind])
+    return run_query(SPEND_BY_PERIOD_SQL, [unit, bank, account_no, start, end, kind])
+
+
+def top_receivers(bank, account_no, start_date, end_date, limit=10, type="DEBIT") -> str:
+    start, end = _range(start_date, end_date)
+    limit = max(1, min(int(limit), MAX_LIMIT))
+    return run_query(TOP_RECEIVERS_SQL, [bank, account_no, start, end, _type(type), limit])
+
+
+def balance_trend(bank, account_no, start_date, end_date, granularity="month") -> str:
+    start, end = _range(start_date, end_date)
+    return run_query(BALANCE_TREND_SQL, [_granularity(granularity), bank, account_no, start, end])
+
+
+def mode_breakdown(bank, account_no, start_date, end_date, type="DEBIT") -> str:
+    start, end = _range(start_date, end_date)
+    return run_query(MODE_BREAKDOWN_SQL, [bank, account_no, start, end, _type(type)])
+
+
+def _safely(fn, *args) -> str:
+    try:
+        return fn(*args)
+    except ValueError as e:
+        return f"Invalid arguments: {e}"
+    except duckdb_tools.QueryLimitError as e:
+        logger.warning(f"{fn.__name__} stopped: {e}")
+        return e.to_json()
+    except Exception as e:
+        logger.warning(f"{fn.__name__} failed: {e}")
+        return f"Error running query: {e}"
+
+
+@with_db_executor
+@tool
+def spend_by_period_tool(bank: str, account_no: str, start_date: str, end_date: str,
+                         granularity: str = "month", type: str = "DEBIT") -> str:
+    """
+    Total amount and number of transactions of an account per day, week, month, quarter or year.
+    Use it for questions like "how much did I spend in May 2025" or "monthly spending this year".
+
+    Args:
+        bank: bank name, e.g. "ICICI"
+        account_no: masked account number, e.g. "XXXXXXXX6193"
+        start_date: start of the range in dd-mm-yyyy format
+        end_date: end of the range in dd-mm-yyyy format
+        granularity: one of day, week, month, quarter, year
+        type: "DEBIT" for spending, "CREDIT" for money received
+    """
+    return _safely(spend_by_period, bank, account_no, start_date, end_date, granularity, type)
+
+
+@with_db_executor
+@tool
+def top_receivers_tool(bank: str, account_no: str, start_date: str, end_date: str,
+                       limit: int = 10, type: str = "DEBIT") -> str:
+    """
+    Receivers (or senders, with type CREDIT) with the largest total amount in a date range.
+
+    Args:
+        bank: bank name, e.g. "ICICI"
+        account_no: masked account number, e.g. "XXXXXXXX6193"
+        start_date: start of the range in dd-mm-yyyy format
+        end_date: end of the range in dd-mm-yyyy format
+        limit: number of receivers to return (at most 100)
+        type: "DEBIT" for payments made, "CREDIT" for money received
+    """
+    return _safely(top_receivers, bank, account_no, start_date, end_date, limit, type)
+
+
+@with_db_executor
+@tool
+def balance_trend_tool(bank: str, account_no: str, start_date: str, end_date: str,
+                       granularity: str = "month") -> str:
+    """
+    Closing, lowest and highest account balance per day, week, month, quarter or year.
+
+    Args:
+        bank: bank name, e.g. "ICICI"
+        account_no: masked account number, e.g. "XXXXXXXX6193"
+        start_date: start of the range in dd-mm-yyyy format
+        end_date: end of the range in dd-mm-yyyy format
+        granularity: one of day, week, month, quarter, year
+    """
+    return _safely(balance_trend, bank, account_no, start_date, end_date, granularity)
+
+
+@with_db_executor
+@tool
+def mode_breakdown_tool(bank: str, account_no: str, start_date: str, end_date: str, type: str = "DEBIT") -> str:
+    """
+    Amount, count and share of transactions per payment mode (UPI, NET BANKING, ATM ...) in a date range.
+
+    Args:
+        bank: bank name, e.g. "ICICI"
+        account_no: masked account number, e.g. "XXXXXXXX6193"
+        start_date: start of the range in dd-mm-yyyy format
+        end_date: end of the range in dd-mm-yyyy format
+        type: "DEBIT" for spending, "CREDIT" for money received
+    """
+    return _safely(mode_breakdown, bank, account_no, start_date, end_date, type)
+
+
+ANALYTICS_TOOLS = [spend_by_period_tool, top_receivers_tool, balance_trend_tool, mode_breakdown_tool]
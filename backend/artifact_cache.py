@@ -0,0 +1,299 @@
+import os
+import hashlib
+import threading
+from datetime import datetime, timedelta
+import logging
+
+import duckdb
+
+import metrics
+from db_pool import get_pool
+from duckdb_tools import DB_PATH
+
+logger = logging.getLogger(__name__)
+
+# The cache index lives next to the transactions, so wiping the database also resets the cache
+CACHE_DB_PATH = DB_PATH
+
+# Upper bounds for the cached files on disk (downloaded + decrypted PDFs) and for the index
+CACHE_MAX_BYTES = int(os.getenv("FINMATE_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+CACHE_MAX_ENTRIES = int(os.getenv("FINMATE_CACHE_MAX_ENTRIES", "1000"))
+
+# Entries used this recently are never evicted, so a caller that just got a hit keeps its file
+CACHE_EVICT_GRACE_SECONDS = float(os.getenv("FINMATE_CACHE_EVICT_GRACE_SECONDS", "300"))
+
+# message_id of entries for files that were not downloaded from Gmail; their attachment_id is the path
+LOCAL_FILE = ""
+
+_initialized = set()
+_init_lock = threading.Lock()
+
+
+def sha256_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def sha256_file(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _pool():
+    pool = get_pool(CACHE_DB_PATH)
+    key = os.path.abspath(CACHE_DB_PATH)
+    if key not in _initialized:
+        with _init_lock:
+            if key not in _initialized:
+                with pool.write() as con:
+                    primary_key = con.execute("""
+                        SELECT constraint_column_names FROM duckdb_constraints()
+                        WHERE table_name = 'artifact_cache' AND constraint_type = 'PRIMARY KEY'
+                    """).fetchone()
+                    if primary_key and primary_key[0] == ["sha256"]:
+                        # Index keyed by content, from before rows were keyed by attachment; it is only a cache
+                        logger.info("Rebuilding the artifact cache index keyed by attachment")
+                        con.execute("DROP TABLE artifact_cache")
+                    con.execute("""
+                        CREATE TABLE IF NOT EXISTS artifact_cache (
+                            message_id VARCHAR,
+                            attachment_id VARCHAR,
+                            sha256 VARCHAR,
+                            filename VARCHAR,
+                            pdf_path VARCHAR,
+                            pdf_bytes BIGINT,
+                            decrypted_sha256 VARCHAR,
+                            decrypted_path VARCHAR,
+                            decrypted_bytes BIGINT,
+                            bank VARCHAR,
+                            account_no VARCHAR,
+                            parsed_rows INTEGER,
+                            parsed_start DATE,
+                            parsed_end DATE,
+                            period_start DATE,
+                            period_end DATE,
+                            created_at TIMESTAMP,
+                            last_access TIMESTAMP,
+                            PRIMARY KEY (message_id, attachment_id)
+                        )
+                    """)
+                    # Indexes from before statement periods were kept
+                    for column in ("period_start", "period_end"):
+                        con.execute(f"ALTER TABLE artifact_cache ADD COLUMN IF NOT EXISTS {column} DATE")
+                _initialized.add(key)
+    return pool
+
+
+def _lookup(where: str, params: list):
+    """
+    Marks the matching entries as used and returns the most recent one. Done under the write
+    lock, so evict() either runs first (no entry) or sees the entry as just used.
+    """
+    with _pool().write() as con:
+        cur = con.execute(f"UPDATE artifact_cache SET last_access = ? WHERE {where} RETURNING *",
+                          [datetime.now(), *params])
+        rows = cur.fetchall()
+        columns = [d[0] for d in cur.description]
+    entries = sorted((dict(zip(columns, row)) for row in rows), key=lambda e: e["created_at"], reverse=True)
+    return entries[0] if entries else None
+
+
+def _hit(stage: str, entry):
+    metrics.incr(f"artifact_cache.{stage}.{'hit' if entry else 'miss'}")
+    return entry
+
+
+def lookup_attachment(message_id: str, attachment_id: str):
+    """Returns the cached download of a Gmail attachment if its file is still on disk, unchanged."""
+    entry = _lookup("message_id = ? AND attachment_id = ?", [message_id, attachment_id])
+    if entry and not os.path.exists(entry["pdf_path"] or ""):
+        entry = None
+    if entry and sha256_file(entry["pdf_path"]) != entry["sha256"]:
+        logger.warning(f"Cached download {entry['pdf_path']} no longer matches {message_id}/{attachment_id}")
+        entry = None
+    return _hit("download", entry)
+
+
+def record_download(message_id: str, attachment_id: str, filename: str, path: str, data: bytes,
+                    period: tuple = None) -> str:
+    """
+    Indexes a downloaded attachment with the SHA-256 of its bytes and the (start, end)
+    statement period of its mail, if known. Returns the hash.
+    """
+    digest = sha256_bytes(data)
+    period_start, period_end = period or (None, None)
+    now = datetime.now()
+    with _pool().write() as con:
+        con.execute("""
+            INSERT INTO artifact_cache (message_id, attachment_id, sha256, filename, pdf_path, pdf_bytes,
+                                        period_start, period_end, created_at, last_access)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (message_id, attachment_id) DO UPDATE SET
+                sha256 = excluded.sha256, filename = excluded.filename, pdf_path = excluded.pdf_path,
+                pdf_bytes = excluded.pdf_bytes, period_start = excluded.period_start,
+                period_end = excluded.period_end, last_access = excluded.last_access,
+                -- What was derived from other bytes no longer applies
+                decrypted_sha256 = CASE WHEN sha256 = excluded.sha256 THEN decrypted_sha256 END,
+                decrypted_path = CASE WHEN sha256 = excluded.sha256 THEN decrypted_path END,
+                decrypted_bytes = CASE WHEN sha256 = excluded.sha256 THEN decrypted_bytes END,
+                parsed_rows = CASE WHEN sha256 = excluded.sha256 THEN parsed_rows END
+        """, [message_id, attachment_id, digest, filename, path, len(data), period_start, period_end, now, now])
+    evict()
+    return digest
+
+
+def lookup_decrypted(path: str):
+    """Returns the cached decrypted copy of the PDF at `path` if it is still on disk, unchanged."""
+    digest = sha256_file(path)
+    entry = _lookup("sha256 = ? AND decrypted_path IS NOT NULL", [digest])
+    if entry and not os.path.exists(entry["decrypted_path"]):
+        entry = None
+    if entry and sha256_file(entry["decrypted_path"]) != entry["decrypted_sha256"]:
+        logger.warning(f"Cached decrypted file {entry['decrypted_path']} no longer matches {path}")
+        entry = None
+    return _hit("decrypt", entry)
+
+
+def record_decrypt(path: str, decrypted_path: str):
+    """Links every entry with the bytes of the PDF at `path` to its decrypted copy, adding one if needed."""
+    digest = sha256_file(path)
+    decrypted_digest = sha256_file(decrypted_path)
+    decrypted_bytes = os.path.getsize(decrypted_path)
+    now = datetime.now()
+    with _pool().write() as con:
+        updated = con.execute("""
+            UPDATE artifact_cache SET decrypted_sha256 = ?, decrypted_path = ?, decrypted_bytes = ?, last_access = ?
+            WHERE sha256 = ?
+        """, [decrypted_digest, decrypted_path, decrypted_bytes, now, digest]).fetchone()[0]
+        if not updated:
+            con.execute("""
+                INSERT OR REPLACE INTO artifact_cache (message_id, attachment_id, sha256, filename, pdf_path,
+                                                       pdf_bytes, decrypted_sha256, decrypted_path,
+                                                       decrypted_bytes, created_at, last_access)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, [LOCAL_FILE, os.path.abspath(path), digest, os.path.basename(path), path, os.path.getsize(path),
+                  decrypted_digest, decrypted_path, decrypted_bytes, now, now])
+    evict()
+
+
+def _entry_for_parsed_file(path: str):
+    digest = sha256_file(path)
+    return digest, _lookup("decrypted_sha256 = ? OR sha256 = ?", [digest, digest])
+
+
+def lookup_period(path: str):
+    """The (start, end) statement period of the mail the PDF at `path` (or its encrypted original) came in."""
+    digest = sha256_file(path)
+    with _pool().read() as con:
+        row = con.execute("""
+            SELECT period_start, period_end FROM artifact_cache
+            WHERE (decrypted_sha256 = ? OR sha256 = ?) AND period_start IS NOT NULL
+            ORDER BY created_at DESC LIMIT 1
+        """, [digest, digest]).fetchone()
+    return tuple(row) if row else None
+
+
+def lookup_parse(path: str, bank: str, account_no: str):
+    """
+    Returns the cached parse result (row count and date range) of the statement at `path`
+    when it was already ingested for this account and its transactions are still stored.
+    """
+    _, entry = _entry_for_parsed_file(path)
+    if entry and (entry["parsed_rows"] is None or entry["account_no"] != account_no or entry["bank"] != bank):
+        entry = None
+    if entry and entry["parsed_rows"]:
+        try:
+            with get_pool(CACHE_DB_PATH).read() as con:
+                stored = con.execute(
+                    "SELECT count(*) FROM transactions WHERE account_no = ? AND date BETWEEN ? AND ?",
+                    [account_no, entry["parsed_start"], entry["parsed_end"]],
+                ).fetchone()[0]
+        except duckdb.Error:
+            stored = 0
+        if not stored:
+            entry = None
+    return _hit("parse", entry)
+
+
+def record_parse(path: str, transactions, bank: str, account_no: str):
+    """Stores the row count and date range of a parsed statement on every entry with its bytes."""
+    digest = sha256_file(path)
+    rows = len(transactions)
+    start = transactions["date"].min().date() if rows else None
+    end = transactions["date"].max().date() if rows else None
+    now = datetime.now()
+    with _pool().write() as con:
+        updated = con.execute("""
+            UPDATE artifact_cache SET bank = ?, account_no = ?, parsed_rows = ?, parsed_start = ?, parsed_end = ?,
+                                      last_access = ?
+            WHERE decrypted_sha256 = ? OR sha256 = ?
+        """, [bank, account_no, rows, start, end, now, digest, digest]).fetchone()[0]
+        if not updated:
+            con.execute("""
+                INSERT OR REPLACE INTO artifact_cache (message_id, attachment_id, sha256, filename, decrypted_sha256,
+                                                       decrypted_path, decrypted_bytes, bank, account_no,
+                                                       parsed_rows, parsed_start, parsed_end, created_at,
+                                                       last_access)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, [LOCAL_FILE, os.path.abspath(path), digest, os.path.basename(path), digest, path,
+                  os.path.getsize(path), bank, account_no, rows, start, end, now, now])
+    evict()
+
+
+def _remove_file(path):
+    if path and os.path.exists(path):
+        try:
+            os.remove(path)
+        except OSError as e:
+            logger.warning(f"Could not remove cached file {path}: {e}")
+
+
+def evict(max_bytes: int = None, max_entries: int = None, grace_seconds: float = None) -> int:
+    """
+    Drops least recently used entries until the cache fits its limits, skipping entries used
+    in the last `grace_seconds`. Runs under the write lock, so no lookup hands out a file while
+    it is removed; files another entry still points to are kept.
+    """
+    max_bytes = CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    max_entries = CACHE_MAX_ENTRIES if max_entries is None else max_entries
+    grace_seconds = CACHE_EVICT_GRACE_SECONDS if grace_seconds is None else grace_seconds
+    recent = datetime.now() - timedelta(seconds=grace_seconds)
+    with _pool().write() as con:
+        rows = con.execute("""
+            SELECT message_id, attachment_id, pdf_path, decrypted_path, last_access,
+                   coalesce(pdf_bytes, 0) + coalesce(decrypted_bytes, 0)
+            FROM artifact_cache ORDER BY last_access DESC
+        """).fetchall()
+        total = 0
+        evicted = []
+        for index, (message_id, attachment_id, pdf_path, decrypted_path, last_access, size) in enumerate(rows):
+            total += size
+            if (index >= max_entries or total > max_bytes) and last_access < recent:
+                evicted.append((message_id, attachment_id, pdf_path, decrypted_path))
+        if evicted:
+            con.executemany("DELETE FROM artifact_cache WHERE message_id = ? AND attachment_id = ?",
+                            [(message_id, attachment_id) for message_id, attachment_id, *_ in evicted])
+            kept = {path for row in con.execute("SELECT pdf_path, decrypted_path FROM artifact_cache").fetchall()
+                    for path in row if path}
+            for *_, pdf_path, decrypted_path in evicted:
+                for path in (pdf_path, decrypted_path):
+                    if path not in kept:
+                        _remove_file(path)
+
+    if evicted:
+        metrics.incr("artifact_cache.evicted", len(evicted))
+        logger.info(f"Evicted {len(evicted)} artifact cache entr(ies)")
+    return len(evicted)
+
+
+def stats() -> dict:
+    with _pool().read() as con:
+        entries, size, parsed = con.execute("""
+            SELECT count(*), coalesce(sum(coalesce(pdf_bytes, 0) + coalesce(decrypted_bytes, 0)), 0),
+                   count(parsed_rows)
+            FROM artifact_cache
+        """).fetchone()
+    return {"entries": entries, "bytes": size, "parsed": parsed,
+            "max_bytes": CACHE_MAX_BYTES, "max_entries": CACHE_MAX_ENTRIES}
@@ -0,0 +1,113 @@
+"""
+Load test of concurrent chat requests against the real graph with a local fake LLM.
+
+Every request runs a confirmed query through planning, validate, confirm, coverage,
+response_cache and chatbot. The fake LLM answers after --latency seconds: with time.sleep
+when invoked synchronously and asyncio.sleep when awaited, like a remote model would.
+Compares the old endpoint path, asyncio.to_thread(graph.invoke), with graph.ainvoke.
+
+    python benchmarks/bench_concurrency.py --requests 200 --concurrency 100 --latency 0.5
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.runnables import RunnableLambda
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import duckdb_tools  # noqa: E402
+import graph  # noqa: E402
+from db_pool import close_all, shutdown_executor  # noqa: E402
+from schemas import QueryInfo  # noqa: E402
+
+QUERY = QueryInfo(intent="total spending", bank="ICICI", account_no="XXXXXXXX6193", month="May", year="2025")
+
+
+class SlowLLM(BaseChatModel):
+    latency: float = 0.5
+
+    @property
+    def _llm_type(self) -> str:
+        return "slow-fake"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def with_structured_output(self, schema, **kwargs):
+        return RunnableLambda(lambda messages: QUERY)
+
+    def _result(self):
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="You spent 1234.50 in May 2025."))])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency)
+        return self._result()
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        return self._result()
+
+
+def request_state(i: int) -> dict:
+    return {"messages": [HumanMessage(content=f"yes, proceed ({i})")], "validated_query": QUERY.model_dump()}
+
+
+async def load(run_one, requests: int, concurrency: int) -> list:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i):
+        async with semaphore:
+            start = time.perf_counter()
+            await run_one(request_state(i))
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return sorted(latencies)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--requests", type=int, default=200)
+    ap.add_argument("--concurrency", type=int, default=100)
+    ap.add_argument("--latency", type=float, default=0.5, help="seconds the fake LLM takes per call")
+    args = ap.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="finmate-bench-")
+    duckdb_tools.DB_PATH = os.path.join(workdir, "finance.db")
+    duckdb_tools.init_duckdb(duckdb_tools.DB_PATH)
+    graph.get_llm = lambda model: SlowLLM(latency=args.latency)
+    compiled = graph.build_graph("fake")
+
+    modes = {
+        "to_thread(invoke)": lambda state: asyncio.to_thread(compiled.invoke, state),
+        "ainvoke": compiled.ainvoke,
+    }
+    print(f"requests={args.requests} concurrency={args.concurrency} llm latency={args.latency}s "
+          f"default executor={min(32, (os.cpu_count() or 1) + 4)} threads")
+    print(f"{'mode':20}{'wall s':>10}{'req/s':>10}{'p50 s':>10}{'p95 s':>10}")
+    try:
+        for name, run_one in modes.items():
+            start = time.perf_counter()
+            latencies = asyncio.run(load(run_one, args.requests, args.concurrency))
+            wall = time.perf_counter() - start
+            p50, p95 = latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.95) - 1]
+            print(f"{name:20}{wall:10.2f}{args.requests / wall:10.1f}{p50:10.2f}{p95:10.2f}")
+    finally:
+        shutdown_executor()
+        close_all()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    import logging
+    logging.disable(logging.INFO)
+    main()
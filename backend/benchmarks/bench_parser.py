@@ -0,0 +1,154 @@
+"""
+Benchmark of the ICICI statement line parser on synthetic statement text.
+
+Compares the single-pass compiled parser in icici_parser against the previous
+implementation (one uncompiled re.match per format per line, one dict per row,
+then a strptime loop).
+
+    python benchmarks/bench_parser.py --pages 500
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from icici_parser import parse_icici_pages  # noqa: E402
+
+RECEIVERS = ["ZOMATO", "SWIGGY", "AMAZON", "UBER", "BIGBASKET", "IRCTC", "AIRTEL"]
+
+
+def synthetic_pages(pages: int, rows_per_page: int = 30, seed: int = 7):
+    """Generates ICICI-format statement pages as lists of text lines."""
+    rnd = random.Random(seed)
+    day = datetime(2020, 4, 1)
+    balance = 5000000.00
+    out = []
+    for page in range(pages):
+        lines = ["DATE MODE PARTICULARS DEPOSITS WITHDRAWALS BALANCE"]
+        if page == 0:
+            lines.append(f"{day:%d-%m-%Y} B/F {balance:,.2f}")
+        for _ in range(rows_per_page):
+            day += timedelta(hours=rnd.randint(1, 30))
+            amount = round(rnd.uniform(10, 5000), 2)
+            balance = round(balance + (amount if rnd.random() < 0.5 else -amount), 2)
+            kind = rnd.random()
+            if kind < 0.7:
+                receiver = rnd.choice(RECEIVERS)
+                lines.append(f"UPI/{receiver}/{rnd.randint(100000, 999999)}/")
+                lines.append(f"{day:%d-%m-%Y} Payment {amount:,.2f} {balance:,.2f}")
+                lines.append(f"UPI/{rnd.randint(10**11, 10**12)}")
+            elif kind < 0.8:
+                lines.append(f"{day:%d-%m-%Y}NET BANKING BIL/ONL/{rnd.randint(1000, 9999)} {amount:,.2f} {balance:,.2f}")
+            elif kind < 0.9:
+                lines.append(f"{day:%d-%m-%Y}MOBILE BANKING MMT/IMPS/{rnd.randint(1000, 9999)} {amount:,.2f} {balance:,.2f}")
+            else:
+                lines.append(f"{day:%d-%m-%Y}ICICI DIRECT SIP/{rnd.randint(1000, 9999)} {amount:,.2f} {balance:,.2f}")
+        lines.append("Page total")
+        out.append(lines)
+    return out
+
+
+def legacy_parse_pages(pages, bank, account_no):
+    """The previous parse_icici_statement loop, minus the PDF reading."""
+    transactions = []
+    last_bal = 0
+    for lines in pages:
+        i = 0
+        while i < len(lines):
+            line = lines[i].strip()
+            if line.startswith("DATE MODE PARTICULARS"):
+                i += 1
+                continue
+            bf_match = re.match(r"^(\d{2}-\d{2}-\d{4})\s+B/F\s+([\d,]+\.\d{2})$", line)
+            if bf_match:
+                transactions.append({
+                    "date": bf_match.group(1), "description": "Balance Forward", "amount": 0.0,
+                    "balance": float(bf_match.group(2).replace(',', '')), "mode": "B/F", "type": "BALANCE",
+                    "receiver": "", "bank": bank, "account_no": account_no
+                })
+                last_bal = float(bf_match.group(2).replace(',', ''))
+                i += 1
+                continue
+            upi_txn_match = re.match(r"^(\d{2}-\d{2}-\d{4})\s+(?:(.*?)\s+)?([\d,]+\.\d{2})\s+([\d,]+\.\d{2})$", line)
+            if upi_txn_match:
+                middle_desc = upi_txn_match.group(2).strip() if upi_txn_match.group(2) else ""
+                amount = float(upi_txn_match.group(3).replace(",", ""))
+                balance = float(upi_txn_match.group(4).replace(",", ""))
+                prev_desc = lines[i - 1].strip() if i - 1 >= 0 else ""
+                next_desc = lines[i + 1].strip() if i + 1 < len(lines) else ""
+                full_description = " ".join([prev_desc, middle_desc, next_desc]).strip()
+                parts = full_description.split("/")
+                if len(parts) > 1:
+                    mode, receiver = parts[0].strip(), parts[1].strip()
+                elif "Int.Pd" in full_description or "interest" in full_description.lower():
+                    mode, receiver = "Interest Credit", bank
+                else:
+                    mode, receiver = "Unknown", "Unknown"
+                transactions.append({
+                    "date": upi_txn_match.group(1), "description": full_description, "amount": amount,
+                    "balance": balance, "mode": mode, "type": "DEBIT" if last_bal > balance else "CREDIT",
+                    "receiver": receiver, "bank": bank, "account_no": account_no
+                })
+                last_bal = balance
+                i += 2
+                continue
+            matched = False
+            for label, pattern in (
+                ("NET BANKING", r"^(\d{2}-\d{2}-\d{4})NET BANKING\s+(.*?)\s+([\d,]+\.\d{2})\s+([\d,]+\.\d{2})$"),
+                ("MOBILE BANKING", r"^(\d{2}-\d{2}-\d{4})MOBILE BANKING\s+(.+?)\s+([\d,]+\.\d{2})\s+([\d,]+\.\d{2})$"),
+                ("ICICI DIRECT", r"^(\d{2}-\d{2}-\d{4})ICICI DIRECT\s+(.+?)\s+([\d,]+\.\d{2})\s+([\d,]+\.\d{2})$"),
+            ):
+                m = re.match(pattern, line)
+                if m:
+                    balance = float(m.group(4).replace(",", ""))
+                    transactions.append({
+                        "date": m.group(1), "description": m.group(2).strip(),
+                        "amount": float(m.group(3).replace(",", "")), "balance": balance, "mode": label,
+                        "type": "DEBIT" if last_bal > balance else "CREDIT",
+                        "receiver": "", "bank": bank, "account_no": account_no
+                    })
+                    last_bal = balance
+                    matched = True
+                    break
+            i += 1
+    for row in transactions:
+        row['date'] = datetime.strptime(row['date'], '%d-%m-%Y').date()
+    return transactions
+
+
+def best_of(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--pages", type=int, default=300)
+    ap.add_argument("--rows-per-page", type=int, default=30)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    pages = synthetic_pages(args.pages, args.rows_per_page)
+    legacy_time, legacy = best_of(lambda: legacy_parse_pages(pages, "ICICI", "XXXXXXXX6193"), args.repeat)
+    new_time, frame = best_of(lambda: parse_icici_pages(pages, "ICICI", "XXXXXXXX6193"), args.repeat)
+
+    assert len(legacy) == len(frame), "parsers disagree on row count"
+    print(f"pages={args.pages} rows={len(frame)}")
+    print(f"legacy parser : {legacy_time * 1000:9.1f} ms")
+    print(f"compiled parser: {new_time * 1000:8.1f} ms")
+    print(f"speedup        : {legacy_time / new_time:9.2f}x")
+
+
+if __name__ == "__main__":
+    import logging
+    logging.disable(logging.INFO)
+    main()
@@ -0,0 +1,125 @@
+"""
+Startup benchmark of the backend: what a uvicorn cold start or --reload cycle costs.
+`import main` is measured with `python -X importtime` in fresh interpreters, and the app's
+lifespan startup (graph warm-up, DuckDB pool, session sweeper) is timed after it.
+
+Reports the median totals over --runs, the modules with the largest cumulative import time,
+and fails (exit code 1) when a median is over its budget or when a module that must be
+loaded lazily was imported by the time the app is serving. See "Startup budget" in the README.
+
+    python benchmarks/bench_startup.py --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# Median `import main` time allowed, in milliseconds
+STARTUP_BUDGET_MS = float(os.getenv("FINMATE_STARTUP_BUDGET_MS", "2500"))
+
+# Median lifespan startup allowed, in milliseconds
+LIFESPAN_BUDGET_MS = float(os.getenv("FINMATE_LIFESPAN_BUDGET_MS", "500"))
+
+# Loaded on first use only: model providers in get_llm, the Gmail/PDF/pandas stack in the ingestion tools
+LAZY_MODULES = ["langchain_ollama", "langchain_google_genai", "googleapiclient", "pikepdf", "pdfplumber", "pandas"]
+
+
+def import_times(module: str) -> dict:
+    """{module: (self_us, cumulative_us)} of one `python -X importtime -c 'import <module>'` run."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=BACKEND_DIR, capture_output=True, text=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, cumulative_us, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        if self_us.isdigit():
+            # A module is reported once, when its import finishes; the name is indented by nesting depth
+            times[name] = (int(self_us), int(cumulative_us))
+    return times
+
+
+# Provider package each model prefix imports; warming a model up loads it on purpose
+PROVIDER_MODULES = {"ollama": "langchain_ollama", "gemini": "langchain_google_genai"}
+
+
+def warmed_providers() -> set:
+    models = [m.strip() for m in os.getenv("FINMATE_WARMUP_MODELS", "").split(",") if m.strip()]
+    return {PROVIDER_MODULES.get(m.split(":", 1)[0].lower()) for m in models} - {None}
+
+
+LIFESPAN_CODE = f"""
+import asyncio, json, sys, time
+import main
+
+async def serve():
+    start = time.perf_counter()
+    async with main.lifespan(main.app):
+        startup_ms = (time.perf_counter() - start) * 1000
+    return startup_ms
+
+startup_ms = asyncio.run(serve())
+print(json.dumps({{"startup_ms": startup_ms, "loaded": [m for m in {LAZY_MODULES!r} if m in sys.modules]}}))
+"""
+
+
+def lifespan_run() -> dict:
+    """{startup_ms, loaded} of one fresh interpreter importing main and running the app's lifespan."""
+    # The lifespan opens finance.db and sessions.db in the working directory
+    with tempfile.TemporaryDirectory(prefix="finmate-startup-") as workdir:
+        result = subprocess.run([sys.executable, "-c", LIFESPAN_CODE], cwd=workdir,
+                                env={**os.environ, "PYTHONPATH": BACKEND_DIR},
+                                capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--module", default="main")
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--top", type=int, default=15)
+    ap.add_argument("--budget-ms", type=float, default=STARTUP_BUDGET_MS)
+    ap.add_argument("--lifespan-budget-ms", type=float, default=LIFESPAN_BUDGET_MS)
+    args = ap.parse_args()
+
+    runs = [import_times(args.module) for _ in range(args.runs)]
+    totals = [run[args.module][1] / 1000 for run in runs]
+    median = statistics.median(totals)
+    fastest = runs[totals.index(min(totals))]
+
+    print(f"import {args.module}: median {median:.0f} ms, min {min(totals):.0f} ms, max {max(totals):.0f} ms "
+          f"over {args.runs} runs (budget {args.budget_ms:.0f} ms)")
+    print(f"\n{'cumulative ms':>14}{'self ms':>10}  module")
+    top = sorted(fastest.items(), key=lambda item: item[1][1], reverse=True)[:args.top]
+    for name, (self_us, cumulative_us) in top:
+        print(f"{cumulative_us / 1000:14.1f}{self_us / 1000:10.1f}  {name.strip()}")
+
+    lifespans = [lifespan_run() for _ in range(args.runs)]
+    lifespan_median = statistics.median(run["startup_ms"] for run in lifespans)
+    print(f"\nlifespan startup: median {lifespan_median:.0f} ms over {args.runs} runs "
+          f"(budget {args.lifespan_budget_ms:.0f} ms, FINMATE_WARMUP_MODELS="
+          f"{os.getenv('FINMATE_WARMUP_MODELS', '')!r})")
+
+    eager = sorted({name for name in LAZY_MODULES if name in fastest}
+                   | {name for run in lifespans for name in run["loaded"]} - warmed_providers())
+    failed = False
+    if eager:
+        print(f"\nFAIL: imported at startup but should load lazily: {', '.join(eager)}")
+        failed = True
+    if median > args.budget_ms:
+        print(f"\nFAIL: median {median:.0f} ms is over the {args.budget_ms:.0f} ms budget")
+        failed = True
+    if lifespan_median > args.lifespan_budget_ms:
+        print(f"\nFAIL: lifespan startup median {lifespan_median:.0f} ms is over the "
+              f"{args.lifespan_budget_ms:.0f} ms budget")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Benchmark of the transactions storage layout on a synthetic multi-account dataset.
+
+Builds the original flat table with rows in arrival order (one statement, i.e. one
+account and month, at a time, in no particular order), copies it, migrates the copy to the clustered layout (migrations.py) and optionally
+exports the older years to Parquet. Then times typical per-account queries on each.
+
+    python benchmarks/bench_storage.py --rows 3000000
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import duckdb
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import duckdb_tools  # noqa: E402
+from db_pool import close_all  # noqa: E402
+
+QUERIES = {
+    "account month total": """
+        SELECT sum(amount) FROM transactions
+        WHERE account_no = 'XXXXXXXX0007' AND type = 'DEBIT' AND date BETWEEN DATE '2023-05-01' AND DATE '2023-05-31'
+    """,
+    "account year by receiver": """
+        SELECT receiver, sum(amount) FROM transactions
+        WHERE account_no = 'XXXXXXXX0007' AND date BETWEEN DATE '2022-01-01' AND DATE '2022-12-31'
+        GROUP BY receiver
+    """,
+    "latest balance": """
+        SELECT balance FROM transactions WHERE account_no = 'XXXXXXXX0031' AND date >= DATE '2024-12-01'
+        ORDER BY date DESC LIMIT 1
+    """,
+}
+
+
+def build_legacy(path: str, rows: int, accounts: int):
+    """The original flat table, filled statement by statement in no particular order."""
+    con = duckdb.connect(path)
+    con.execute("""
+        CREATE TABLE transactions (date DATE, description VARCHAR, amount DOUBLE, balance DOUBLE,
+                                   mode VARCHAR, type VARCHAR, receiver VARCHAR, bank VARCHAR,
+                                   account_no VARCHAR, txn_key VARCHAR)
+    """)
+    con.execute(f"""
+        INSERT INTO transactions
+        SELECT DATE '2020-01-01' + CAST(i * 1826 // {rows} AS INTEGER) AS date,
+               'UPI/' || receiver || '/' || i AS description,
+               round(10 + random() * 5000, 2) AS amount,
+               round(random() * 100000, 2) AS balance,
+               ['UPI', 'NET BANKING', 'MOBILE BANKING', 'ICICI DIRECT'][1 + i % 4] AS mode,
+               CASE WHEN random() < 0.8 THEN 'DEBIT' ELSE 'CREDIT' END AS type,
+               receiver, 'ICICI' AS bank,
+               'XXXXXXXX' || lpad(CAST(hash(i) % {accounts} AS VARCHAR), 4, '0') AS account_no,
+               NULL AS txn_key
+        FROM (SELECT i, ['ZOMATO', 'SWIGGY', 'AMAZON', 'UBER', 'IRCTC', 'AIRTEL'][1 + CAST(hash(i * 7) % 6 AS BIGINT)] AS receiver
+              FROM range({rows}) t(i))
+        ORDER BY hash(account_no, date_trunc('month', date)), date
+    """)
+    con.close()
+
+
+def best_of(con, sql: str, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        con.execute(sql).fetchall()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--rows", type=int, default=3_000_000)
+    ap.add_argument("--accounts", type=int, default=50)
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--cold-before", type=int, default=2024, help="export years before this one to Parquet")
+    args = ap.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="finmate-bench-")
+    try:
+        legacy_path = os.path.join(workdir, "legacy.db")
+        clustered_path = os.path.join(workdir, "clustered.db")
+        start = time.perf_counter()
+        build_legacy(legacy_path, args.rows, args.accounts)
+        shutil.copy(legacy_path, clustered_path)
+        print(f"rows={args.rows} accounts={args.accounts} (generated in {time.perf_counter() - start:.1f}s)")
+
+        start = time.perf_counter()
+        duckdb_tools.init_duckdb(clustered_path)
+        print(f"migration: {time.perf_counter() - start:.1f}s")
+
+        tiered_path = os.path.join(workdir, "tiered.db")
+        close_all()
+        shutil.copy(clustered_path, tiered_path)
+        duckdb_tools.export_cold_years(args.cold_before, tiered_path, os.path.join(workdir, "cold"))
+        close_all()
+
+        layouts = {"flat": legacy_path, "clustered": clustered_path, "hot+parquet": tiered_path}
+        connections = {name: duckdb.connect(path, read_only=True) for name, path in layouts.items()}
+        print(f"{'query':26}" + "".join(f"{name:>14}" for name in layouts))
+        for label, sql in QUERIES.items():
+            times = [best_of(con, sql, args.repeat) for con in connections.values()]
+            print(f"{label:26}" + "".join(f"{t * 1000:11.1f} ms" for t in times))
+        for con in connections.values():
+            con.close()
+    finally:
+        close_all()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    import logging
+    logging.disable(logging.INFO)
+    main()
@@ -0,0 +1,215 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import logging
+
+import duckdb
+
+import metrics
+import tracing
+
+logger = logging.getLogger(__name__)
+
+# Threads of the executor async code runs DuckDB work on, which also bounds the number of
+# read cursors the async path holds open at once.
+DB_WORKERS = int(os.getenv("FINMATE_DUCKDB_WORKERS", "4"))
+
+
+class DuckDBPool:
+    """
+    Shared DuckDB connection manager for one database file.
+    A single connection owns the database; each read opens a short-lived cursor derived from
+    it, and writes are serialized through a lock on a dedicated write cursor. This avoids opening
+    the file on every tool call and the lock contention between read-only and read-write opens.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._con = None
+        self._write_cursor = None
+        self._open_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._read_cursors = set()
+        self._stats = {
+            "connections_opened": 0,
+            "read_cursors_opened": 0,
+            "reads": 0,
+            "writes": 0,
+            "write_wait_total_ms": 0.0,
+            "write_wait_max_ms": 0.0,
+        }
+
+    def _connection(self):
+        with self._open_lock:
+            if self._con is None:
+                self._con = duckdb.connect(self.db_path)
+                self._write_cursor = self._con.cursor()
+                self._stats["connections_opened"] += 1
+                logger.info(f"Opened DuckDB connection to {self.db_path}")
+            return self._con
+
+    def open(self):
+        """Opens the underlying connection ahead of the first query."""
+        self._connection()
+
+    def _open_cursor(self):
+        con = self._connection()
+        cur = con.cursor()
+        with self._open_lock:
+            self._read_cursors.add(cur)
+            self._stats["read_cursors_opened"] += 1
+        return cur
+
+    def _close_cursor(self, cur):
+        with self._open_lock:
+            self._read_cursors.discard(cur)
+        try:
+            cur.close()
+        except duckdb.Error:
+            pass
+
+    @contextmanager
+    def read(self):
+        """
+        Yields a fresh read cursor inside a transaction that is always rolled back, and closes
+        it afterwards, so threads that come and go (a per-call executor) leave no cursor behind.
+        The cursor belongs to the read-write connection, so this is not read_only=True: a
+        statement can end the transaction itself. Callers running untrusted SQL check it
+        first (duckdb_tools.check_read_only).
+        """
+        cur = self._open_cursor()
+        start = time.perf_counter()
+        try:
+            cur.execute("BEGIN TRANSACTION")
+            yield cur
+        finally:
+            try:
+                cur.execute("ROLLBACK")
+            except duckdb.Error:
+                # The statement may already have ended the transaction
+                pass
+            self._close_cursor(cur)
+            with self._open_lock:
+                self._stats["reads"] += 1
+            metrics.observe("duckdb.read", time.perf_counter() - start)
+
+    @contextmanager
+    def write(self, transaction: bool = True):
+        """Yields the shared write cursor; only one writer runs at a time."""
+        self._connection()
+        wait_start = time.perf_counter()
+        with self._write_lock:
+            waited = time.perf_counter() - wait_start
+            metrics.observe("duckdb.write_wait", waited)
+            with self._open_lock:
+                self._stats["writes"] += 1
+                self._stats["write_wait_total_ms"] += waited * 1000
+                self._stats["write_wait_max_ms"] = max(self._stats["write_wait_max_ms"], waited * 1000)
+
+            cur = self._write_cursor
+            if transaction:
+                cur.execute("BEGIN TRANSACTION")
+            try:
+                yield cur
+                if transaction:
+                    cur.execute("COMMIT")
+            except Exception:
+                if transaction:
+                    cur.execute("ROLLBACK")
+                raise
+
+    def stats(self) -> dict:
+        with self._open_lock:
+            stats = dict(self._stats)
+            stats["open"] = self._con is not None
+            stats["active_connections"] = (1 + len(self._read_cursors)) if self._con is not None else 0
+        stats["db_path"] = self.db_path
+        return stats
+
+    def close(self):
+        """Closes every cursor and the underlying connection. The pool reopens lazily if used again."""
+        with self._write_lock, self._open_lock:
+            for cur in self._read_cursors:
+                try:
+                    cur.close()
+                except duckdb.Error:
+                    pass
+            self._read_cursors = set()
+            if self._con is not None:
+                self._write_cursor.close()
+                self._con.close()
+                logger.info(f"Closed DuckDB connection to {self.db_path}")
+            self._con = None
+            self._write_cursor = None
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_path: str) -> DuckDBPool:
+    """Returns the process-wide pool for `db_path`."""
+    key = os.path.abspath(db_path)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = DuckDBPool(db_path)
+        return pool
+
+
+def pool_stats() -> list:
+    with _pools_lock:
+        pools = list(_pools.values())
+    return [pool.stats() for pool in pools]
+
+
+def close_all():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def db_executor() -> ThreadPoolExecutor:
+    """The process-wide executor for DuckDB work started from async code."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=DB_WORKERS, thread_name_prefix="duckdb")
+        return _executor
+
+
+async def run_db(fn, *args, **kwargs):
+    """
+    Awaits fn(*args, **kwargs) on the DuckDB executor, so blocking queries neither stall the
+    event loop nor take threads from the default executor the rest of the app shares.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(db_executor(), tracing.in_context(lambda: fn(*args, **kwargs)))
+
+
+def with_db_executor(db_tool):
+    """Gives a DuckDB tool an async variant that runs it with run_db (used by the tools node under ainvoke)."""
+    func = db_tool.func
+
+    async def coroutine(*args, **kwargs):
+        return await run_db(func, *args, **kwargs)
+
+    db_tool.coroutine = coroutine
+    return db_tool
+
+
+def shutdown_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+        _executor = None
@@ -1,17 +1,150 @@
+import asyncio
 import duckdb
-import pandas as pd
+import pyarrow as pa
 from langchain.tools import tool
 import os
+import json
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from decimal import Decimal
 #from logger import setup_logger
 import logging
+from db_pool import get_pool, run_db, with_db_executor
+import metrics
+import migrations
+import tracing
+from migrations import HOT_TABLE
 
 # logger = setup_logger()
 logger = logging.getLogger(__name__)
 
 DB_PATH = "finance.db"
 
-def init_duckdb():
-    con = duckdb.connect(DB_PATH)
+TRANSACTION_COLUMNS = ["date", "description", "amount", "balance", "mode", "type", "receiver", "bank", "account_no"]
+
+# Columns that identify a transaction for deduplication. bank and account_no keep
+# identical entries from two different accounts apart; the running balance keeps two real,
+# identical payments on the same day apart. Override with FINMATE_DEDUP_KEY.
+DEDUP_KEY_COLUMNS = [
+    c.strip() for c in os.getenv("FINMATE_DEDUP_KEY", "date,amount,description,balance,bank,account_no").split(",")
+    if c.strip()
+]
+
+# Monthly totals of a transactions-shaped relation, grouped by the rollup key. Unknown
+# values are stored as '' because primary key columns cannot be NULL.
+ROLLUP_SELECT_SQL = """
+    SELECT coalesce(bank, '') AS bank, coalesce(account_no, '') AS account_no,
+           CAST(date_trunc('month', date) AS DATE) AS month,
+           coalesce(CAST(type AS VARCHAR), '') AS type, coalesce(mode, '') AS mode,
+           coalesce(receiver, '') AS receiver,
+           count(*) AS txn_count, coalesce(sum(amount), 0) AS total_amount
+    FROM {source}
+    WHERE date IS NOT NULL
+    GROUP BY ALL
+"""
+
+# Rows returned to the LLM by a query tool; larger results are cut with a notice and a summary
+QUERY_ROW_LIMIT = int(os.getenv("FINMATE_QUERY_ROW_LIMIT", "50"))
+ARROW_BATCH_ROWS = 1024
+
+# Agent queries are interrupted after this many seconds...
+QUERY_TIMEOUT_SECONDS = float(os.getenv("FINMATE_QUERY_TIMEOUT_SECONDS", "10"))
+# ...and rejected up front when any step of their plan is estimated to produce more rows
+MAX_ESTIMATED_ROWS = int(os.getenv("FINMATE_QUERY_MAX_ESTIMATED_ROWS", "10000000"))
+
+# How often the server checks monthly_rollup against the raw transactions
+ROLLUP_CHECK_SECONDS = int(os.getenv("FINMATE_ROLLUP_CHECK_SECONDS", "3600"))
+
+# Where export_cold_years writes the account_no=/year= Parquet partitions
+COLD_STORAGE_DIR = os.getenv("FINMATE_COLD_STORAGE_DIR", "cold_storage")
+
+_initialized = set()
+
+
+def txn_key_sql(key_columns=None) -> str:
+    """SQL expression hashing the dedup key columns of a row into the txn_key value."""
+    key_columns = key_columns or DEDUP_KEY_COLUMNS
+    unknown = [c for c in key_columns if c not in TRANSACTION_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown dedup key columns: {unknown}")
+    parts = ", ".join(f"coalesce(CAST({c} AS VARCHAR), '')" for c in key_columns)
+    return f"md5(concat_ws('|', {parts}))"
+
+
+def init_duckdb(db_path: str = DB_PATH, key_columns=None):
+    """
+    Creates the tables, applies pending schema migrations and builds the unique txn_key
+    index used for deduplication. Transactions are written to the clustered
+    transactions_hot table and read through the `transactions` view (see migrations).
+    txn_key is recomputed (dropping duplicates) whenever the configured dedup key changes,
+    in one transaction with the rollup rebuild; the number of dropped rows is logged.
+    """
+    key_columns = key_columns or DEDUP_KEY_COLUMNS
+    dedup_key = ",".join(key_columns)
+    with get_pool(db_path).write(transaction=False) as con:
+        con.execute("CREATE TABLE IF NOT EXISTS finmate_meta (key VARCHAR PRIMARY KEY, value VARCHAR)")
+        if migrations.schema_version(con) == 0:
+            _create_legacy_table(con)
+        con.execute("""
+        CREATE TABLE IF NOT EXISTS ingest_coverage (
+                    bank VARCHAR,
+                    account_no VARCHAR,
+                    start_date DATE,
+                    end_date DATE,
+                    PRIMARY KEY (bank, account_no, start_date, end_date)
+                )
+            """)
+        con.execute("""
+        CREATE TABLE IF NOT EXISTS account_versions (
+                    bank VARCHAR,
+                    account_no VARCHAR,
+                    version BIGINT,
+                    PRIMARY KEY (bank, account_no)
+                )
+            """)
+        con.execute("""
+        CREATE TABLE IF NOT EXISTS monthly_rollup (
+                    bank VARCHAR,
+                    account_no VARCHAR,
+                    month DATE,
+                    type VARCHAR,
+                    mode VARCHAR,
+                    receiver VARCHAR,
+                    txn_count BIGINT,
+                    total_amount DOUBLE,
+                    PRIMARY KEY (bank, account_no, month, type, mode, receiver)
+                )
+            """)
+        migrations.migrate(con)
+
+        stored = con.execute("SELECT value FROM finmate_meta WHERE key = 'dedup_key'").fetchone()
+        rekeyed = not stored or stored[0] != dedup_key
+        if rekeyed:
+            logger.info(f"Rebuilding txn_key for dedup key: {dedup_key}")
+            if migrations.cold_storage_dir(con):
+                logger.warning("Transactions exported to Parquet keep their old txn_key")
+            with migrations.transaction(con):
+                # Keeps the first copy of rows that collide on the new key
+                dropped = migrations.recluster(con, txn_key_sql(key_columns))
+                con.execute(
+                    "INSERT OR REPLACE INTO finmate_meta VALUES ('dedup_key', ?)", [dedup_key]
+                )
+                _rebuild_rollup(con)
+            if dropped:
+                logger.warning(f"Dedup key {dedup_key} dropped {dropped} transaction(s) that collide on it")
+                metrics.incr("duckdb.rekey_dropped", dropped)
+        con.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS transactions_txn_key_idx ON {HOT_TABLE} (txn_key)")
+        # Databases created before the rollup existed get it built
+        has_rollup = con.execute("SELECT 1 FROM finmate_meta WHERE key = 'monthly_rollup'").fetchone()
+        if not has_rollup:
+            _rebuild_rollup(con)
+    _initialized.add(os.path.abspath(db_path))
+
+
+def _create_legacy_table(con):
+    # The original flat table; migrations move it to the current layout
     con.execute("""
         CREATE TABLE IF NOT EXISTS transactions (
                     date DATE,
@@ -20,55 +153,446 @@ def init_duckdb():
                     balance DOUBLE,
                     mode VARCHAR,
                     type VARCHAR,
-                    receiver VARCHAR
+                    receiver VARCHAR,
+                    bank VARCHAR,
+                    account_no VARCHAR,
+                    txn_key VARCHAR
                 )
             """)
-    con.close()
+    for col in ("bank", "account_no", "txn_key"):
+        con.execute(f"ALTER TABLE transactions ADD COLUMN IF NOT EXISTS {col} VARCHAR")
+
+
+def _rebuild_rollup(con):
+    logger.info("Rebuilding monthly_rollup from transactions")
+    con.execute("DELETE FROM monthly_rollup")
+    con.execute("INSERT INTO monthly_rollup " + ROLLUP_SELECT_SQL.format(source="transactions"))
+    con.execute("INSERT OR REPLACE INTO finmate_meta VALUES ('monthly_rollup', '1')")
+
 
+def rebuild_monthly_rollup(db_path: str = DB_PATH):
+    """Recomputes monthly_rollup from the raw transactions table."""
+    if os.path.abspath(db_path) not in _initialized:
+        init_duckdb(db_path)
+    with get_pool(db_path).write() as con:
+        _rebuild_rollup(con)
 
-def store_transactions_to_duckdb(transactions: list, db_path: str = DB_PATH) -> str:
+
+def recluster_transactions(db_path: str = DB_PATH):
+    """Rewrites transactions_hot in clustered order so zone maps prune well again."""
+    if os.path.abspath(db_path) not in _initialized:
+        init_duckdb(db_path)
+    # One transaction, so a crash between dropping and renaming the table loses nothing
+    with get_pool(db_path).write() as con:
+        migrations.recluster(con)
+
+
+def export_cold_years(before_year: int, db_path: str = DB_PATH, directory: str = None) -> list:
+    """
+    Moves transactions dated before `before_year` to Parquet partitioned by account_no and
+    year under `directory` (FINMATE_COLD_STORAGE_DIR by default). The `transactions` view
+    reads both, so queries do not change. Returns (account_no, year, rows) per partition.
+    """
+    if os.path.abspath(db_path) not in _initialized:
+        init_duckdb(db_path)
+    # export_cold runs its own transaction around the file moves
+    with get_pool(db_path).write(transaction=False) as con:
+        moved = migrations.export_cold(con, before_year, directory or COLD_STORAGE_DIR)
+    logger.info(f"Exported {sum(rows for *_, rows in moved)} transactions before {before_year} to Parquet")
+    return moved
+
+
+def check_monthly_rollup(db_path: str = DB_PATH, tolerance: float = 0.01) -> list:
+    """
+    Compares monthly_rollup with the same aggregation over the raw transactions table.
+    Returns the rollup keys whose count or total differ (an empty list when consistent).
+    """
+    with get_pool(db_path).read() as con:
+        return con.execute(f"""
+            WITH expected AS ({ROLLUP_SELECT_SQL.format(source="transactions")})
+            SELECT coalesce(e.bank, r.bank) AS bank, coalesce(e.account_no, r.account_no) AS account_no,
+                   coalesce(e.month, r.month) AS month, coalesce(e.type, r.type) AS type,
+                   coalesce(e.mode, r.mode) AS mode, coalesce(e.receiver, r.receiver) AS receiver,
+                   e.txn_count AS expected_count, r.txn_count AS rollup_count,
+                   e.total_amount AS expected_amount, r.total_amount AS rollup_amount
+            FROM expected e
+            FULL OUTER JOIN monthly_rollup r USING (bank, account_no, month, type, mode, receiver)
+            WHERE e.txn_count IS DISTINCT FROM r.txn_count
+               OR abs(coalesce(e.total_amount, 0) - coalesce(r.total_amount, 0)) > ?
+        """, [tolerance]).fetchall()
+
+
+def verify_monthly_rollup(db_path: str = DB_PATH) -> int:
+    """Runs check_monthly_rollup and rebuilds the rollup when it drifted. Returns the number of keys that differed."""
+    if os.path.abspath(db_path) not in _initialized:
+        init_duckdb(db_path)
+    mismatches = check_monthly_rollup(db_path)
+    if mismatches:
+        logger.warning(f"monthly_rollup differs from transactions on {len(mismatches)} key(s), "
+                       f"e.g. {mismatches[0]}; rebuilding it")
+        metrics.incr("monthly_rollup.drift", len(mismatches))
+        rebuild_monthly_rollup(db_path)
+    metrics.incr("monthly_rollup.checks")
+    return len(mismatches)
+
+
+async def watch_monthly_rollup(interval: float = ROLLUP_CHECK_SECONDS, db_path: str = None):
+    """Verifies monthly_rollup right away and then every `interval` seconds until cancelled."""
+    while True:
+        try:
+            await run_db(verify_monthly_rollup, db_path or DB_PATH)
+        except Exception as e:
+            logger.warning(f"monthly_rollup check failed: {e}")
+        await asyncio.sleep(interval)
+
+
+def batch_coverage(df) -> list:
+    """(bank, account_no, first date, last date) of every account in a DataFrame of transactions."""
+    spans = df.dropna(subset=["bank", "account_no", "date"]).groupby(["bank", "account_no"])["date"].agg(["min", "max"])
+    return [(bank, account_no, row["min"].date(), row["max"].date()) for (bank, account_no), row in spans.iterrows()]
+
+
+@tracing.traced("duckdb.store")
+def store_transactions_to_duckdb(transactions: list, db_path: str = DB_PATH, coverage: list = None) -> str:
     """
     Stores parsed transaction data into DuckDB, avoiding duplicate inserts.
-    A duplicate is considered as a record with the same date, amount, and description.
+    A duplicate is a record with the same DEDUP_KEY_COLUMNS (by default date, amount,
+    description, balance, bank and account_no). Deduplication runs inside DuckDB against the
+    unique txn_key index, so only the new batch is scanned.
+
+    The ingested (bank, account_no, start, end) spans are recorded in ingest_coverage in the
+    same transaction. Pass `coverage` when the statement periods are known; otherwise the
+    first and last transaction date of every account in the batch are used.
+    Accounts that got new rows have their data_version bumped, and the new rows are added
+    to monthly_rollup.
     """
     logger.info(f"Entering store_transactions_to_duckdb() with {len(transactions)} transactions and {db_path} database ")
-    if not transactions:
+    if not len(transactions):
         return "No transactions to insert"
-    
+
+    # pandas is only needed on the ingestion path; importing it lazily keeps it out of startup
+    import pandas as pd
     df = pd.DataFrame(transactions)
     if df.empty:
         return "Parsed transaction Dataframe is empty"
     
     df["date"] = pd.to_datetime(df["date"])
-    
-    con = duckdb.connect(db_path)
-    #init_duckdb()
 
-    expected_cols = ["date", "description", "amount", "balance", "mode", "type", "receiver", "bank", "account_no"]
-    for col in expected_cols:
+    if os.path.abspath(db_path) not in _initialized:
+        init_duckdb(db_path)
+
+    for col in TRANSACTION_COLUMNS:
         if col not in df.columns:
             df[col] = None
-
-    #Avoid inserting duplicates (based on date, amount, description)
-    existing = con.execute("SELECT date, amount, description FROM transactions").fetchdf()
+    df = df[TRANSACTION_COLUMNS].assign(row_no=range(len(df)))
     before = len(df)
-    if not existing.empty:
-        df = df.merge(existing, how="left", indicator=True, on=["date", "amount", "description"])
-        df = df[df["_merge"] == "left_only"]
-        df = df.drop(columns=["_merge"])
-
-    inserted_count = len(df)
-    if inserted_count > 0:
-        con.register("new_txns", df)
-        con.execute("INSERT INTO transactions SELECT * FROM new_txns")
-    
-    con.close()
 
+    with get_pool(db_path).write() as con:
+        # seq keeps the statement order; reserve one contiguous block for the batch
+        first_seq = con.execute("SELECT min(v) FROM (SELECT nextval('txn_seq') AS v FROM range(?))", [before]).fetchone()[0]
+        # Keys already exported to Parquet are duplicates too; only the batch's partitions are read
+        partitions = df[["account_no"]].assign(year=df["date"].dt.year).dropna().drop_duplicates()
+        not_cold = migrations.cold_key_filter(con, list(partitions.itertuples(index=False, name=None)))
+        not_cold = f"WHERE {not_cold}" if not_cold else ""
+        con.register("staged_txns", df)
+        try:
+            inserted = con.execute(f"""
+                INSERT INTO {HOT_TABLE} ({", ".join(TRANSACTION_COLUMNS)}, txn_key, seq)
+                SELECT {", ".join(TRANSACTION_COLUMNS)}, txn_key, seq FROM (
+                    SELECT *, {txn_key_sql()} AS txn_key FROM (
+                        SELECT CAST(date AS DATE) AS date, CAST(description AS VARCHAR) AS description,
+                               CAST(amount AS DOUBLE) AS amount, CAST(balance AS DOUBLE) AS balance,
+                               CAST(mode AS VARCHAR) AS mode, CAST(upper(CAST(type AS VARCHAR)) AS txn_type) AS type,
+                               CAST(receiver AS VARCHAR) AS receiver, CAST(bank AS VARCHAR) AS bank,
+                               CAST(account_no AS VARCHAR) AS account_no, ? + row_no AS seq
+                        FROM staged_txns
+                    )
+                ) {not_cold}
+                -- Sorted batches keep the table clustered
+                ORDER BY {migrations.CLUSTER_ORDER}
+                ON CONFLICT (txn_key) DO NOTHING
+                RETURNING *
+            """, [first_seq]).fetchdf()
+        finally:
+            con.unregister("staged_txns")
+        if not inserted.empty:
+            con.register("new_txns", inserted)
+            try:
+                con.execute(f"""
+                    INSERT INTO monthly_rollup {ROLLUP_SELECT_SQL.format(source="new_txns")}
+                    ON CONFLICT DO UPDATE SET txn_count = txn_count + excluded.txn_count,
+                                              total_amount = total_amount + excluded.total_amount
+                """)
+            finally:
+                con.unregister("new_txns")
+        accounts = inserted.dropna(subset=["bank", "account_no"])[["bank", "account_no"]].drop_duplicates()
+        changed = sorted(tuple(row) for row in accounts.itertuples(index=False))
+        if changed:
+            con.executemany("""
+                INSERT INTO account_versions VALUES (?, ?, 1)
+                ON CONFLICT (bank, account_no) DO UPDATE SET version = version + 1
+            """, changed)
+        spans = batch_coverage(df) if coverage is None else coverage
+        if spans:
+            con.executemany("INSERT INTO ingest_coverage VALUES (?, ?, ?, ?) ON CONFLICT DO NOTHING", spans)
+
+    inserted_count = len(inserted)
     return f"Inserted {inserted_count} new transactions out of {before} into DuckDB database. Check the database now."
 
 
+def data_version(bank: str, account_no: str, db_path: str = DB_PATH) -> int:
+    """Counter bumped every time new transactions are stored for the account (0 if none yet)."""
+    try:
+        with get_pool(db_path).read() as con:
+            row = con.execute("""
+                SELECT max(version) FROM account_versions WHERE upper(bank) = upper(?) AND account_no = ?
+            """, [bank, account_no]).fetchone()
+    except duckdb.CatalogException:
+        return 0
+    return row[0] or 0
+
+
+def covered_ranges(bank: str, account_no: str, db_path: str = DB_PATH) -> list:
+    """Merged (start, end) date spans already ingested for the account, in date order."""
+    try:
+        with get_pool(db_path).read() as con:
+            spans = con.execute("""
+                SELECT start_date, end_date FROM ingest_coverage
+                WHERE upper(bank) = upper(?) AND account_no = ?
+                ORDER BY start_date, end_date
+            """, [bank, account_no]).fetchall()
+    except duckdb.CatalogException:
+        return []
+
+    merged = []
+    for start, end in spans:
+        # Back-to-back statements (30-04 then 01-05) join into one span
+        if merged and start <= merged[-1][1] + timedelta(days=1):
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def is_range_covered(bank: str, account_no: str, start: date, end: date, db_path: str = DB_PATH) -> bool:
+    """True when every day from start to end falls inside an ingested span of the account."""
+    return any(s <= start and end <= e for s, e in covered_ranges(bank, account_no, db_path))
+
+
+class QueryLimitError(Exception):
+    """
+    A query stopped by the read-only check ("not_read_only"), the cost guard ("too_expensive")
+    or the time budget ("timeout").
+    """
+
+    def __init__(self, kind: str, message: str, hint: str, **details):
+        super().__init__(message)
+        self.kind = kind
+        self.hint = hint
+        self.details = details
+
+    def to_json(self) -> str:
+        return json.dumps({"error": self.kind, "message": str(self), "hint": self.hint, **self.details})
+
+
+def check_read_only(sql: str):
+    """
+    Raises QueryLimitError unless `sql` is exactly one SELECT. The read cursor shares the
+    read-write connection, so a second statement such as `COMMIT; DELETE ...` would otherwise
+    end the rolled-back transaction it runs in and persist its changes.
+    """
+    statements = duckdb.extract_statements(sql)
+    if len(statements) != 1 or statements[0].type != duckdb.StatementType.SELECT:
+        metrics.incr("query_guard.not_read_only")
+        raise QueryLimitError(
+            "not_read_only", "Query rejected: only a single SELECT statement can be run",
+            "Send one SELECT (or WITH ... SELECT) statement without transaction control or writes.",
+            statements=[statement.type.name for statement in statements],
+        )
+
+
+def estimated_rows(con, sql: str, params=None):
+    """Largest 'Estimated Cardinality' in the EXPLAIN plan of `sql`, or None when it cannot be explained."""
+    try:
+        plan = con.execute(f"EXPLAIN (FORMAT json) {sql}", params or []).fetchall()
+    except duckdb.Error:
+        return None
+    estimates = []
+
+    def walk(node):
+        children = [walk(child) for child in node.get("children", [])]
+        known = [c for c in children if c is not None]
+        value = str(node.get("extra_info", {}).get("Estimated Cardinality", "")).strip()
+        if value.isdigit():
+            estimate = int(value)
+        elif node.get("name") == "CROSS_PRODUCT" and known:
+            # DuckDB leaves cross products unestimated; their output is the product of the inputs
+            estimate = 1
+            for c in known:
+                estimate *= c
+        else:
+            estimate = max(known, default=None)
+        if estimate is not None:
+            estimates.append(estimate)
+        return estimate
+
+    for _, text in plan:
+        for node in json.loads(text):
+            walk(node)
+    return max(estimates, default=None)
+
+
+def check_query_cost(con, sql: str, params=None, max_rows: int = None):
+    """Raises QueryLimitError when the planner expects any step of `sql` to produce over `max_rows` rows."""
+    max_rows = MAX_ESTIMATED_ROWS if max_rows is None else max_rows
+    estimate = estimated_rows(con, sql, params)
+    if estimate is not None and estimate > max_rows:
+        metrics.incr("query_guard.rejected")
+        raise QueryLimitError(
+            "too_expensive", f"Query rejected: the plan is estimated to produce {estimate} rows",
+            "Add filters on bank, account_no and date, avoid cross joins, or aggregate with GROUP BY.",
+            estimated_rows=estimate, max_estimated_rows=max_rows,
+        )
+
+
+@contextmanager
+def time_budget(con, seconds: float = None):
+    """Interrupts the query running on `con` once `seconds` have passed and raises QueryLimitError."""
+    seconds = QUERY_TIMEOUT_SECONDS if seconds is None else seconds
+    fired = threading.Event()
+
+    def interrupt():
+        fired.set()
+        con.interrupt()
+
+    timer = threading.Timer(seconds, interrupt)
+    timer.daemon = True
+    start = time.perf_counter()
+    timer.start()
+    try:
+        yield
+    except duckdb.InterruptException:
+        if not fired.is_set():
+            raise
+        metrics.incr("query_guard.timeout")
+        raise QueryLimitError(
+            "timeout", f"Query cancelled after {time.perf_counter() - start:.1f}s (limit {seconds}s)",
+            "Narrow the date range or filters, or aggregate instead of listing rows.",
+            timeout_seconds=seconds,
+        ) from None
+    finally:
+        timer.cancel()
+
+
+def _cell(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, (float, Decimal)):
+        return f"{value:.2f}".rstrip("0").rstrip(".")
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return str(value).replace("|", "/").replace("\n", " ")
+
+
+def encode_table(table: pa.Table) -> str:
+    """Compact text for the LLM: a `|`-separated header line, then one line per row."""
+    columns = [table.column(name).to_pylist() for name in table.column_names]
+    lines = ["|".join(table.column_names)]
+    lines += ["|".join(_cell(v) for v in row) for row in zip(*columns)]
+    return "\n".join(lines)
+
+
+def fetch_limited(con, sql: str, params=None, limit: int = QUERY_ROW_LIMIT):
+    """
+    Runs `sql` and reads its Arrow record batches until `limit` rows are in hand.
+    Returns (first `limit` rows as a pyarrow Table, whether more rows were left unread).
+    """
+    reader = con.execute(sql, params or []).to_arrow_reader(ARROW_BATCH_ROWS)
+    batches, rows = [], 0
+    try:
+        for batch in reader:
+            batches.append(batch)
+            rows += batch.num_rows
+            if rows > limit:
+                break
+    finally:
+        reader.close()
+    table = pa.Table.from_batches(batches, schema=reader.schema)
+    return table.slice(0, limit), rows > limit
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def summarize(con, sql: str, schema: pa.Schema, params=None) -> pa.Table:
+    """Row count plus count, sum, min and max of every column of the full result of `sql`."""
+    parts = ["count(*)"]
+    for field in schema:
+        col = _quote(field.name)
+        numeric = pa.types.is_integer(field.type) or pa.types.is_floating(field.type) or pa.types.is_decimal(field.type)
+        comparable = numeric or pa.types.is_string(field.type) or pa.types.is_temporal(field.type)
+        parts += [
+            f"count({col})",
+            f"CAST(sum({col}) AS DOUBLE)" if numeric else "NULL",
+            f"CAST(min({col}) AS VARCHAR)" if comparable else "NULL",
+            f"CAST(max({col}) AS VARCHAR)" if comparable else "NULL",
+        ]
+    query = sql.strip().rstrip(";")
+    values = con.execute(f"SELECT {', '.join(parts)} FROM ({query}) AS result", params or []).fetchone()
+    total, stats = values[0], values[1:]
+    rows = [(field.name, *stats[i * 4:i * 4 + 4]) for i, field in enumerate(schema)]
+    return pa.table({
+        "column": [r[0] for r in rows], "count": [r[1] for r in rows], "sum": [r[2] for r in rows],
+        "min": [r[3] for r in rows], "max": [r[4] for r in rows],
+    }), total
+
+
+@tracing.traced("duckdb.query")
+def run_read_query(sql: str, params=None, limit: int = None, summary: bool = False,
+                   source: str = "query") -> str:
+    """
+    Runs a read-only query on the finance database and encodes the result for the LLM.
+    At most `limit` rows are returned; a larger result ends with a truncation notice and a
+    per-column summary of all its rows. `summary=True` returns only that summary.
+    The size of every result is logged and counted in metrics. Anything but a single SELECT,
+    and queries over the EXPLAIN cost guard or the time budget, raise QueryLimitError.
+    """
+    limit = QUERY_ROW_LIMIT if limit is None else limit
+    check_read_only(sql)
+    with get_pool(DB_PATH).read() as con, time_budget(con):
+        check_query_cost(con, sql, params)
+        if summary:
+            schema = con.execute(f"SELECT * FROM ({sql.strip().rstrip(';')}) AS result LIMIT 0", params or []).arrow().schema
+            stats, total = summarize(con, sql, schema, params)
+            text = f"{total} rows. Summary per column:\n{encode_table(stats)}"
+        else:
+            table, truncated = fetch_limited(con, sql, params, limit)
+            if table.num_rows == 0:
+                text = "No data found."
+            elif truncated:
+                stats, total = summarize(con, sql, table.schema, params)
+                text = (
+                    f"{encode_table(table)}\n"
+                    f"... showing the first {limit} of {total} rows. Aggregate in SQL instead of listing rows. "
+                    f"Summary of all {total} rows:\n{encode_table(stats)}"
+                )
+                metrics.incr(f"tool_result.{source}.truncated")
+            else:
+                text = encode_table(table)
+
+    size = len(text.encode())
+    # Same estimate as history.estimate_tokens
+    tokens = len(text) // 4
+    metrics.incr(f"tool_result.{source}.bytes", size)
+    metrics.incr(f"tool_result.{source}.tokens", tokens)
+    logger.info(f"{source} result: {size} bytes, ~{tokens} tokens")
+    return text
+
+
+@with_db_executor
 @tool
-def query_duckdb_tool(query: str) -> str:
+def query_duckdb_tool(query: str, summary: bool = False) -> str:
     """
     Runs a SQL query against the database and returns results. Transactions table holds all the transactions. 
     There are 2 types of transactions in the table, "DEBIT" type and "CREDIT" type.
@@ -83,25 +607,51 @@ def query_duckdb_tool(query: str) -> str:
                     amount DOUBLE, [amount either credit or debit]
                     balance DOUBLE, [account balance after each transaction]
                     mode VARCHAR, [mode specifies the mode of transactions like UPI, NET BANKING, MOBILE BANKING etc]
-                    type VARCHAR, [type specifies "DEBIT" or "CREDIT" type of transaction]
+                    type ENUM, [type specifies "DEBIT" or "CREDIT" type of transaction ("BALANCE" for balance brought forward)]
                     receiver VARCHAR, [receiver tells the recepient name mentioned in the transaction description]
                     bank VARCHAR, [This is bank name from user's query. like 'ICICI', 'HDFC' etc]
-                    account_no VARCHAR [This is the account number for which the user querying details]
+                    account_no VARCHAR, [This is the account number for which the user querying details]
+                    txn_key VARCHAR, [internal deduplication hash, not useful for answering queries]
+                    seq BIGINT [statement order; ORDER BY date, seq lists transactions as in the statement]
+                )
+        Filtering on date (and account_no) is fast: the data is stored sorted by month and account.
+
+    Prefer the much smaller MONTHLY_ROLLUP table for totals by month, type, mode or receiver;
+    it holds one row per (bank, account_no, month, type, mode, receiver) and is kept in sync
+    with transactions:
+            monthly_rollup (
+                    bank VARCHAR,
+                    account_no VARCHAR,
+                    month DATE, [first day of the month, e.g. 2025-05-01 for May 2025]
+                    type VARCHAR, ["DEBIT" or "CREDIT"]
+                    mode VARCHAR, ['' when unknown]
+                    receiver VARCHAR, ['' when unknown]
+                    txn_count BIGINT, [number of transactions]
+                    total_amount DOUBLE [sum of amount]
                 )
+        Example: total spending in May 2025 ->
+            SELECT sum(total_amount) FROM monthly_rollup
+            WHERE bank = 'ICICI' AND account_no = 'XXXXXXXX6193' AND type = 'DEBIT' AND month = DATE '2025-05-01'
+    Use the transactions table for individual transactions, single days or text searches on description.
+
+    Results come back as `|`-separated lines with a header line. Only the first 50 rows (by default) are
+    returned; larger results are truncated and followed by a summary of all rows.
+    Queries that would be too expensive or run too long return a JSON error with a hint on how
+    to rewrite them.
 
+    Args:
+        query: the SQL query
+        summary: return only the row count and count/sum/min/max of every column instead of rows
     """
 
     logger.info("Entering query_duckdb_tool() ...")
-    con = duckdb.connect(DB_PATH, read_only=True)
     try:
-        results_df = con.execute(query).fetchdf()
-        if results_df.empty:
-            return "No data found."
-        return results_df.to_markdown(index=False)
+        return run_read_query(query, summary=summary, source="query_duckdb_tool")
+    except QueryLimitError as e:
+        logger.warning(f"query_duckdb_tool stopped: {e}")
+        return e.to_json()
     except Exception as e:
         return f"Error running query: {e}"
-    finally:
-        con.close()
 
 
 if __name__ == "__main__":
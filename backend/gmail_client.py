@@ -0,0 +1,169 @@
+import os
+import random
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import logging
+
+import httplib2
+import google_auth_httplib2
+from google.oauth2.credentials import Credentials
+from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+
+import metrics
+import tracing
+
+logger = logging.getLogger(__name__)
+
+SCOPES = ["https://www.googleapis.com/auth/gmail.readonly"]
+
+TOKEN_PATH = os.getenv("FINMATE_GMAIL_TOKEN", "token.json")
+
+# Overrides the Gmail API host, e.g. with a local stand-in. None uses googleapis.com
+GMAIL_API_ENDPOINT = os.getenv("FINMATE_GMAIL_API_ENDPOINT") or None
+
+# Threads used to fetch messages and attachments concurrently
+GMAIL_WORKERS = int(os.getenv("FINMATE_GMAIL_WORKERS", "8"))
+
+# Rate limits (429) and server errors are retried with exponential backoff and jitter
+GMAIL_MAX_RETRIES = int(os.getenv("FINMATE_GMAIL_MAX_RETRIES", "5"))
+GMAIL_BACKOFF_SECONDS = float(os.getenv("FINMATE_GMAIL_BACKOFF_SECONDS", "0.5"))
+GMAIL_TIMEOUT_SECONDS = float(os.getenv("FINMATE_GMAIL_TIMEOUT_SECONDS", "30"))
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class GmailClient:
+    """
+    Gmail API client shared across requests and threads.
+
+    The discovery service is built once and rebuilt only when token.json changes.
+    googleapiclient connections are not thread-safe, so requests are built from the
+    shared service but executed over a per-thread authorized connection.
+    """
+
+    def __init__(self, token_path: str = TOKEN_PATH, api_endpoint: str = GMAIL_API_ENDPOINT,
+                 workers: int = GMAIL_WORKERS, max_retries: int = GMAIL_MAX_RETRIES,
+                 backoff: float = GMAIL_BACKOFF_SECONDS, timeout: float = GMAIL_TIMEOUT_SECONDS):
+        self.token_path = token_path
+        self.api_endpoint = api_endpoint
+        self.workers = workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._creds = None
+        self._token_mtime = None
+        self._service = None
+        self._pool = None
+
+    def _credentials(self) -> Credentials:
+        mtime = os.path.getmtime(self.token_path)
+        with self._lock:
+            if self._creds is None or mtime != self._token_mtime:
+                if self._creds is not None:
+                    logger.info(f"{self.token_path} changed, reloading Gmail credentials")
+                self._creds = Credentials.from_authorized_user_file(self.token_path, SCOPES)
+                self._token_mtime = mtime
+                self._service = None
+            return self._creds
+
+    @property
+    def service(self):
+        creds = self._credentials()
+        with self._lock:
+            if self._service is None:
+                options = {"api_endpoint": self.api_endpoint} if self.api_endpoint else None
+                self._service = build("gmail", "v1", credentials=creds, client_options=options,
+                                      static_discovery=True, cache_discovery=False)
+                metrics.incr("gmail.service_built")
+            return self._service
+
+    def _http(self):
+        creds = self._credentials()
+        if getattr(self._local, "creds", None) is not creds:
+            self._local.http = google_auth_httplib2.AuthorizedHttp(creds, http=httplib2.Http(timeout=self.timeout))
+            self._local.creds = creds
+        return self._local.http
+
+    def execute(self, request):
+        """Executes a request built from `service` on this thread's connection, with retries."""
+        for attempt in range(self.max_retries + 1):
+            try:
+                with metrics.timer("gmail.request"):
+                    return request.execute(http=self._http())
+            except HttpError as e:
+                if e.resp.status not in RETRY_STATUSES or attempt == self.max_retries:
+                    raise
+                reason, retry_after = e.resp.status, e.resp.get("retry-after")
+            except (socket.timeout, ConnectionError, httplib2.HttpLib2Error) as e:
+                if attempt == self.max_retries:
+                    raise
+                reason, retry_after = type(e).__name__, None
+            delay = self.backoff * 2 ** attempt * (0.5 + random.random() / 2)
+            if retry_after and retry_after.isdigit():
+                delay = max(delay, float(retry_after))
+            metrics.incr("gmail.retries")
+            logger.warning(f"Gmail request failed ({reason}), retry {attempt + 1}/{self.max_retries} in {delay:.2f}s")
+            time.sleep(delay)
+
+    @tracing.traced("gmail.list_messages")
+    def list_messages(self, query: str, limit: int = None) -> list:
+        """Lists the messages matching `query`, following nextPageToken until `limit` messages (or all)."""
+        messages = []
+        page_token = None
+        while True:
+            results = self.execute(self.service.users().messages().list(userId="me", q=query, pageToken=page_token))
+            messages.extend(results.get("messages", []))
+            page_token = results.get("nextPageToken")
+            if not page_token or (limit is not None and len(messages) >= limit):
+                break
+        return messages if limit is None else messages[:limit]
+
+    @tracing.traced("gmail.get_message")
+    def get_message(self, message_id: str, format: str = "full") -> dict:
+        return self.execute(self.service.users().messages().get(userId="me", id=message_id, format=format))
+
+    @tracing.traced("gmail.get_attachment")
+    def get_attachment(self, message_id: str, attachment_id: str) -> dict:
+        return self.execute(
+            self.service.users().messages().attachments().get(userId="me", messageId=message_id, id=attachment_id)
+        )
+
+    def map(self, fn, items) -> list:
+        """
+        Runs `fn` over `items` on the client's thread pool and returns the results in order.
+        `fn` must not call map itself; nested calls can starve the pool.
+        """
+        items = list(items)
+        if len(items) <= 1 or self.workers <= 1:
+            return [fn(item) for item in items]
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="gmail")
+        return list(self._pool.map(tracing.in_context(fn), items))
+
+    def get_messages(self, message_ids, format: str = "full") -> list:
+        """Fetches several messages concurrently, in the order of `message_ids`."""
+        return self.map(lambda message_id: self.get_message(message_id, format), message_ids)
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=True)
+            self._pool = None
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_gmail_client() -> GmailClient:
+    """The process-wide Gmail client."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = GmailClient()
+        return _client
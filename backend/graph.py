@@ -4,21 +4,27 @@ from langgraph.graph import StateGraph, START, END
 from langgraph.graph.message import add_messages
 from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
 
-from langchain_ollama import ChatOllama
-from langchain_google_genai import ChatGoogleGenerativeAI
 from tools import add, subtract, multiply, devide
-from tools import fetch_gmail_pdfs, decrypt_pdf_tool, extract_and_store_transactions_tool
-from duckdb_tools import query_duckdb_tool
+from tools import fetch_gmail_pdfs, decrypt_pdf_tool, extract_and_store_transactions_tool, bulk_ingest_statements_tool
+from duckdb_tools import query_duckdb_tool, is_range_covered
+from db_pool import run_db
+from analytics_tools import ANALYTICS_TOOLS
 from schemas import QueryInfo
-
-from langgraph.prebuilt import ToolNode
+from query_extractor import (complete_query_info, extract_query_info, merge_query_info, missing_fields,
+                             month_period, parse_date_range, period_changed)
+from history import compact_history, reasoning_of
+import metrics
+import response_cache
+import tracing
+from tool_runner import ToolRunner
+
+from langchain_core.runnables import RunnableLambda
 from langgraph.prebuilt import tools_condition
-import pprint
-from pprint import pformat
 #from logger import setup_logger
 from datetime import datetime
 from calendar import monthrange
 import json
+import re
 import logging
 
 #logger = setup_logger()
@@ -30,6 +36,7 @@ You are a financial assistant. Today's date is {today.strftime('%Y-%m-%d')}. Thi
 You can do following to answer queries.
 - From user input message derive the query terms to find the relevant data.
 - Relevant data may be there in DuckDB database. Check first.
+- For totals per period, top receivers, balance trend or payment modes use the analytics tools; write SQL with query_duckdb_tool only for other questions.
 - If it is not there in database, pull it from Gmail.
 - Fetch bank statements from Gmail and download the attahment
 - Extract and store transactions in database
@@ -47,7 +54,9 @@ Available tools:
 - fetch_gmail_pdfs: Fetches bank statement PDFs from Gmail.
 - decrypt_pdf_tool: Decrypts a PDF file.
 - extract_and_store_transactions_tool: Extracts transactions from a PDF and stores them in the database.
+- spend_by_period_tool, top_receivers_tool, balance_trend_tool, mode_breakdown_tool: Ready-made queries for spending per period, top receivers, balance trend and payment mode breakdown. Prefer them over writing SQL.
 - query_duckdb_tool: Queries the DuckDB database for financial data.
+- bulk_ingest_statements_tool: Fetches, decrypts and stores all statements for several accounts or months at once.
 """
 
 schema_support_prompt = SystemMessage(content=(
@@ -67,11 +76,37 @@ schema_support_prompt = SystemMessage(content=(
 
 
 
+def query_period(q: QueryInfo):
+    """(start, end) dates asked for in the query: date_range, else the month(s) of the year. None if unknown."""
+    if q is None:
+        return None
+    return parse_date_range(q.date_range) or month_period(q.month, q.year)
+
+
+def range_available(q: QueryInfo) -> bool:
+    """True when DuckDB already holds the whole period asked for, for every account in the query."""
+    period = query_period(q)
+    accounts = [a.strip() for a in (q.account_no or "").split(",") if a.strip()] if q else []
+    return bool(period and q.bank and accounts) and all(
+        is_range_covered(q.bank, account_no, *period) for account_no in accounts
+    )
+
+
+def inline(node):
+    """Async variant of a node that only does a little CPU work; running it on the event loop avoids a thread hop."""
+    async def run(state):
+        return node(state)
+    return run
+
+
 def get_llm(model: str):
+    # Provider SDKs are imported on first use: a server that only talks to Ollama never loads the Gemini one
     if model.startswith("ollama:"):
+        from langchain_ollama import ChatOllama
         model_name = model.split(":",1)[1]
         return ChatOllama(model=model_name, temperature=0.7, streaming=True)
     elif model.startswith("gemini:"):
+        from langchain_google_genai import ChatGoogleGenerativeAI
         model_name = model.split(":", 1)[1]
         return ChatGoogleGenerativeAI(model=model_name, temperature=0.7)
     else:
@@ -86,6 +121,21 @@ class State(TypedDict):
     db_result: Optional[str]
     confirmed: Optional[bool]
     awaiting_confirmation: Optional[bool]
+    data_available: Optional[bool]
+    cached_response: Optional[bool]
+    # The user message the current validated_query answers (not the "yes" confirming it)
+    question: Optional[str]
+
+# A reply containing one of these confirms the query summary
+CONFIRM_WORDS = ["yes", "okay", "sure", "go ahead", "confirm", "proceed"]
+
+
+def current_question(state, user_message) -> str:
+    """The question being answered: confirming the query summary keeps the question it summarized."""
+    content = user_message.content.strip().lower()
+    if state.get("awaiting_confirmation") and state.get("question") and any(x in content for x in CONFIRM_WORDS):
+        return state["question"]
+    return user_message.content
 
 
 def build_graph(model: str):
@@ -97,18 +147,17 @@ def build_graph(model: str):
         fetch_gmail_pdfs,
         decrypt_pdf_tool,
         extract_and_store_transactions_tool,
+        bulk_ingest_statements_tool,
+        *ANALYTICS_TOOLS,
         query_duckdb_tool
         ]
     llm_with_tools = llm.bind_tools(tools)
+    # When DuckDB already covers the requested period only querying is left to do
+    llm_with_query_tools = llm.bind_tools([*ANALYTICS_TOOLS, query_duckdb_tool])
     #Define chatbot node
     # def chatbot(state: State):
     #     return {"messages": [llm.invoke(state["messages"])]}
 
-    import re
-    def extract_think_blocks(text):
-        blocks = re.findall(r"<think>.*?</think>", text, re.DOTALL)
-        return "\n".join(blocks) + "\n" if blocks else ""
-    
     def planning_node(state):
         logger.info(f"1.Planning Node entered...")
         user_msg = state["messages"][-1].content
@@ -127,6 +176,9 @@ def build_graph(model: str):
         gmail_hint = "subject:ICICI Bank Statement from dd-mm-yyyy to dd-mm-yyyy"
         
         existing_vq = state.get("validated_query")
+        if isinstance(existing_vq, QueryInfo):
+            # Resumed sessions hold the QueryInfo stored by the previous turn
+            existing_vq = existing_vq.model_dump()
         merged_query = {
             **(existing_vq if existing_vq else {}),
             #"query_hint": gmail_hint
@@ -135,82 +187,95 @@ def build_graph(model: str):
         return {
             "plan": plan,
             "validated_query": QueryInfo(**merged_query),
-            "messages": [AIMessage(content=plan)] + state["messages"],
+            # add_messages appends, so only the plan is returned; a resumed session already has it
+            "messages": [] if state.get("plan") == plan else [AIMessage(content=plan)],
             "confirmed": False
         }
 
+    def extract_query(state):
+        """Rule-based QueryInfo of the latest user message merged with the earlier turns."""
+        user_message = next(msg for msg in reversed(state["messages"]) if isinstance(msg, HumanMessage))
+        previous = state.get("validated_query") or {}
+        if isinstance(previous, QueryInfo):
+            previous = previous.model_dump()
+            logger.info(f"Existing vq : {previous}")
+        fast = extract_query_info(user_message.content)
+        return user_message, previous, fast, merge_query_info(fast, previous)
+
+    def validation_result(state, user_message, previous, fast, merged):
+        # A confirmation ("yes") or a follow-up without a new period keeps the stored range,
+        # which may be a few days or cross a year and cannot be rebuilt from month/year
+        keep_range = bool(fast.date_range) or not period_changed(merged, previous)
+        final_query = complete_query_info(merged, keep_range=keep_range)
+        logger.info(f"Merged final_query: {final_query}")
+        question = current_question(state, user_message)
+
+        if not final_query.bank or not final_query.month or not final_query.account_no:
+            logger.warning("Missing required fields: bank or month or account_no")
+            return {
+                "validated_query": final_query,
+                "question": question,
+                "messages": state["messages"] + [
+                    AIMessage(content="Please provide missing details like bank, month, and account number.")
+                ]
+            }
+
+        #summary = f"✅ Got it! Here's what I know:\n{final_query}"
+        summary = "✅ Got it! Here's what I know:\n"
+        summary += "\n".join(f"{key}: {value}" for key, value in final_query.model_dump().items())
+
+        return {
+            "validated_query": final_query,
+            "question": question,
+            "confirmed":False,
+            "awaiting_confirmation": True,
+            "messages": state["messages"] + [AIMessage(content=summary + "\n\nDo you want to proceed ?")]
+            }
+
+    def validation_failed(state, e):
+        logger.warning(f"Validaion failed: {e}")
+        return {
+            "validated_query": state.get("validated_query"),
+            "messages": state["messages"] + [AIMessage(content="❌ I couldn't understand your query, please rephrase it")]
+        }
+
+    # Most messages name the bank, account and month plainly; the LLM is only asked
+    # when the rules (together with the earlier turns) leave a required field empty
     def validate_query_node(state):
         logger.info(f"2.Validation Node entered...")
-        #logger.info(f"Current state at the beginning of Validation Node \n{state}\n")
-        #user_message = state["messages"][-1]
-        user_message = next(msg for msg in reversed(state["messages"]) if isinstance(msg, HumanMessage))
-        #logger.info(f"User Msg: {user_message.content}")
-        #logger.info(f"Plan: {state["plan"]}")
         try:
-            
-            parsed = llm_qry_schema.invoke([schema_support_prompt, user_message])
-            
-            previous = state.get("validated_query", {})
-            
-            if isinstance(previous, QueryInfo):
-                previous = previous.model_dump()
-                logger.info(f"Existing vq : {previous}")
-            merged = parsed.model_dump()
-            logger.info(f"vq after - new parsed message from user: {merged}")
-
-            for key, val in previous.items():
-                if merged.get(key) in (None,"") and val:
-                    merged[key] = val
-            if merged.get("month") and not merged.get("year"):
-                merged["year"] = str(datetime.today().year)
-            final_query = QueryInfo(**merged)
-            logger.info(f"Merged final_query: {final_query}")
-
-            # if final_query.month and final_query.year and not final_query.date_range:
-            #     try:
-            #         months = {m.lower(): i for i, m in enumerate([
-            #             "", "January", "February", "March", "April", "May", "June",
-            #             "July", "August", "September", "October", "November", "December"
-            #         ])}
-            #         month_num = months[final_query.month.strip().lower()]
-            #         year = int(final_query.year)
-            #         last_day = monthrange(year, month_num)[1]
-            #         start = f"01-{month_num:02d}-{year}"
-            #         end = f"{last_day:02d}-{month_num:02d}-{year}"
-            #         final_query.date_range = f"{start} to {end}"
-            #     except Exception as e:
-            #         logger.warning(f"Failed to infer date_range: {e}")
-
-            if not final_query.bank or not final_query.month or not final_query.account_no:
-                logger.warning("Missing required fields: bank or month or account_no")
-                return {
-                    "validated_query": final_query,
-                    "messages": state["messages"] + [
-                        AIMessage(content="Please provide missing details like bank, month, and account number.")
-                    ]
-                }
-            
-            #summary = f"✅ Got it! Here's what I know:\n{final_query}"
-            summary = "✅ Got it! Here's what I know:\n"
-            summary += "\n".join(f"{key}: {value}" for key, value in final_query.model_dump().items())
+            user_message, previous, fast, merged = extract_query(state)
+            if missing_fields(merged):
+                metrics.incr("query_extractor.llm_fallback")
+                parsed = tracing.invoke_llm(llm_qry_schema, [schema_support_prompt, user_message], "validate")
+                logger.info(f"vq after - new parsed message from user: {parsed}")
+                merged = merge_query_info(fast, parsed, previous)
+            else:
+                metrics.incr("query_extractor.fast_path")
+                logger.info(f"Query extracted without the LLM: {fast}")
+            return validation_result(state, user_message, previous, fast, merged)
+        except Exception as e:
+            return validation_failed(state, e)
 
-            return {
-                "validated_query": final_query,
-                "confirmed":False,
-                "awaiting_confirmation": True,
-                "messages": state["messages"] + [AIMessage(content=summary + "\n\nDo you want to proceed ?")]
-                }
-        
+    async def avalidate_query_node(state):
+        logger.info(f"2.Validation Node entered...")
+        try:
+            user_message, previous, fast, merged = extract_query(state)
+            if missing_fields(merged):
+                metrics.incr("query_extractor.llm_fallback")
+                parsed = await tracing.ainvoke_llm(llm_qry_schema, [schema_support_prompt, user_message], "validate")
+                logger.info(f"vq after - new parsed message from user: {parsed}")
+                merged = merge_query_info(fast, parsed, previous)
+            else:
+                metrics.incr("query_extractor.fast_path")
+                logger.info(f"Query extracted without the LLM: {fast}")
+            return validation_result(state, user_message, previous, fast, merged)
         except Exception as e:
-            logger.warning(f"Validaion failed: {e}")
-            return {
-                "validated_query": state.get("validated_query"),
-                "messages": state["messages"] + [AIMessage(content="❌ I couldn't understand your query, please rephrase it")]
-            }
+            return validation_failed(state, e)
 
     def clarify_node(state):
         logger.info("🔁 Clarify Node: Asking user to fill missing fields.")
-        logger.info(f"Current state at start of Clarify Node \n{state}\n")
+        logger.info(f"Clarify Node: {len(state['messages'])} messages, validated_query={state.get('validated_query')}")
         #logger.info(f"Clarify received validated_query: {state.get('validated_query')}")
 
         missing = []
@@ -254,7 +319,7 @@ def build_graph(model: str):
             return "clarify"
         if state.get("confirmed", False):
             logger.info(f"✅ Confirmed. Proceeding.")
-            return "chatbot"
+            return "coverage"
         if state.get("awaiting_confirmation", False):
             logger.info("Awaiting user confirmation.")
             return "confirm"
@@ -281,7 +346,7 @@ def build_graph(model: str):
         logger.info(f"user's last message: {user_msg}")
         
         content = user_msg.content.strip().lower()
-        if any(x in content for x in ["yes", "okay", "sure", "go ahead", "confirm", "proceed"]):
+        if any(x in content for x in CONFIRM_WORDS):
             return {
                 **state,
                 "confirmed": True,
@@ -308,43 +373,95 @@ def build_graph(model: str):
         #     "messages": state["messages"] + [AIMessage(content="This is a confirmation node")]
         # }
         
-     # define chatbot node with tool calls
-    def chatbot(state: State):
-        
-        logger.info(f"****** Entering chatbot ...\n")
-
+    def coverage_node(state):
+        q = state.get("validated_query")
+        available = range_available(q)
+        logger.info(f"Coverage check for {q.bank if q else None} {q.account_no if q else None}: available={available}")
+        return {"data_available": available}
+
+    def response_cache_node(state):
+        # Only answers computed over fully stored data are reused
+        key = None
+        if state.get("data_available"):
+            key = response_cache.cache_key(state.get("validated_query"), state.get("question"))
+        answer = response_cache.get(key)
+        if answer is None:
+            return {"cached_response": False}
+        logger.info(f"Answer served from the response cache for {key}")
+        return {"cached_response": True, "messages": state["messages"] + [AIMessage(content=answer)]}
+
+    async def acoverage_node(state):
+        return await run_db(coverage_node, state)
+
+    async def aresponse_cache_node(state):
+        return await run_db(response_cache_node, state)
+
+    def chatbot_prompt(state):
         messages = [SystemMessage(content=system_msg)]
-        messages += state["messages"]
+        # Bounded history: no <think> blocks, trimmed old tool results, oldest turns dropped over budget
+        history, _ = compact_history(state["messages"])
+        messages += history
    
         refined_query = state["validated_query"]
         if refined_query:
             reformulated = (
                 f"User intends to ask: "
-                f"{refined_query.intent} for {refined_query.bank} account {refined_query.account_no} "
+                f"{refined_query.intent or 'a question'} for {refined_query.bank} account {refined_query.account_no} "
                 f"in {refined_query.month} {refined_query.year}"
             )
             messages.append(SystemMessage(content=reformulated))
+        if state.get("data_available"):
+            start, end = query_period(refined_query)
+            messages.append(SystemMessage(content=(
+                f"Transactions of {refined_query.bank} account {refined_query.account_no} from "
+                f"{start:%d-%m-%Y} to {end:%d-%m-%Y} are already stored in DuckDB. "
+                "Answer with the analytics tools (spend_by_period_tool, top_receivers_tool, balance_trend_tool, "
+                "mode_breakdown_tool) or query_duckdb_tool; do not fetch statements from Gmail."
+            )))
         # if refined_query:
         #     user_msg = f"What is my total spending for {refined_query.bank} account {refined_query.account_no} in {refined_query.month} {refined_query.year}?"
         #     messages.append(HumanMessage(content=user_msg))
 
-        logger.info(f"Input Message Starts {'-' * 60} \n{pformat(messages)}\n Input Message End {'-' * 60}")
+        # Formatting the whole prompt costs more than the rest of the node; it is only logged at DEBUG
+        logger.info(f"Chatbot input: {len(messages)} messages, {sum(len(str(m.content)) for m in messages)} chars")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Chatbot input messages: {messages}")
         #logger.info([msg.content for msg in messages])
-        result = llm_with_tools.invoke(messages)
-        #result = llm.invoke(messages)
-        logger.info(f"AI Response Starts here {'-' * 60 } \n{pformat(result)}\n {'-' * 60}")
+        return messages
+
+    def chatbot_llm(state):
+        return llm_with_query_tools if state.get("data_available") else llm_with_tools
 
-        reasoning = ""
+    def chatbot_result(state, result):
+        logger.info(f"Chatbot response: {len(str(result.content))} chars, {len(result.tool_calls)} tool call(s)")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Chatbot response: {result}")
 
-        # to add all reasoinings together and show in final result
-        for msg in state["messages"]:
-            if isinstance(msg, AIMessage) and "<think>" in msg.content:
-                thinking_blocks = extract_think_blocks(msg.content)
-                reasoning += thinking_blocks
+        # to add the reasonings of this turn together and show in final result;
+        # earlier turns already showed theirs
+        turn_start = max((i for i, m in enumerate(state["messages"]) if isinstance(m, HumanMessage)), default=0)
+        reasoning = "".join(reasoning_of(msg) for msg in state["messages"][turn_start:])
             
         result.content = reasoning + "\n" + result.content
 
+        refined_query = state["validated_query"]
+        if not result.tool_calls and (state.get("data_available") or range_available(refined_query)):
+            response_cache.put(response_cache.cache_key(refined_query, state.get("question")), result.content)
+
         return {"messages": state["messages"] + [result] }
+
+     # define chatbot node with tool calls
+    def chatbot(state: State):
+        logger.info(f"****** Entering chatbot ...\n")
+        result = tracing.invoke_llm(chatbot_llm(state), chatbot_prompt(state), "chatbot")
+        #result = llm.invoke(messages)
+        return chatbot_result(state, result)
+
+    async def achatbot(state: State):
+        logger.info(f"****** Entering chatbot ...\n")
+        result = await tracing.ainvoke_llm(chatbot_llm(state), chatbot_prompt(state), "chatbot")
+        # Storing the answer in the response cache reads account versions from DuckDB
+        return await run_db(chatbot_result, state, result)
     
     builder = StateGraph(State)
     
@@ -354,18 +471,33 @@ def build_graph(model: str):
     # builder.add_conditional_edges("chatbot", tools_condition)
     # builder.add_edge("tools", "chatbot")
 
-    builder.add_node("planning", planning_node)
-    builder.add_node("validate", validate_query_node)
-    builder.add_node("clarify", clarify_node)
-    builder.add_node("confirm", confirm_node)
-    builder.add_node("dummy", dummy_node)
-    builder.add_node("chatbot", chatbot)
-    builder.add_node("tools", ToolNode(tools))
+    # Independent tool calls of one step run at the same time
+    tool_runner = ToolRunner(tools)
+
+    # name: (node for invoke, node for ainvoke/astream). The async variants await the LLM and
+    # run DuckDB work on its own executor, so a running request holds no thread of the default pool.
+    nodes = {
+        "planning": (planning_node, inline(planning_node)),
+        "validate": (validate_query_node, avalidate_query_node),
+        "clarify": (clarify_node, inline(clarify_node)),
+        "confirm": (confirm_node, inline(confirm_node)),
+        "dummy": (dummy_node, inline(dummy_node)),
+        "coverage": (coverage_node, acoverage_node),
+        "response_cache": (response_cache_node, aresponse_cache_node),
+        "chatbot": (chatbot, achatbot),
+        "tools": (tool_runner.invoke, tool_runner.ainvoke),
+    }
+    # Every node runs in a node.<name> span
+    for name, (func, afunc) in nodes.items():
+        span = f"node.{name}"
+        builder.add_node(name, RunnableLambda(tracing.traced(span)(func), afunc=tracing.traced(span)(afunc), name=name))
 
     builder.add_edge(START, "planning")
     builder.add_edge("planning", "validate")
     builder.add_conditional_edges("validate", routing_logic)
     builder.add_conditional_edges("confirm", routing_logic)
+    builder.add_edge("coverage", "response_cache")
+    builder.add_conditional_edges("response_cache", lambda state: END if state.get("cached_response") else "chatbot")
 
     #builder.add_edge(START, "chatbot")
     builder.add_conditional_edges("chatbot", tools_condition)
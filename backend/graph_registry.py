@@ -0,0 +1,133 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+import logging
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of compiled graphs kept in memory (one per model string)
+GRAPH_CACHE_SIZE = int(os.getenv("FINMATE_GRAPH_CACHE_SIZE", "4"))
+
+# Models compiled at startup so the first request does not pay the build cost, e.g.
+# FINMATE_WARMUP_MODELS=ollama:qwen3. Off by default: building a graph imports its provider
+# package, which every start and --reload would otherwise pay for models the server never uses.
+WARMUP_MODELS = [m.strip() for m in os.getenv("FINMATE_WARMUP_MODELS", "").split(",") if m.strip()]
+
+
+class GraphRegistry:
+    """
+    Process-wide cache of compiled LangGraph graphs keyed by model string.
+    Building a graph creates the LLM client, binds the tools and compiles the StateGraph,
+    so it is done once per model and reused by every request. Least recently used
+    entries are evicted once `max_size` graphs are cached.
+    """
+
+    def __init__(self, builder=None, max_size: int = GRAPH_CACHE_SIZE):
+        if builder is None:
+            from graph import build_graph
+            builder = build_graph
+        self._builder = builder
+        self._max_size = max_size
+        self._graphs = OrderedDict()
+        self._build_locks = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._build_times = {}
+
+    def get(self, model: str):
+        """Returns the compiled graph for `model`, building it on first use."""
+        start = time.perf_counter()
+        with self._lock:
+            graph = self._graphs.get(model)
+            if graph is not None:
+                self._graphs.move_to_end(model)
+                self._hits += 1
+            build_lock = self._build_locks.setdefault(model, threading.Lock())
+
+        if graph is not None:
+            metrics.incr("graph_cache.hit")
+            metrics.observe("graph_cache.lookup", time.perf_counter() - start)
+            return graph
+
+        # Only one thread builds a given model; the others wait and reuse its result
+        with build_lock:
+            with self._lock:
+                graph = self._graphs.get(model)
+                if graph is not None:
+                    self._graphs.move_to_end(model)
+                    self._hits += 1
+            if graph is not None:
+                metrics.incr("graph_cache.hit")
+                metrics.observe("graph_cache.lookup", time.perf_counter() - start)
+                return graph
+
+            build_start = time.perf_counter()
+            graph = self._builder(model)
+            build_time = time.perf_counter() - build_start
+
+            with self._lock:
+                self._misses += 1
+                self._build_times[model] = build_time
+                self._graphs[model] = graph
+                self._graphs.move_to_end(model)
+                while len(self._graphs) > self._max_size:
+                    evicted, _ = self._graphs.popitem(last=False)
+                    self._build_locks.pop(evicted, None)
+                    self._evictions += 1
+                    logger.info(f"Evicted compiled graph for model: {evicted}")
+
+        metrics.incr("graph_cache.miss")
+        metrics.observe("graph_cache.build", build_time)
+        logger.info(f"Built graph for model {model} in {build_time * 1000:.1f} ms")
+        return graph
+
+    def warm_up(self, models) -> dict:
+        """Builds graphs for `models` ahead of time. Failures are logged and skipped."""
+        results = {}
+        for model in models:
+            try:
+                self.get(model)
+                results[model] = "ok"
+            except Exception as e:
+                logger.warning(f"Warm-up failed for model {model}: {e}")
+                results[model] = f"error: {e}"
+        return results
+
+    def invalidate(self, model: str = None) -> int:
+        """Drops the cached graph for `model`, or every cached graph when model is None."""
+        with self._lock:
+            if model is None:
+                count = len(self._graphs)
+                self._graphs.clear()
+                self._build_locks.clear()
+            else:
+                count = 1 if self._graphs.pop(model, None) is not None else 0
+                self._build_locks.pop(model, None)
+        logger.info(f"Invalidated {count} cached graph(s) for model: {model or 'ALL'}")
+        return count
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "size": len(self._graphs),
+                "max_size": self._max_size,
+                "models": list(self._graphs.keys()),
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+                "build_ms": {m: round(t * 1000, 3) for m, t in self._build_times.items()},
+            }
+
+
+registry = GraphRegistry()
+
+
+def get_graph(model: str):
+    return registry.get(model)
@@ -0,0 +1,120 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+import logging
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+
+import metrics
+from streaming import content_text
+
+logger = logging.getLogger(__name__)
+
+# Approximate prompt tokens kept from the conversation history (system prompts not included)
+HISTORY_TOKEN_BUDGET = int(os.getenv("FINMATE_HISTORY_TOKEN_BUDGET", "6000"))
+
+# Tool results from earlier turns are cut down to this many characters
+STALE_TOOL_RESULT_CHARS = int(os.getenv("FINMATE_STALE_TOOL_RESULT_CHARS", "200"))
+
+# Messages whose extracted <think> blocks are remembered
+REASONING_CACHE_SIZE = 4096
+
+THINK_RE = re.compile(r"<think>.*?</think>", re.DOTALL)
+
+_reasoning = OrderedDict()
+_reasoning_lock = threading.Lock()
+
+
+def estimate_tokens(messages) -> int:
+    """Cheap token estimate (about 4 characters per token plus per-message overhead)."""
+    return sum(len(content_text(m.content)) // 4 + 4 for m in messages)
+
+
+def reasoning_of(msg) -> str:
+    """The <think> blocks of an AI message, extracted once per message id."""
+    if not isinstance(msg, AIMessage) or "<think>" not in content_text(msg.content):
+        return ""
+    key = msg.id
+    if key is not None:
+        with _reasoning_lock:
+            if key in _reasoning:
+                _reasoning.move_to_end(key)
+                metrics.incr("history.reasoning_cache.hit")
+                return _reasoning[key]
+    blocks = THINK_RE.findall(content_text(msg.content))
+    reasoning = "\n".join(blocks) + "\n" if blocks else ""
+    if key is not None:
+        metrics.incr("history.reasoning_cache.miss")
+        with _reasoning_lock:
+            _reasoning[key] = reasoning
+            while len(_reasoning) > REASONING_CACHE_SIZE:
+                _reasoning.popitem(last=False)
+    return reasoning
+
+
+def _strip_think(msg):
+    if isinstance(msg, AIMessage) and isinstance(msg.content, str) and "<think>" in msg.content:
+        return msg.model_copy(update={"content": THINK_RE.sub("", msg.content).strip()})
+    return msg
+
+
+def _shorten_tool_result(msg):
+    text = content_text(msg.content)
+    if len(text) <= STALE_TOOL_RESULT_CHARS:
+        return msg
+    return msg.model_copy(update={
+        "content": f"{text[:STALE_TOOL_RESULT_CHARS]}... [earlier tool result truncated, {len(text)} chars]"
+    })
+
+
+def _turn_starts(messages) -> list:
+    return [i for i, m in enumerate(messages) if isinstance(m, HumanMessage)]
+
+
+def compact_history(messages, budget: int = None):
+    """
+    Returns the messages to send to the LLM and a stats dict. <think> blocks are removed,
+    tool results of earlier turns are truncated, and when the history is still over
+    `budget` tokens the oldest turns are dropped (whole turns, so tool calls keep their
+    results) and replaced with a note listing what the user asked in them.
+    The latest turn is always kept.
+    """
+    budget = HISTORY_TOKEN_BUDGET if budget is None else budget
+    before = estimate_tokens(messages)
+    starts = _turn_starts(messages)
+    current = starts[-1] if starts else 0
+
+    compacted = [_strip_think(m) for m in messages]
+    compacted = [
+        _shorten_tool_result(m) if isinstance(m, ToolMessage) and i < current else m
+        for i, m in enumerate(compacted)
+    ]
+
+    dropped = []
+    tokens = estimate_tokens(compacted)
+    # Earlier turns are dropped oldest first until the history fits
+    for start, end in zip(starts, starts[1:]):
+        if tokens <= budget:
+            break
+        turn = compacted[start:end]
+        tokens -= estimate_tokens(turn)
+        dropped.append((start, end))
+    if dropped:
+        first, last = dropped[0][0], dropped[-1][1]
+        asked = [content_text(compacted[s].content)[:80] for s, _ in dropped]
+        note = SystemMessage(content=(
+            f"{last - first} earlier messages were omitted. The user had asked: " + "; ".join(asked)
+        ))
+        compacted = compacted[:first] + [note] + compacted[last:]
+
+    after = estimate_tokens(compacted)
+    stats = {"messages_before": len(messages), "messages_after": len(compacted),
+             "tokens_before": before, "tokens_after": after, "turns_dropped": len(dropped)}
+    metrics.incr("history.tokens_before", before)
+    metrics.incr("history.tokens_after", after)
+    logger.info(
+        f"History compaction: {before} -> {after} tokens, {len(messages)} -> {len(compacted)} messages, "
+        f"{len(dropped)} turn(s) dropped"
+    )
+    return compacted, stats
@@ -0,0 +1,134 @@
+import re
+import logging
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+_DATE = r"\d{2}-\d{2}-\d{4}"
+_AMOUNT = r"[\d,]+\.\d{2}"
+# Whitespace inside one line; pages are scanned as a whole so matches must not cross newlines
+_WS = r"[^\S\n]+"
+
+# Every ICICI transaction line starts with its date, followed by one of these formats.
+# They are alternatives of a single compiled regex scanned over the whole page text and
+# are tried in this order, which is the order the formats used to be matched one by one.
+ICICI_LINE_RE = re.compile(
+    rf"^(?P<date>{_DATE})(?:"
+    # Balance forward (e.g., 01-04-2025 B/F 9841.12)
+    rf"(?P<bf>{_WS}B/F{_WS}(?P<bf_balance>{_AMOUNT})$)"
+    # Generic UPI transaction spread across 3 lines (date in middle); the next line is consumed
+    rf"|(?P<upi>{_WS}(?:(?P<upi_desc>.*?){_WS})?(?P<upi_amount>{_AMOUNT}){_WS}(?P<upi_balance>{_AMOUNT})$(?:\n(?P<upi_next>.*))?)"
+    rf"|(?P<net>NET BANKING{_WS}(?P<net_desc>.*?){_WS}(?P<net_amount>{_AMOUNT}){_WS}(?P<net_balance>{_AMOUNT})$)"
+    rf"|(?P<mobile>MOBILE BANKING{_WS}(?P<mobile_desc>.+?){_WS}(?P<mobile_amount>{_AMOUNT}){_WS}(?P<mobile_balance>{_AMOUNT})$)"
+    rf"|(?P<direct>ICICI DIRECT{_WS}(?P<direct_desc>.+?){_WS}(?P<direct_amount>{_AMOUNT}){_WS}(?P<direct_balance>{_AMOUNT})$)"
+    rf")",
+    re.MULTILINE,
+)
+
+# Mode and groups for the single line formats
+FIXED_MODE_RULES = {
+    "net": ("NET BANKING", "net_desc", "net_amount", "net_balance"),
+    "mobile": ("MOBILE BANKING", "mobile_desc", "mobile_amount", "mobile_balance"),
+    "direct": ("ICICI DIRECT", "direct_desc", "direct_amount", "direct_balance"),
+}
+
+COLUMNS = ["date", "description", "amount", "balance", "mode", "type", "receiver", "bank", "account_no"]
+
+# Row layout of the intermediate tuples: (date, description, amount, balance, mode, receiver, is_bf)
+_ROW_FIELDS = ["date", "description", "amount", "balance", "mode", "receiver", "is_bf"]
+
+
+def parse_page_lines(lines, bank: str, rows: list) -> int:
+    """
+    Parses the text lines of one statement page into `rows` with a single regex pass
+    over the page, dispatching on the matched alternative. Amounts and dates stay as
+    strings here and are converted for all rows at once in `build_frame`.
+    Returns the number of rows added.
+    """
+    text = "\n".join(map(str.strip, lines))
+    append = rows.append
+    added = 0
+    for m in ICICI_LINE_RE.finditer(text):
+        rule = m.lastgroup
+        if rule == "upi":
+            date, middle_desc, amount, balance, next_desc = m.group("date", "upi_desc", "upi_amount", "upi_balance", "upi_next")
+            start = m.start()
+            prev_desc = text[text.rfind("\n", 0, start - 1) + 1:start - 1] if start > 0 else ""
+            full_description = " ".join([prev_desc, middle_desc.strip() if middle_desc else "", next_desc or ""]).strip()
+
+            parts = full_description.split("/")
+            if len(parts) > 1:
+                mode = parts[0].strip()
+                receiver = parts[1].strip()
+            elif "Int.Pd" in full_description or "interest" in full_description.lower():
+                mode = "Interest Credit"
+                receiver = bank
+            else:
+                mode = "Unknown"
+                receiver = "Unknown"
+            append((date, full_description, amount, balance, mode, receiver, False))
+        elif rule == "bf":
+            append((m.group("date"), "Balance Forward", "0.00", m.group("bf_balance"), "B/F", "", True))
+        else:
+            mode, desc_group, amount_group, balance_group = FIXED_MODE_RULES[rule]
+            date, desc, amount, balance = m.group("date", desc_group, amount_group, balance_group)
+            append((date, desc.strip(), amount, balance, mode, "", False))
+        added += 1
+    return added
+
+
+def _to_float_array(values) -> np.ndarray:
+    return np.array([float(v.replace(",", "")) if "," in v else float(v) for v in values], dtype=float)
+
+
+def _to_date_array(values) -> np.ndarray:
+    # Statements repeat the same date on many rows, so each distinct dd-mm-yyyy is converted once
+    unique = list(dict.fromkeys(values))
+    days = np.array([f"{d[6:]}-{d[3:5]}-{d[:2]}" for d in unique], dtype="datetime64[D]").astype(np.int64)
+    lookup = dict(zip(unique, days.tolist()))
+    return np.array([lookup[d] for d in values], dtype=np.int64).view("datetime64[D]")
+
+
+def build_frame(rows: list, bank: str, account_no: str, opening_balance: float = 0.0) -> pd.DataFrame:
+    """
+    Converts parsed rows into a transactions DataFrame, parsing amounts and dates for
+    all rows at once. A row is DEBIT when the balance dropped compared to the previous
+    row (the running balance carries across pages), CREDIT otherwise.
+    """
+    n = len(rows)
+    cols = dict(zip(_ROW_FIELDS, map(list, zip(*rows)))) if n else {f: [] for f in _ROW_FIELDS}
+    amount = _to_float_array(cols["amount"])
+    balance = _to_float_array(cols["balance"])
+    previous_balance = np.empty(n, dtype=float)
+    if n:
+        previous_balance[0] = opening_balance
+        previous_balance[1:] = balance[:-1]
+
+    txn_type = np.where(previous_balance > balance, "DEBIT", "CREDIT").astype(object)
+    txn_type[np.array(cols["is_bf"], dtype=bool)] = "BALANCE"
+
+    df = pd.DataFrame({
+        "date": pd.to_datetime(_to_date_array(cols["date"])),
+        "description": np.array(cols["description"], dtype=object),
+        "amount": amount,
+        "balance": balance,
+        "mode": np.array(cols["mode"], dtype=object),
+        "type": txn_type,
+        "receiver": np.array(cols["receiver"], dtype=object),
+        "bank": np.full(n, bank, dtype=object),
+        "account_no": np.full(n, account_no, dtype=object),
+    })
+    return df[COLUMNS]
+
+
+def parse_icici_pages(pages, bank: str, account_no: str) -> pd.DataFrame:
+    """Parses an iterable of per-page line lists (in page order) into a transactions DataFrame."""
+    rows = []
+    for page_num, lines in enumerate(pages):
+        if not lines:
+            continue
+        added = parse_page_lines(lines, bank, rows)
+        logger.info(f"Parsed {added} transactions from {len(lines)} lines on page {page_num + 1}")
+    return build_frame(rows, bank, account_no)
@@ -0,0 +1,200 @@
+"""
+Bulk ingestion of bank statements: search Gmail for every statement of the given accounts
+in a date range, then download, decrypt and parse them concurrently and store all the
+transactions in DuckDB in one transaction.
+
+    python ingest.py --from 01-04-2024 --to 31-03-2025 --account XXXXXXXX6193 --account XXXXXXXX9469
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import logging
+
+import pandas as pd
+
+import metrics
+from duckdb_tools import DB_PATH, store_transactions_to_duckdb
+from utils import (
+    get_message_subject, statement_period, download_pdf_attachments, get_password_for_bank, decrypt_statement,
+    parse_icici_transactions,
+)
+from gmail_client import get_gmail_client
+import artifact_cache
+import tracing
+
+logger = logging.getLogger(__name__)
+
+# Threads used for the download, decrypt and parse stages
+INGEST_WORKERS = int(os.getenv("FINMATE_INGEST_WORKERS", "4"))
+
+# Statement mails arrive after the period they cover, so the mail search runs this much past the range end
+STATEMENT_MAIL_DELAY_DAYS = 35
+
+SENDERS = {"ICICI": "estatement@icicibank.com"}
+
+def _parse_date(value: str):
+    return datetime.strptime(value, "%d-%m-%Y").date()
+
+
+def _stage(report, name, items, seconds):
+    metrics.observe(f"ingest.{name}", seconds)
+    report["stages"][name] = {
+        "items": items,
+        "seconds": round(seconds, 3),
+        "per_second": round(items / seconds, 2) if seconds > 0 else None,
+    }
+    logger.info(f"Ingest stage {name}: {items} item(s) in {seconds:.2f}s")
+
+
+def _search(bank, account_no, start, end):
+    after = start.strftime("%Y/%m/%d")
+    before = (end + timedelta(days=STATEMENT_MAIL_DELAY_DAYS + 1)).strftime("%Y/%m/%d")
+    query = f'from:({SENDERS[bank.upper()]}) after:{after} before:{before} "{account_no}"'
+    logger.info(f"Bulk ingest search: {query}")
+    return [(account_no, m["id"]) for m in get_gmail_client().list_messages(query)]
+
+
+def _download(account_no, message_id, start, end, output_dir):
+    client = get_gmail_client()
+    msg = client.get_message(message_id)
+    period = statement_period(get_message_subject(msg))
+    # Skip statements whose period does not overlap the requested range
+    if period and (period[1] < start or period[0] > end):
+        return []
+    return [(account_no, path, period) for path in download_pdf_attachments(msg, client, output_dir)]
+
+
+def _decrypt(account_no, path, period, password):
+    return account_no, decrypt_statement(path, password), period
+
+
+def _parse(account_no, path, bank):
+    # Statements already ingested for this account are skipped entirely
+    if artifact_cache.lookup_parse(path, bank, account_no):
+        return None
+    return parse_icici_transactions(path, bank, account_no)
+
+
+def _coverage(bank, parsed):
+    # The statement period from the mail subject also covers the days without transactions
+    spans = []
+    for account_no, _, period, frame in parsed:
+        if period:
+            spans.append((bank, account_no, *period))
+        elif len(frame):
+            spans.append((bank, account_no, frame["date"].min().date(), frame["date"].max().date()))
+    return spans
+
+
+def bulk_ingest(start_date: str, end_date: str, account_nos, bank: str = "ICICI",
+                workers: int = INGEST_WORKERS, output_dir: str = "downloads", db_path: str = DB_PATH) -> dict:
+    """
+    Ingests every statement of `account_nos` overlapping start_date..end_date (dd-mm-yyyy).
+    Returns a report with the number of items and the throughput of every stage.
+    """
+    start, end = _parse_date(start_date), _parse_date(end_date)
+    password = get_password_for_bank(bank)
+    if not password:
+        raise ValueError(f"No password config found for bank: {bank}")
+
+    report = {"bank": bank, "accounts": list(account_nos), "date_range": f"{start_date} to {end_date}",
+              "stages": {}, "errors": []}
+    total_start = time.perf_counter()
+
+    # Workers run in the caller's context so their spans join the current trace
+    search = tracing.in_context(lambda a: _search(bank, a, start, end))
+    download, decrypt, parse = (tracing.in_context(fn) for fn in (_download, _decrypt, _parse))
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        t = time.perf_counter()
+        messages = [m for found in pool.map(search, account_nos) for m in found]
+        _stage(report, "search", len(messages), time.perf_counter() - t)
+
+        t = time.perf_counter()
+        futures = [pool.submit(download, a, mid, start, end, output_dir) for a, mid in messages]
+        downloaded = []
+        for (account_no, message_id), future in zip(messages, futures):
+            try:
+                downloaded.extend(future.result())
+            except Exception as e:
+                report["errors"].append(f"download {message_id}: {e}")
+        _stage(report, "download", len(downloaded), time.perf_counter() - t)
+
+        t = time.perf_counter()
+        futures = [pool.submit(decrypt, a, path, period, password) for a, path, period in downloaded]
+        decrypted = []
+        for (account_no, path, period), future in zip(downloaded, futures):
+            try:
+                decrypted.append(future.result())
+            except Exception as e:
+                report["errors"].append(f"decrypt {path}: {e}")
+        _stage(report, "decrypt", len(decrypted), time.perf_counter() - t)
+
+        t = time.perf_counter()
+        futures = [pool.submit(parse, a, path, bank) for a, path, period in decrypted]
+        parsed = []
+        report["cached"] = 0
+        for (account_no, path, period), future in zip(decrypted, futures):
+            try:
+                frame = future.result()
+            except Exception as e:
+                report["errors"].append(f"parse {path}: {e}")
+                continue
+            if frame is None:
+                report["cached"] += 1
+            else:
+                parsed.append((account_no, path, period, frame))
+        rows = sum(len(frame) for _, _, _, frame in parsed)
+        _stage(report, "parse", rows, time.perf_counter() - t)
+
+    t = time.perf_counter()
+    if parsed:
+        # One call, so every statement lands in a single DuckDB transaction
+        frames = [frame for _, _, _, frame in parsed]
+        report["store_result"] = store_transactions_to_duckdb(
+            pd.concat(frames, ignore_index=True), db_path, coverage=_coverage(bank, parsed)
+        )
+        for account_no, path, _, frame in parsed:
+            artifact_cache.record_parse(path, frame, bank, account_no)
+    else:
+        report["store_result"] = "No new transactions to insert"
+    _stage(report, "store", rows, time.perf_counter() - t)
+
+    report["statements"] = len(decrypted)
+    report["seconds"] = round(time.perf_counter() - total_start, 3)
+    return report
+
+
+def format_report(report: dict) -> str:
+    lines = [
+        f"Bulk ingest for {report['bank']} {', '.join(report['accounts'])} ({report['date_range']}): "
+        f"{report.get('statements', 0)} statement(s) ({report.get('cached', 0)} already ingested) "
+        f"in {report.get('seconds', 0)}s",
+        report.get("store_result", ""),
+    ]
+    for name, stage in report["stages"].items():
+        lines.append(f"- {name}: {stage['items']} in {stage['seconds']}s ({stage['per_second']}/s)")
+    for error in report["errors"]:
+        lines.append(f"! {error}")
+    return "\n".join(line for line in lines if line)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--from", dest="start_date", required=True, help="start date, dd-mm-yyyy")
+    ap.add_argument("--to", dest="end_date", required=True, help="end date, dd-mm-yyyy")
+    ap.add_argument("--account", dest="accounts", action="append", required=True, help="masked account number, repeatable")
+    ap.add_argument("--bank", default="ICICI")
+    ap.add_argument("--workers", type=int, default=INGEST_WORKERS)
+    args = ap.parse_args()
+
+    from logger import setup_logger
+    setup_logger()
+    report = bulk_ingest(args.start_date, args.end_date, args.accounts, args.bank, args.workers)
+    print(format_report(report))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,27 @@
 from fastapi import FastAPI
-from fastapi.responses import StreamingResponse
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
 from typing import Optional
 import asyncio
-from langchain_ollama import ChatOllama
 
-from graph import build_graph
+import contextlib
+from contextlib import asynccontextmanager
+from graph_registry import registry, get_graph, WARMUP_MODELS
+from db_pool import get_pool, pool_stats, close_all, shutdown_executor
+from duckdb_tools import DB_PATH, watch_monthly_rollup
+from pdf_extract import shutdown_pool
+import admission
+import artifact_cache
+import response_cache
 from logger import setup_logger
 import logging
-import json
 from schemas import QueryInfo
-from pprint import pformat
+from streaming import stream_chat_events, stream_chat_tokens, validated_query_trailer
+import sessions
+import metrics
+import tracing
+import tool_runner
 
 setup_logger()
 logger = logging.getLogger(__name__)
@@ -18,7 +29,27 @@ logger = logging.getLogger(__name__)
 # Use Ollama model
 # llm = ChatOllama(model="qwen3", temperature=0.7, stream=True)
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Compile the graphs for the common models before serving the first request
+    warmup = await asyncio.to_thread(registry.warm_up, WARMUP_MODELS)
+    logger.info(f"Graph warm-up: {warmup}")
+    get_pool(DB_PATH).open()
+    sweeper = asyncio.create_task(sessions.sweep_idle_threads())
+    # The incrementally maintained rollup is checked against the raw table at startup and then periodically
+    rollup_checker = asyncio.create_task(watch_monthly_rollup())
+    yield
+    sweeper.cancel()
+    rollup_checker.cancel()
+    # Release the shared DuckDB connection and cursors so the file lock is dropped on shutdown
+    tool_runner.shutdown_executor()
+    shutdown_executor()
+    close_all()
+    shutdown_pool()
+    sessions.close()
+    tracing.close()
+
+app = FastAPI(lifespan=lifespan)
 
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -38,10 +69,20 @@ class ChatRequest(BaseModel):
     messages: list[Message]
     model: str = "qwen3"
     validated_query: Optional[QueryInfo] = None
+    stream: bool = True
+    # Stream NDJSON events (token batches, think, tools, validated_query, timings) instead of plain text
+    events: bool = False
+    # With a thread_id the server keeps the conversation: send only the new message
+    thread_id: Optional[str] = None
 
 # Direct implementation of ollama chat models
 @app.post("/ollama")
 async def ollama(request: ChatRequest):
+    try:
+        slot = await admission.admit(f"ollama:{request.model}")
+    except admission.Overloaded as e:
+        return overloaded_response(e)
+    from langchain_ollama import ChatOllama
     llm = ChatOllama(model=request.model, temperature=0.7)
     messages = [{"role": "user", "content": request.user_message}]
 
@@ -49,70 +90,155 @@ async def ollama(request: ChatRequest):
         async for chunk in llm.astream(messages):
             yield chunk.content
 
-    return StreamingResponse(token_stream(), media_type="text/plain")
+    return StreamingResponse(admitted_stream(slot, token_stream()), media_type="text/plain",
+                             background=BackgroundTask(slot.release))
 
-# Langgraph implementation of chat models
-@app.post("/chat-notworking")
-async def chat(request: ChatRequest):
-    state = {
-        "messages": [{"role": "user", "content": request.user_message}]
-    }
-
-    graph = build_graph(request.model)
-
-    async def event_stream():
-        for chunk in graph.stream(state):
-            
-            # messages = chunk.get("chatbot")["messages"]
-            # msg = chunk.get("messages")[-1]
-            # yield msg.content
-            # await asyncio.sleep(0)
-            node_output = chunk.get("chatbot")
-            if node_output and "messages" in node_output:
-                last_msg = node_output["messages"][-1]
-                yield last_msg.content
-                await asyncio.sleep(0)
-
-    return StreamingResponse(event_stream(), media_type="text/plain")
+def overloaded_response(e: admission.Overloaded):
+    return JSONResponse(status_code=429, content={"detail": str(e), "backend": e.backend, "reason": e.reason},
+                        headers={"Retry-After": str(e.retry_after)})
 
+async def admitted_stream(slot, chunks):
+    """
+    Re-yields `chunks`, freeing the admission slot when the stream ends.
+    The response's background task frees it too, in case the stream never starts.
+    """
+    try:
+        async for chunk in chunks:
+            yield chunk
+    finally:
+        slot.release()
+
+# Langgraph implementation of chat models
 @app.post("/chat")
 async def stream_chat(request: ChatRequest):
     logger.info(f"\n{'=' * 60} START RUN {'=' * 60}")
-    logger.info(f"***Incoming Request: {request}")
+    logger.info(f"***Incoming Request: model={request.model} messages={len(request.messages)} "
+                f"thread_id={request.thread_id} stream={request.stream} events={request.events}")
+    # Every span of this request carries the trace id sent back in X-Trace-Id
+    trace_id = tracing.new_trace_id()
+    try:
+        # Requests for a busy model backend wait here, or are turned away when its queue is full
+        with tracing.span("admission", trace_id=trace_id, backend=admission.backend_of(request.model)):
+            slot = await admission.admit(request.model)
+    except admission.Overloaded as e:
+        return overloaded_response(e)
+    try:
+        return await run_chat(request, slot, trace_id)
+    except BaseException:
+        slot.release()
+        raise
+
+async def run_chat(request: ChatRequest, slot, trace_id: str):
     state = {
         "messages": [
             {"role": msg.role, "content": msg.content} for msg in request.messages
         ],
         "validated_query": request.validated_query.model_dump() if request.validated_query else None,
         }
-    logger.info(f"created state variable: \n {state}")
-    graph = build_graph(request.model)
-    final_state = await asyncio.to_thread(graph.invoke, state)
-    logger.info(f"=== FINAL STATE ===\n{pformat(final_state)}")
+    graph = get_graph(request.model)
+    config = None
+    headers = {"X-Trace-Id": trace_id}
+    if request.thread_id:
+        # The stored checkpoint already holds the history and the validated_query of the thread
+        graph = sessions.session_graph(graph)
+        config = sessions.session_config(request.thread_id)
+        headers["X-Thread-Id"] = request.thread_id
+        # Anything before the newest message is already part of the thread
+        state["messages"] = state["messages"][-1:]
+        if not request.validated_query:
+            state.pop("validated_query")
+    logger.info(f"created state with {len(state['messages'])} message(s), trace {trace_id}")
+    attrs = {"model": request.model, "thread_id": request.thread_id, "stream": request.stream,
+             "events": request.events}
+
+    if request.events:
+        # One JSON object per line; events always stream
+        chunks = session_turn(request.thread_id, stream_chat_events(graph, state, config, trace_id))
+        chunks = tracing.trace_stream(chunks, "request", trace_id=trace_id, **attrs)
+        return StreamingResponse(admitted_stream(slot, chunks), media_type="application/x-ndjson",
+                                 headers=headers, background=BackgroundTask(slot.release))
+
+    if request.stream:
+        # Forward chatbot tokens as the LLM produces them
+        chunks = session_turn(request.thread_id, stream_chat_tokens(graph, state, config))
+        chunks = tracing.trace_stream(chunks, "request", trace_id=trace_id, **attrs)
+        return StreamingResponse(admitted_stream(slot, chunks), media_type="text/plain", headers=headers,
+                                 background=BackgroundTask(slot.release))
+
+    with tracing.span("request", trace_id=trace_id, **attrs):
+        async with sessions_lock(request.thread_id):
+            # Nodes await the LLM and run DuckDB work on its own executor, so no thread is held per request
+            final_state = await graph.ainvoke(state, config)
+        if request.thread_id:
+            await asyncio.to_thread(sessions.compact_thread, request.thread_id)
+    slot.release()
+    logger.info(f"Final state: {len(final_state.get('messages', []))} messages")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"=== FINAL STATE ===\n{final_state}")
     last_msg = final_state["messages"][-1]
     full_response = last_msg.content if hasattr(last_msg, "content") else str(last_msg)
 
-    # serialize validated query
-    validated_query_json = ""
-    if "validated_query" in final_state and final_state["validated_query"]:
-        try:
-            if hasattr(final_state["validated_query"], "model_dump"):
-                validated_query_json = json.dumps(final_state["validated_query"].model_dump())
-            else:
-                validated_query_json = json.dumps(final_state["validated_query"])
-        except Exception as e:
-            logger.warning(f"Failed to encode validaed_query: {e}")
-        
-
     async def response_generator():
-        for char in full_response:
-            yield char
-            await asyncio.sleep(0.01)
-
-        if validated_query_json:
-            yield f"<END::validated_query:{validated_query_json}>"
-
-    return StreamingResponse(response_generator(), media_type="text/plain")
+        yield full_response
+        yield validated_query_trailer(final_state)
+
+    return StreamingResponse(response_generator(), media_type="text/plain", headers=headers)
+
+def sessions_lock(thread_id):
+    return sessions.thread_lock(thread_id) if thread_id else contextlib.nullcontext()
+
+async def session_turn(thread_id, chunks):
+    """Runs one streamed turn, holding the thread lock and compacting the thread afterwards."""
+    async with sessions_lock(thread_id):
+        async for chunk in chunks:
+            yield chunk
+    if thread_id:
+        await asyncio.to_thread(sessions.compact_thread, thread_id)
+
+@app.get("/graph-cache")
+async def graph_cache_stats():
+    return registry.stats()
+
+@app.delete("/graph-cache")
+async def invalidate_graph_cache(model: Optional[str] = None):
+    return {"invalidated": registry.invalidate(model)}
+
+@app.get("/db-pool")
+async def db_pool_stats():
+    return pool_stats()
+
+@app.get("/sessions")
+async def session_stats():
+    return await asyncio.to_thread(sessions.stats)
+
+@app.delete("/sessions/{thread_id}")
+async def delete_session(thread_id: str):
+    # Waits for a running turn of the thread, then deletes off the event loop
+    async with sessions.thread_lock(thread_id):
+        await asyncio.to_thread(sessions.delete_session, thread_id)
+    return {"deleted": thread_id}
+
+@app.get("/artifact-cache")
+async def artifact_cache_stats():
+    return await asyncio.to_thread(artifact_cache.stats)
+
+@app.get("/metrics")
+async def metrics_snapshot():
+    """p50/p95 latency per traced stage (request, node.*, llm.*, tool.*, gmail.*, ...) plus all counters and timers."""
+    return {"stages": tracing.stage_latencies(), "admission": admission.stats(), **metrics.snapshot()}
+
+@app.get("/admission")
+async def admission_stats():
+    return admission.stats()
+
+@app.get("/response-cache")
+async def response_cache_stats():
+    return response_cache.stats()
+
+@app.delete("/response-cache")
+async def clear_response_cache():
+    response_cache.clear()
+    return response_cache.stats()
 
 if __name__=="__main__":
     logger.info("logging test")
\ No newline at end of file
@@ -0,0 +1,75 @@
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+# Keep only the most recent samples per timer so memory stays bounded
+MAX_SAMPLES = 2048
+
+_lock = threading.Lock()
+_counters = defaultdict(int)
+_gauges = {}
+_samples = defaultdict(lambda: deque(maxlen=MAX_SAMPLES))
+
+
+def incr(name: str, value: int = 1):
+    """Increments the counter `name` by `value`."""
+    with _lock:
+        _counters[name] += value
+
+
+def gauge(name: str, value: float):
+    """Sets the current value of `name`, e.g. a queue depth; not a timing."""
+    with _lock:
+        _gauges[name] = value
+
+
+def observe(name: str, seconds: float):
+    """Records one timing sample (in seconds) for `name`."""
+    with _lock:
+        _samples[name].append(seconds)
+
+
+@contextmanager
+def timer(name: str):
+    """Context manager that records the elapsed wall time of the block under `name`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start)
+
+
+def percentile(values, pct: float) -> float:
+    """Nearest-rank percentile of `values` (pct in 0-100). Returns 0.0 for no values."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def snapshot() -> dict:
+    """Returns the current counters, gauges and timing summaries (milliseconds)."""
+    with _lock:
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+        samples = {name: list(values) for name, values in _samples.items()}
+
+    timings = {}
+    for name, values in samples.items():
+        timings[name] = {
+            "count": len(values),
+            "p50_ms": round(percentile(values, 50) * 1000, 3),
+            "p95_ms": round(percentile(values, 95) * 1000, 3),
+            "max_ms": round(max(values) * 1000, 3) if values else 0.0,
+        }
+    return {"counters": counters, "gauges": gauges, "timings": timings}
+
+
+def reset():
+    """Clears all counters, gauges and timings. Mostly useful in tests."""
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _samples.clear()
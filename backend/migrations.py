@@ -0,0 +1,237 @@
+"""
+Schema migrations for the finance database.
+
+The applied version is kept in finmate_meta ('schema_version'). Each migration runs in
+its own transaction together with the version bump, so a failed step leaves the
+database at the previous version.
+
+    python migrations.py                 # migrate finance.db
+    python migrations.py export-cold 2024  # move transactions before 2024 to Parquet
+"""
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Physical table the transactions are written to. `transactions` is a view over it and,
+# once years have been exported, over the cold Parquet files as well.
+HOT_TABLE = "transactions_hot"
+COLD_VIEW = "transactions_cold"
+
+TXN_TYPES = ("DEBIT", "CREDIT", "BALANCE")
+
+# Sort order of transactions_hot. Masked account numbers all start with 'XXXXXXXX' and
+# DuckDB keeps only an 8 byte prefix of strings in its zone maps, so leading with
+# account_no would leave every row group spanning all dates. Month first keeps the date
+# min/max of each row group tight; inside a month an account's rows sit together.
+CLUSTER_ORDER = "date_trunc('month', date), account_no, date, seq"
+
+# Column list of the transactions view, in order
+VIEW_COLUMNS = ["date", "description", "amount", "balance", "mode", "type", "receiver", "bank", "account_no",
+                "txn_key", "seq"]
+
+
+def schema_version(con) -> int:
+    row = con.execute("SELECT value FROM finmate_meta WHERE key = 'schema_version'").fetchone()
+    return int(row[0]) if row else 0
+
+
+def cold_storage_dir(con):
+    """Directory holding the exported Parquet partitions, or None when nothing was exported."""
+    row = con.execute("SELECT value FROM finmate_meta WHERE key = 'cold_storage_dir'").fetchone()
+    return row[0] if row else None
+
+
+def _parquet_glob(directory: str) -> str:
+    return os.path.join(directory, "**", "*.parquet").replace("'", "''")
+
+
+def create_transactions_view(con, cold_dir: str = None):
+    """(Re)creates the `transactions` view: the hot table, plus the Parquet partitions under `cold_dir`."""
+    columns = ", ".join(VIEW_COLUMNS)
+    sql = f"SELECT {columns} FROM {HOT_TABLE}"
+    if cold_dir:
+        con.execute(f"""
+            CREATE OR REPLACE VIEW {COLD_VIEW} AS
+            SELECT CAST(date AS DATE) AS date, description, amount, balance, mode, CAST(type AS txn_type) AS type,
+                   receiver, bank, account_no, txn_key, seq, year
+            FROM read_parquet('{_parquet_glob(cold_dir)}', hive_partitioning = true,
+                              hive_types = {{'account_no': VARCHAR, 'year': BIGINT}})
+        """)
+        sql += f" UNION ALL SELECT {columns} FROM {COLD_VIEW}"
+    con.execute(f"CREATE OR REPLACE VIEW transactions AS {sql}")
+
+
+def _clustered_layout(con):
+    """
+    Moves the flat transactions table to the clustered transactions_hot table: rows sorted by
+    CLUSTER_ORDER so DuckDB's per-row-group min/max (zone maps) skip other months, `type` as
+    an ENUM, and a `seq` column keeping the statement order within a day.
+    """
+    con.execute(f"CREATE TYPE IF NOT EXISTS txn_type AS ENUM {TXN_TYPES}")
+    unknown = con.execute(
+        f"SELECT count(*) FROM transactions WHERE type IS NOT NULL AND upper(type) NOT IN {TXN_TYPES}"
+    ).fetchone()[0]
+    if unknown:
+        logger.warning(f"{unknown} transactions have an unknown type; it is stored as NULL")
+    con.execute("DROP INDEX IF EXISTS transactions_txn_key_idx")
+    con.execute(f"""
+        CREATE TABLE {HOT_TABLE} (
+            date DATE,
+            description VARCHAR,
+            amount DOUBLE,
+            balance DOUBLE,
+            mode VARCHAR,
+            type txn_type,
+            receiver VARCHAR,
+            bank VARCHAR,
+            account_no VARCHAR,
+            txn_key VARCHAR,
+            seq BIGINT
+        )
+    """)
+    con.execute(f"""
+        INSERT INTO {HOT_TABLE}
+        SELECT date, description, amount, balance, mode, TRY_CAST(upper(type) AS txn_type), receiver,
+               bank, account_no, txn_key, row_number() OVER (ORDER BY rowid) AS seq
+        FROM transactions
+        ORDER BY {CLUSTER_ORDER}
+    """)
+    last_seq = con.execute(f"SELECT coalesce(max(seq), 0) FROM {HOT_TABLE}").fetchone()[0]
+    con.execute(f"CREATE SEQUENCE IF NOT EXISTS txn_seq START {last_seq + 1}")
+    con.execute("DROP TABLE transactions")
+    create_transactions_view(con)
+
+
+# (version, description, function); append only, never reorder
+MIGRATIONS = [
+    (1, "clustered transactions_hot table with txn_type enum", _clustered_layout),
+]
+
+
+@contextmanager
+def transaction(con):
+    """Runs the block in one transaction on `con`, rolling it back if the block raises."""
+    con.execute("BEGIN TRANSACTION")
+    try:
+        yield con
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+
+
+def migrate(con) -> list:
+    """Applies the pending migrations on `con` (outside any transaction). Returns the versions applied."""
+    applied = []
+    current = schema_version(con)
+    for version, description, step in MIGRATIONS:
+        if version <= current:
+            continue
+        logger.info(f"Applying schema migration {version}: {description}")
+        with transaction(con):
+            step(con)
+            con.execute("INSERT OR REPLACE INTO finmate_meta VALUES ('schema_version', ?)", [str(version)])
+        applied.append(version)
+    return applied
+
+
+def recluster(con, txn_key_sql: str = None) -> int:
+    """
+    Rewrites transactions_hot in CLUSTER_ORDER, e.g. after many appends.
+    With `txn_key_sql` the keys are recomputed with that expression and only the first
+    row (by seq) of every key is kept. Rewriting is much cheaper for later scans than
+    updating every row in place. Run it inside a transaction: the old table is dropped
+    before the new one is renamed. Returns the number of rows dropped as duplicates.
+    """
+    before = con.execute(f"SELECT count(*) FROM {HOT_TABLE}").fetchone()[0]
+    select = f"SELECT * FROM {HOT_TABLE}"
+    if txn_key_sql:
+        select = (f"SELECT * REPLACE ({txn_key_sql} AS txn_key) FROM {HOT_TABLE} "
+                  f"QUALIFY row_number() OVER (PARTITION BY {txn_key_sql} ORDER BY seq) = 1")
+    con.execute(f"CREATE TABLE {HOT_TABLE}_sorted AS {select} ORDER BY {CLUSTER_ORDER}")
+    con.execute("DROP INDEX IF EXISTS transactions_txn_key_idx")
+    con.execute(f"DROP TABLE {HOT_TABLE}")
+    con.execute(f"ALTER TABLE {HOT_TABLE}_sorted RENAME TO {HOT_TABLE}")
+    con.execute(f"CREATE UNIQUE INDEX transactions_txn_key_idx ON {HOT_TABLE} (txn_key)")
+    return before - con.execute(f"SELECT count(*) FROM {HOT_TABLE}").fetchone()[0]
+
+
+def export_cold(con, before_year: int, directory: str) -> list:
+    """
+    Copies transactions dated before `before_year` to Parquet files partitioned as
+    account_no=<account>/year=<year>/ under `directory`, deletes them from the hot table
+    and points the views at both. Returns (account_no, year, rows) for every partition written.
+
+    Run it outside any transaction. A file write cannot be rolled back, so the files are
+    written to a staging directory next to `directory`, moved in just before the commit
+    and removed again if the transaction fails.
+    """
+    before_year = int(before_year)
+    where = f"year(date) < {before_year} AND account_no IS NOT NULL"
+    directory = os.path.abspath(directory)
+    os.makedirs(directory, exist_ok=True)
+    # A sibling, since the cold view's glob would also read a staging directory inside `directory`
+    staging = tempfile.mkdtemp(prefix=f".{os.path.basename(directory)}-staging-", dir=os.path.dirname(directory))
+    placed = []
+    try:
+        with transaction(con):
+            moved = con.execute(f"""
+                SELECT account_no, year(date) AS year, count(*) FROM {HOT_TABLE} WHERE {where}
+                GROUP BY ALL ORDER BY ALL
+            """).fetchall()
+            if not moved:
+                return []
+            # Unique file names, so earlier exports of the same partition are kept
+            con.execute(f"""
+                COPY (SELECT *, year(date) AS year FROM {HOT_TABLE} WHERE {where} ORDER BY account_no, date, seq)
+                TO '{staging.replace("'", "''")}'
+                (FORMAT parquet, PARTITION_BY (account_no, year), FILENAME_PATTERN 'part_{{uuid}}')
+            """)
+            for root, _, files in os.walk(staging):
+                target_dir = os.path.join(directory, os.path.relpath(root, staging))
+                for name in files:
+                    os.makedirs(target_dir, exist_ok=True)
+                    os.replace(os.path.join(root, name), os.path.join(target_dir, name))
+                    placed.append(os.path.join(target_dir, name))
+            con.execute(f"DELETE FROM {HOT_TABLE} WHERE {where}")
+            con.execute("INSERT OR REPLACE INTO finmate_meta VALUES ('cold_storage_dir', ?)", [directory])
+            create_transactions_view(con, directory)
+    except Exception:
+        # The rows are still in the hot table; files left in place would duplicate them
+        for path in placed:
+            os.remove(path)
+        raise
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    return moved
+
+
+def cold_key_filter(con, partitions: list) -> str:
+    """
+    SQL condition excluding txn_keys already exported to Parquet, reading only the
+    partitions of `partitions` ((account_no, year) pairs) instead of every cold file.
+    Empty when nothing was exported or no pair can be in cold storage.
+    """
+    partitions = sorted({(a, int(y)) for a, y in partitions if a is not None and y is not None})
+    if not partitions or not cold_storage_dir(con):
+        return ""
+    # Constant lists, so DuckDB prunes the hive partitions before opening any file
+    accounts = sorted({a for a, _ in partitions})
+    years = sorted({y for _, y in partitions})
+    quoted = ", ".join("'" + a.replace("'", "''") + "'" for a in accounts)
+    return (f"txn_key NOT IN (SELECT txn_key FROM {COLD_VIEW} "
+            f"WHERE account_no IN ({quoted}) AND year IN ({', '.join(map(str, years))}))")
+
+
+if __name__ == "__main__":
+    import sys
+    from duckdb_tools import DB_PATH, init_duckdb, export_cold_years
+
+    init_duckdb(DB_PATH)
+    if sys.argv[1:2] == ["export-cold"]:
+        for account_no, year, rows in export_cold_years(int(sys.argv[2])):
+            print(f"{account_no} {year}: {rows} rows")
@@ -0,0 +1,81 @@
+import os
+import math
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Worker processes used for page text extraction. 1 extracts in the calling process.
+PDF_WORKERS = int(os.getenv("FINMATE_PDF_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# Statements with fewer pages than this are extracted in-process; the pool round trip costs more
+MIN_PAGES_FOR_POOL = int(os.getenv("FINMATE_PDF_MIN_PAGES_FOR_POOL", "2"))
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def extract_page_range(path: str, start: int, end: int) -> list:
+    """Returns the text lines of pages [start, end) of the PDF, one list per page."""
+    import pdfplumber
+    pages = []
+    with pdfplumber.open(path) as pdf:
+        for page in pdf.pages[start:end]:
+            text = page.extract_text()
+            pages.append(text.split("\n") if text else [])
+    return pages
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            # spawn: the server process holds threads and open DuckDB handles that must not be forked
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            _pool_workers = workers
+        return _pool
+
+
+def extract_pdf_pages(path: str, workers: int = None) -> list:
+    """
+    Extracts the text lines of every page of the PDF, one list per page in page order.
+    Page ranges are spread over a process pool when there are enough pages; the results
+    are merged back in order, so the running balance still flows from page to page when
+    the lines are parsed.
+    """
+    # Imported here so that the server (which only needs shutdown_pool) starts without pdfplumber
+    import pdfplumber
+    workers = PDF_WORKERS if workers is None else workers
+    with pdfplumber.open(path) as pdf:
+        page_count = len(pdf.pages)
+
+    if workers <= 1 or page_count < max(2, MIN_PAGES_FOR_POOL):
+        logger.info(f"Extracting {page_count} page(s) from {path} in-process")
+        return extract_page_range(path, 0, page_count)
+
+    workers = min(workers, page_count)
+    chunk = math.ceil(page_count / workers)
+    starts = list(range(0, page_count, chunk))
+    ends = [min(s + chunk, page_count) for s in starts]
+    logger.info(f"Extracting {page_count} pages from {path} with {len(starts)} worker process(es)")
+
+    pages = []
+    for chunk_pages in _get_pool(workers).map(extract_page_range, [path] * len(starts), starts, ends):
+        pages.extend(chunk_pages)
+    return pages
+
+
+def shutdown_pool():
+    """Stops the extraction worker processes, if any were started."""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True)
+            logger.info("Stopped PDF extraction process pool")
+        _pool = None
+        _pool_workers = 0
@@ -0,0 +1,152 @@
+import re
+from calendar import monthrange
+from datetime import date, datetime
+import logging
+
+from schemas import QueryInfo
+
+logger = logging.getLogger(__name__)
+
+BANKS = ["ICICI", "HDFC", "SBI", "AXIS", "KOTAK"]
+
+MONTH_NAMES = ["January", "February", "March", "April", "May", "June",
+               "July", "August", "September", "October", "November", "December"]
+MONTHS = {name.lower(): i for i, name in enumerate(MONTH_NAMES, 1)}
+
+# Fields the graph needs before it can run the chatbot
+REQUIRED_FIELDS = ("bank", "month", "account_no")
+
+BANK_RE = re.compile(r"\b(" + "|".join(BANKS) + r")\b", re.IGNORECASE)
+# Masked (XXXXXXXX6193) or plain (123456786193) account numbers
+ACCOUNT_RE = re.compile(r"\b(?:[Xx*]{4,}\d{4}|\d{8,18})\b")
+DATE_RANGE_RE = re.compile(r"(\d{2})[-/](\d{2})[-/](\d{4})\s*(?:to|-|until|till)\s*(\d{2})[-/](\d{2})[-/](\d{4})")
+YEAR_RE = re.compile(r"\b(20\d{2})\b")
+# Full names and common abbreviations. "may" on its own is too common a word, so it
+# only counts when capitalised or followed by a year.
+MONTH_RE = re.compile(
+    r"(?i:\b(?:january|february|march|april|june|july|august|september|october|november|december"
+    r"|jan|feb|mar|apr|jun|jul|aug|sept|sep|oct|nov|dec)\b)"
+    r"|\bMAY\b|\bMay\b|(?i:\bmay(?=\s+20\d{2}\b))"
+)
+INTENTS = [
+    (re.compile(r"\b(spen[dt]|spending|expense|expenses|debit|paid)\b", re.IGNORECASE), "get spending details"),
+    (re.compile(r"\b(income|credit|credited|received|salary)\b", re.IGNORECASE), "get credit details"),
+    (re.compile(r"\b(balance)\b", re.IGNORECASE), "get balance details"),
+    (re.compile(r"\b(statement|fetch|download)\b", re.IGNORECASE), "fetch statement"),
+]
+
+
+def month_number(name: str):
+    """1-12 for a month name or an abbreviation of at least 3 letters, else None."""
+    name = (name or "").strip().lower()
+    if len(name) < 3:
+        return None
+    return next((num for full, num in MONTHS.items() if full.startswith(name)), None)
+
+
+def month_period(month: str, year: str):
+    """(start, end) dates covering every month named in `month` ("May", "May and June") of `year`."""
+    numbers = [month_number(part) for part in re.split(r"\s*(?:,|\band\b|&|\bto\b|-)\s*", month or "") if part]
+    numbers = [n for n in numbers if n]
+    if not numbers or not (year or "").strip().isdigit():
+        return None
+    year = int(year)
+    first, last = min(numbers), max(numbers)
+    return date(year, first, 1), date(year, last, monthrange(year, last)[1])
+
+
+def parse_date_range(text: str):
+    """(start, end) of a 'dd-mm-yyyy to dd-mm-yyyy' range in `text`, or None."""
+    m = DATE_RANGE_RE.search(text or "")
+    if not m:
+        return None
+    d1, m1, y1, d2, m2, y2 = (int(g) for g in m.groups())
+    try:
+        start, end = date(y1, m1, d1), date(y2, m2, d2)
+    except ValueError:
+        return None
+    return (start, end) if start <= end else None
+
+
+def format_range(period) -> str:
+    start, end = period
+    return f"{start:%d-%m-%Y} to {end:%d-%m-%Y}"
+
+
+def query_hint(bank: str, period, account_no: str):
+    if not (bank and period and account_no):
+        return None
+    start, end = period
+    return f"subject:{bank} Bank Statement from {start:%d-%m-%Y} to {end:%d-%m-%Y} for {account_no}"
+
+
+def _mask(account: str) -> str:
+    return "XXXXXXXX" + account[-4:]
+
+
+def extract_query_info(text: str) -> QueryInfo:
+    """
+    Rule-based QueryInfo for the user's message: bank, masked account numbers, months,
+    year, explicit date ranges and a coarse intent. Fields not found are None.
+    """
+    text = text or ""
+    bank = BANK_RE.search(text)
+    accounts = list(dict.fromkeys(_mask(a) for a in ACCOUNT_RE.findall(text)))
+    months = list(dict.fromkeys(MONTH_NAMES[month_number(m.group(0)) - 1] for m in MONTH_RE.finditer(text)))
+    year = YEAR_RE.search(DATE_RANGE_RE.sub("", text))
+    period = parse_date_range(text)
+    intent = next((name for pattern, name in INTENTS if pattern.search(text)), None)
+
+    if period and not months:
+        months = list(dict.fromkeys(MONTH_NAMES[m - 1] for m in (period[0].month, period[1].month)))
+    return QueryInfo(
+        intent=intent,
+        bank=bank.group(1).upper() if bank else None,
+        account_no=", ".join(accounts) or None,
+        month=" and ".join(months) or None,
+        year=year.group(1) if year else (str(period[0].year) if period else None),
+        date_range=format_range(period) if period else None,
+    )
+
+
+def missing_fields(query: QueryInfo) -> list:
+    return [field for field in REQUIRED_FIELDS if not getattr(query, field)]
+
+
+def merge_query_info(*queries) -> QueryInfo:
+    """Merges QueryInfo objects or dicts; earlier arguments win, later ones fill the blanks."""
+    merged = {}
+    for query in queries:
+        if query is None:
+            continue
+        values = query.model_dump() if isinstance(query, QueryInfo) else dict(query)
+        for key, value in values.items():
+            if merged.get(key) in (None, "") and value not in (None, ""):
+                merged[key] = value
+    return QueryInfo(**merged)
+
+
+def period_changed(query: QueryInfo, previous: dict) -> bool:
+    """True when `query` names a month, year or range other than the previous turn's."""
+    return any(getattr(query, field) != (previous or {}).get(field) for field in ("month", "year", "date_range"))
+
+
+def complete_query_info(query: QueryInfo, keep_range: bool = False, today: datetime = None) -> QueryInfo:
+    """
+    Fills the derived fields: the current year for a month without one, date_range from
+    month/year and the Gmail query_hint. With `keep_range` (the user gave an explicit range,
+    or named no new period this turn) the date_range of `query` is kept as it is.
+    """
+    today = today or datetime.today()
+    values = query.model_dump()
+    if values.get("month") and not values.get("year"):
+        values["year"] = str(today.year)
+    period = None if keep_range and values.get("date_range") else month_period(values.get("month"), values.get("year"))
+    if period:
+        values["date_range"] = format_range(period)
+    else:
+        period = parse_date_range(values.get("date_range"))
+    accounts = [a.strip() for a in (values.get("account_no") or "").split(",") if a.strip()]
+    if period and len(accounts) == 1:
+        values["query_hint"] = query_hint(values.get("bank"), period, accounts[0])
+    return QueryInfo(**values)
@@ -0,0 +1,92 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+import logging
+
+import metrics
+import duckdb_tools
+from schemas import QueryInfo
+
+logger = logging.getLogger(__name__)
+
+# Answers remembered in memory, least recently used evicted first
+RESPONSE_CACHE_SIZE = int(os.getenv("FINMATE_RESPONSE_CACHE_SIZE", "256"))
+
+_responses = OrderedDict()
+_lock = threading.Lock()
+_hits = 0
+_misses = 0
+
+
+def _normalize(value) -> str:
+    return re.sub(r"\s+", " ", str(value or "")).strip().lower()
+
+
+def _accounts(query: QueryInfo) -> list:
+    return sorted({a.strip() for a in (query.account_no or "").split(",") if a.strip()})
+
+
+def cache_key(query: QueryInfo, question: str, db_path: str = None):
+    """
+    Key for the answer to `question` about `query`: the normalized question text, intent, bank,
+    accounts and date_range plus the current data_version of every account, so storing new
+    transactions invalidates it. Two questions about the same month and account (total
+    spending, spending on Zomato) get different keys.
+    None when the query is too vague to be answered from the cache.
+    """
+    if query is None or not _normalize(question):
+        return None
+    db_path = db_path or duckdb_tools.DB_PATH
+    accounts = _accounts(query)
+    if not (query.intent and query.bank and accounts and query.date_range):
+        return None
+    versions = tuple(duckdb_tools.data_version(query.bank, account_no, db_path) for account_no in accounts)
+    return (_normalize(question), _normalize(query.intent), query.bank.strip().upper(), tuple(accounts),
+            _normalize(query.date_range), versions)
+
+
+def get(key):
+    """The cached answer for `key`, or None."""
+    global _hits, _misses
+    if key is None:
+        return None
+    with _lock:
+        response = _responses.get(key)
+        if response is None:
+            _misses += 1
+        else:
+            _responses.move_to_end(key)
+            _hits += 1
+    metrics.incr("response_cache.hit" if response is not None else "response_cache.miss")
+    return response
+
+
+def put(key, response: str):
+    if key is None or not response:
+        return
+    with _lock:
+        _responses[key] = response
+        _responses.move_to_end(key)
+        while len(_responses) > RESPONSE_CACHE_SIZE:
+            _responses.popitem(last=False)
+            metrics.incr("response_cache.evicted")
+
+
+def stats() -> dict:
+    with _lock:
+        lookups = _hits + _misses
+        return {
+            "entries": len(_responses),
+            "max_entries": RESPONSE_CACHE_SIZE,
+            "hits": _hits,
+            "misses": _misses,
+            "hit_rate": round(_hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+def clear():
+    global _hits, _misses
+    with _lock:
+        _responses.clear()
+        _hits = _misses = 0
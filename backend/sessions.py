@@ -0,0 +1,200 @@
+"""
+Server-side conversation sessions.
+
+A chat request that carries a `thread_id` runs the graph with a checkpointer, so the
+client sends only its new message and the graph resumes from the stored state of the
+thread. Checkpoints live in a local SQLite file; threads idle for longer than
+SESSION_TTL_SECONDS are deleted.
+"""
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+import weakref
+import logging
+
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+SESSION_DB_PATH = os.getenv("FINMATE_SESSION_DB", "sessions.db")
+
+# Threads untouched for this long are deleted by the sweeper
+SESSION_TTL_SECONDS = int(os.getenv("FINMATE_SESSION_TTL_SECONDS", str(24 * 3600)))
+SESSION_SWEEP_SECONDS = int(os.getenv("FINMATE_SESSION_SWEEP_SECONDS", "600"))
+
+# Non-LangChain types kept in the graph state, allowed through checkpoint deserialization
+STATE_TYPES = [("schemas", "QueryInfo")]
+
+
+class SessionSaver(SqliteSaver):
+    """
+    The upstream SqliteSaver, with its sync methods run in a worker thread for the async API
+    (streamed turns) and a `threads` table recording when each thread was last written.
+    """
+
+    def __init__(self, path: str = SESSION_DB_PATH):
+        super().__init__(sqlite3.connect(path, check_same_thread=False),
+                         serde=JsonPlusSerializer(allowed_msgpack_modules=STATE_TYPES))
+        self.path = path
+
+    def setup(self):
+        # Runs under self.lock, from SqliteSaver.cursor()
+        if self.is_setup:
+            return
+        super().setup()
+        self.conn.execute("CREATE TABLE IF NOT EXISTS threads (thread_id TEXT PRIMARY KEY, last_access REAL)")
+        self.conn.commit()
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        # Touched first: a crash in between leaves a row the sweeper can still evict
+        with self.cursor() as cur:
+            cur.execute("INSERT OR REPLACE INTO threads VALUES (?, ?)",
+                        (str(config["configurable"]["thread_id"]), time.time()))
+        return super().put(config, checkpoint, metadata, new_versions)
+
+    def delete_thread(self, thread_id):
+        super().delete_thread(thread_id)
+        with self.cursor() as cur:
+            cur.execute("DELETE FROM threads WHERE thread_id = ?", (str(thread_id),))
+
+    def prune(self, thread_ids, *, strategy="keep_latest"):
+        """Drops every checkpoint but the latest of each thread (each checkpoint holds its full state)."""
+        for thread_id in thread_ids:
+            if strategy == "delete":
+                self.delete_thread(thread_id)
+                continue
+            latest = self.get_tuple({"configurable": {"thread_id": thread_id}})
+            if latest is None:
+                continue
+            keep_id = latest.config["configurable"]["checkpoint_id"]
+            with self.cursor() as cur:
+                for table in ("checkpoints", "writes"):
+                    cur.execute(f"DELETE FROM {table} WHERE thread_id = ? AND checkpoint_ns = '' "
+                                f"AND checkpoint_id <> ?", (str(thread_id), keep_id))
+
+    def idle_threads(self, ttl_seconds: float) -> list:
+        cutoff = time.time() - ttl_seconds
+        with self.cursor(transaction=False) as cur:
+            return [r[0] for r in cur.execute("SELECT thread_id FROM threads WHERE last_access < ?", (cutoff,))]
+
+    def thread_count(self) -> int:
+        with self.cursor(transaction=False) as cur:
+            return cur.execute("SELECT count(*) FROM threads").fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    async def aget_tuple(self, config):
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        items = await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for item in items:
+            yield item
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        return await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id):
+        return await asyncio.to_thread(self.delete_thread, thread_id)
+
+    async def aprune(self, thread_ids, *, strategy="keep_latest"):
+        return await asyncio.to_thread(self.prune, thread_ids, strategy=strategy)
+
+    async def aget_delta_channel_history(self, *, config, channels):
+        return await asyncio.to_thread(self.get_delta_channel_history, config=config, channels=channels)
+
+
+_checkpointer = None
+_checkpointer_lock = threading.Lock()
+_session_graphs = weakref.WeakKeyDictionary()
+_thread_locks = weakref.WeakValueDictionary()
+
+
+def get_checkpointer() -> SessionSaver:
+    global _checkpointer
+    with _checkpointer_lock:
+        if _checkpointer is None:
+            _checkpointer = SessionSaver(SESSION_DB_PATH)
+            logger.info(f"Session checkpoints stored in {SESSION_DB_PATH}")
+        return _checkpointer
+
+
+def session_graph(graph):
+    """The compiled `graph` bound to the session checkpointer (a cheap copy, not a rebuild)."""
+    with _checkpointer_lock:
+        bound = _session_graphs.get(graph)
+    if bound is None:
+        bound = graph.copy(update={"checkpointer": get_checkpointer()})
+        with _checkpointer_lock:
+            _session_graphs[graph] = bound
+    return bound
+
+
+def session_config(thread_id: str) -> dict:
+    return {"configurable": {"thread_id": thread_id}}
+
+
+def thread_lock(thread_id: str) -> asyncio.Lock:
+    """Serializes turns of one thread, so two requests never resume the same checkpoint."""
+    with _checkpointer_lock:
+        lock = _thread_locks.get(thread_id)
+        if lock is None:
+            lock = _thread_locks[thread_id] = asyncio.Lock()
+        return lock
+
+
+def compact_thread(thread_id: str):
+    """Keeps only the latest checkpoint of the thread once a turn is done."""
+    get_checkpointer().prune([thread_id])
+
+
+def evict_idle(ttl_seconds: float = None) -> int:
+    """Deletes threads idle for longer than `ttl_seconds` (SESSION_TTL_SECONDS by default)."""
+    ttl_seconds = SESSION_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+    saver = get_checkpointer()
+    idle = saver.idle_threads(ttl_seconds)
+    for thread_id in idle:
+        saver.delete_thread(thread_id)
+    if idle:
+        metrics.incr("sessions.evicted", len(idle))
+        logger.info(f"Evicted {len(idle)} idle session thread(s)")
+    return len(idle)
+
+
+async def sweep_idle_threads(interval: float = SESSION_SWEEP_SECONDS):
+    """Runs evict_idle every `interval` seconds until cancelled."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(evict_idle)
+        except Exception as e:
+            logger.warning(f"Session sweep failed: {e}")
+
+
+def delete_session(thread_id: str):
+    """Deletes every checkpoint of the thread."""
+    get_checkpointer().delete_thread(thread_id)
+
+
+def stats() -> dict:
+    return {"threads": get_checkpointer().thread_count(), "ttl_seconds": SESSION_TTL_SECONDS,
+            "db_path": SESSION_DB_PATH}
+
+
+def close():
+    global _checkpointer
+    with _checkpointer_lock:
+        if _checkpointer is not None:
+            _checkpointer.close()
+        _checkpointer = None
+        _session_graphs.clear()
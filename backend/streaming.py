@@ -0,0 +1,280 @@
+import json
+import os
+import time
+import logging
+
+from langchain_core.messages import AIMessage, AIMessageChunk, ToolMessage
+
+logger = logging.getLogger(__name__)
+
+# Only tokens produced by these graph nodes are forwarded to the client.
+# The validate node also calls the LLM (structured output), which must not leak into the answer.
+STREAMED_NODES = {"chatbot"}
+
+# Event streams send tokens in batches: a batch goes out once it holds STREAM_CHUNK_CHARS
+# characters or its first token is STREAM_FLUSH_SECONDS old, whichever comes first
+STREAM_CHUNK_CHARS = int(os.getenv("FINMATE_STREAM_CHUNK_CHARS", "48"))
+STREAM_FLUSH_SECONDS = float(os.getenv("FINMATE_STREAM_FLUSH_SECONDS", "0.05"))
+
+THINK_OPEN, THINK_CLOSE = "<think>", "</think>"
+
+
+def content_text(content) -> str:
+    """Returns the plain text of a message content which may be a string or a list of content blocks."""
+    if isinstance(content, str):
+        return content
+    parts = []
+    for block in content or []:
+        if isinstance(block, str):
+            parts.append(block)
+        elif isinstance(block, dict) and block.get("type") == "text":
+            parts.append(block.get("text", ""))
+    return "".join(parts)
+
+
+def validated_query_of(final_state):
+    """The validated_query of the final graph state as a plain dict, or None."""
+    if not final_state or not final_state.get("validated_query"):
+        return None
+    validated_query = final_state["validated_query"]
+    return validated_query.model_dump() if hasattr(validated_query, "model_dump") else validated_query
+
+
+def encode_validated_query(final_state) -> str:
+    """Serializes the validated_query of the final graph state to JSON, or returns an empty string."""
+    validated_query = validated_query_of(final_state)
+    if not validated_query:
+        return ""
+    try:
+        return json.dumps(validated_query)
+    except Exception as e:
+        logger.warning(f"Failed to encode validaed_query: {e}")
+        return ""
+
+
+def unstreamed_reply(final_state, streamed_ids) -> str:
+    """The last message of the run when its tokens were not streamed (clarify, confirm, cached answers)."""
+    logger.info(f"Final state: {len(final_state.get('messages', [])) if final_state else 0} messages")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"=== FINAL STATE ===\n{final_state}")
+    if not final_state or not final_state.get("messages"):
+        return ""
+    last_msg = final_state["messages"][-1]
+    if getattr(last_msg, "id", None) in streamed_ids:
+        return ""
+    return content_text(last_msg.content) if hasattr(last_msg, "content") else str(last_msg)
+
+
+def validated_query_trailer(final_state) -> str:
+    """The `<END::validated_query:...>` trailer the frontend reads to keep its query context."""
+    validated_query_json = encode_validated_query(final_state)
+    return f"<END::validated_query:{validated_query_json}>" if validated_query_json else ""
+
+
+async def stream_chat_tokens(graph, state, config=None):
+    """
+    Runs the graph with `astream` and yields answer text as soon as the chatbot produces it.
+    Messages from nodes that do not stream (clarify, confirm, validate) are yielded once the
+    run finishes, followed by the validated_query trailer.
+    """
+    streamed_ids = set()
+    final_state = None
+
+    async for mode, chunk in graph.astream(state, config=config, stream_mode=["messages", "values"]):
+        if mode == "messages":
+            message, metadata = chunk
+            if metadata.get("langgraph_node") not in STREAMED_NODES or not isinstance(message, AIMessageChunk):
+                continue
+            text = content_text(message.content)
+            if text:
+                streamed_ids.add(message.id)
+                yield text
+        else:
+            final_state = chunk
+
+    reply = unstreamed_reply(final_state, streamed_ids)
+    if reply:
+        yield reply
+
+    trailer = validated_query_trailer(final_state)
+    if trailer:
+        yield trailer
+
+
+def _partial_tag(text: str, tag: str) -> int:
+    """Length of the longest end of `text` that is the start of `tag`."""
+    for size in range(min(len(tag) - 1, len(text)), 0, -1):
+        if text.endswith(tag[:size]):
+            return size
+    return 0
+
+
+class ThinkSplitter:
+    """
+    Splits answer text into ("token", text) and ("think", text) pieces on the <think> tags of
+    reasoning models. A tag may arrive split across chunks, so a possible start of one is held
+    back until the next chunk shows what it is.
+    """
+
+    def __init__(self):
+        self.kind = "token"
+        self._pending = ""
+
+    def feed(self, text: str) -> list:
+        self._pending += text
+        pieces = []
+        while self._pending:
+            tag = THINK_CLOSE if self.kind == "think" else THINK_OPEN
+            at = self._pending.find(tag)
+            if at != -1:
+                if at:
+                    pieces.append((self.kind, self._pending[:at]))
+                self._pending = self._pending[at + len(tag):]
+                self.kind = "token" if self.kind == "think" else "think"
+                continue
+            ready = len(self._pending) - _partial_tag(self._pending, tag)
+            if ready:
+                pieces.append((self.kind, self._pending[:ready]))
+            self._pending = self._pending[ready:]
+            break
+        return pieces
+
+    def flush(self) -> list:
+        """Whatever is held back, at the end of a message; the next message starts as answer text."""
+        pieces = [(self.kind, self._pending)] if self._pending else []
+        self.kind, self._pending = "token", ""
+        return pieces
+
+
+class TokenBatcher:
+    """
+    Coalesces pieces of the same kind into one event of about `chunk_chars` characters, so the
+    client gets a few dozen updates per answer instead of one per token. The age of a batch
+    is checked as pieces arrive.
+    """
+
+    def __init__(self, chunk_chars: int = None, flush_seconds: float = None):
+        self.chunk_chars = STREAM_CHUNK_CHARS if chunk_chars is None else chunk_chars
+        self.flush_seconds = STREAM_FLUSH_SECONDS if flush_seconds is None else flush_seconds
+        self.kind = None
+        self._parts = []
+        self._size = 0
+        self._started = 0.0
+
+    def add(self, kind: str, text: str) -> list:
+        events = self.flush() if kind != self.kind else []
+        if not self._parts:
+            self._started = time.perf_counter()
+        self.kind = kind
+        self._parts.append(text)
+        self._size += len(text)
+        if self._size >= self.chunk_chars or time.perf_counter() - self._started >= self.flush_seconds:
+            events += self.flush()
+        return events
+
+    def flush(self) -> list:
+        if not self._parts:
+            return []
+        event = {"type": self.kind, "text": "".join(self._parts)}
+        self._parts, self._size = [], 0
+        return [event]
+
+
+def ndjson(event: dict) -> str:
+    return json.dumps(event, ensure_ascii=False, default=str) + "\n"
+
+
+async def stream_chat_events(graph, state, config=None, trace_id: str = None):
+    """
+    Runs the graph with `astream` and yields newline-delimited JSON events:
+
+        {"type": "token", "text": ...}             answer text, in batches
+        {"type": "think", "text": ...}             <think> reasoning, without the tags
+        {"type": "tool_start", "id", "name", "args"}
+        {"type": "tool_end", "id", "name", "status", "ms"}
+        {"type": "validated_query", "data": {...}}
+        {"type": "done", "trace_id", "elapsed_ms", "first_token_ms", "events", "chars"}
+
+    An {"type": "error", "detail": ...} event is sent before a failed run ends the stream.
+    """
+    start = time.perf_counter()
+    splitter, batcher = ThinkSplitter(), TokenBatcher()
+    streamed_ids, tool_calls = set(), {}
+    final_state, message_id = None, None
+    totals = {"events": 0, "chars": 0, "first_token_ms": None}
+
+    def emit(events):
+        for event in events:
+            if event["type"] in ("token", "think"):
+                totals["chars"] += len(event["text"])
+                if totals["first_token_ms"] is None:
+                    totals["first_token_ms"] = round((time.perf_counter() - start) * 1000, 1)
+            totals["events"] += 1
+            yield ndjson(event)
+
+    def text_events(text):
+        return [event for kind, piece in splitter.feed(text) for event in batcher.add(kind, piece)]
+
+    def end_of_message():
+        events = [event for kind, piece in splitter.flush() for event in batcher.add(kind, piece)]
+        return events + batcher.flush()
+
+    try:
+        async for mode, chunk in graph.astream(state, config=config, stream_mode=["messages", "updates", "values"]):
+            if mode == "messages":
+                message, metadata = chunk
+                if metadata.get("langgraph_node") not in STREAMED_NODES or not isinstance(message, AIMessageChunk):
+                    continue
+                text = content_text(message.content)
+                if not text:
+                    continue
+                if message.id != message_id:
+                    for line in emit(end_of_message()):
+                        yield line
+                    message_id = message.id
+                streamed_ids.add(message.id)
+                for line in emit(text_events(text)):
+                    yield line
+            elif mode == "updates":
+                events = []
+                for update in chunk.values():
+                    messages = (update.get("messages") or []) if isinstance(update, dict) else []
+                    # The chatbot returns the whole history; only its newest message can call tools now
+                    last = messages[-1] if messages else None
+                    if isinstance(last, AIMessage) and last.tool_calls:
+                        for call in last.tool_calls:
+                            if call["id"] not in tool_calls:
+                                tool_calls[call["id"]] = (call["name"], time.perf_counter())
+                                events.append({"type": "tool_start", "id": call["id"], "name": call["name"],
+                                               "args": call["args"]})
+                    for message in messages:
+                        if isinstance(message, ToolMessage) and message.tool_call_id in tool_calls:
+                            name, started = tool_calls.pop(message.tool_call_id)
+                            events.append({"type": "tool_end", "id": message.tool_call_id, "name": name,
+                                           "status": message.status,
+                                           "ms": round((time.perf_counter() - started) * 1000, 1)})
+                if events:
+                    for line in emit(end_of_message() + events):
+                        yield line
+            else:
+                final_state = chunk
+    except Exception as e:
+        logger.error(f"Event stream failed: {e!r}")
+        for line in emit(end_of_message() + [{"type": "error", "detail": str(e)}]):
+            yield line
+        raise
+
+    reply = unstreamed_reply(final_state, streamed_ids)
+    events = end_of_message() + (text_events(reply) + end_of_message() if reply else [])
+    validated_query = validated_query_of(final_state)
+    if validated_query:
+        events.append({"type": "validated_query", "data": validated_query})
+    for line in emit(events):
+        yield line
+
+    elapsed_ms = round((time.perf_counter() - start) * 1000, 1)
+    logger.info(f"Streamed {totals['events']} events ({totals['chars']} chars) in {elapsed_ms} ms, "
+                f"first token after {totals['first_token_ms']} ms")
+    yield ndjson({"type": "done", "trace_id": trace_id, "elapsed_ms": elapsed_ms,
+                  "first_token_ms": totals["first_token_ms"], "events": totals["events"] + 1,
+                  "chars": totals["chars"]})
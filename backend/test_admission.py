@@ -0,0 +1,98 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+import admission
+import metrics
+from admission import Limiter, Overloaded
+
+
+def test_requests_over_the_limit_queue_and_a_full_queue_is_rejected():
+    async def scenario():
+        limiter = Limiter("ollama", max_in_flight=1, queue_size=1, timeout=5)
+        first = await limiter.acquire()
+        second = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        assert limiter.stats()["waiting"] == 1
+        assert metrics.snapshot()["gauges"]["admission.ollama.queue_depth"] == 1
+
+        with pytest.raises(Overloaded) as rejected:
+            await limiter.acquire()
+        assert rejected.value.reason.startswith("queue full") and rejected.value.retry_after >= 1
+
+        first.release()
+        first.release()
+        (await second).release()
+        return limiter.stats()
+
+    metrics.reset()
+    stats = asyncio.run(scenario())
+    assert (stats["admitted"], stats["rejected"], stats["in_flight"], stats["waiting"]) == (2, 1, 0, 0)
+    # Queue depth is a gauge, not a timing reported in milliseconds
+    snapshot = metrics.snapshot()
+    assert snapshot["gauges"]["admission.ollama.queue_depth"] == 0
+    assert "admission.ollama.queue_depth" not in snapshot["timings"]
+
+
+def test_waiting_past_the_deadline_is_rejected():
+    async def scenario():
+        limiter = Limiter("ollama", max_in_flight=1, queue_size=4, timeout=0.05)
+        slot = await limiter.acquire()
+        with pytest.raises(Overloaded, match="no slot within"):
+            await limiter.acquire()
+        slot.release()
+        # The slot is free again for the next request
+        (await limiter.acquire()).release()
+        return limiter.stats()
+
+    stats = asyncio.run(scenario())
+    assert (stats["timed_out"], stats["admitted"], stats["waiting"]) == (1, 2, 0)
+
+
+def test_abandoned_waiters_give_their_permit_back():
+    async def scenario():
+        limiter = Limiter("ollama", max_in_flight=1, queue_size=4, timeout=5)
+        slot = await limiter.acquire()
+        waiter = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        # The client disconnects while queued
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        slot.release()
+
+        # An acquire that went through just as its waiter timed out
+        acquiring = asyncio.ensure_future(limiter._semaphore.acquire())
+        await asyncio.sleep(0)
+        assert acquiring.done()
+        limiter._abandon(acquiring)
+        await asyncio.sleep(0)
+
+        (await asyncio.wait_for(limiter.acquire(), 1)).release()
+        return limiter.stats()
+
+    stats = asyncio.run(scenario())
+    assert (stats["admitted"], stats["in_flight"], stats["waiting"]) == (2, 0, 0)
+
+
+def test_models_without_a_known_prefix_share_the_ollama_limiter():
+    assert admission.backend_of("qwen3") == "ollama"
+    assert admission.backend_of("qwen3:8b") == "ollama"
+    assert admission.backend_of("ollama:qwen3") == "ollama"
+    assert admission.backend_of("Gemini:gemini-2.5-flash") == "gemini"
+
+
+def test_chat_answers_429_when_the_backend_is_saturated(monkeypatch):
+    from main import app
+
+    limiter = Limiter("ollama", max_in_flight=1, queue_size=0)
+    asyncio.run(limiter.acquire())
+    monkeypatch.setattr(admission, "_limiters", {"ollama": limiter})
+
+    # The default model, "qwen3", has no prefix
+    response = TestClient(app).post("/chat", json={"messages": [{"role": "user", "content": "hi"}]})
+
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+    assert response.json()["backend"] == "ollama"
@@ -0,0 +1,69 @@
+from datetime import date
+
+import pytest
+
+import duckdb_tools
+from analytics_tools import balance_trend_tool, mode_breakdown_tool, spend_by_period_tool, top_receivers_tool
+from db_pool import close_all
+from duckdb_tools import store_transactions_to_duckdb
+
+ACCOUNT = {"bank": "ICICI", "account_no": "XXXXXXXX6193"}
+
+
+def txn(day, amount, receiver, balance, mode="UPI", type="DEBIT", month=5):
+    return {"date": date(2025, month, day), "description": f"{mode}/{receiver}/{day}", "amount": amount,
+            "balance": balance, "mode": mode, "type": type, "receiver": receiver, **ACCOUNT}
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    path = str(tmp_path / "finance.db")
+    monkeypatch.setattr(duckdb_tools, "DB_PATH", path)
+    store_transactions_to_duckdb([
+        txn(2, 100.0, "ZOMATO", 900.0),
+        txn(5, 300.0, "AMAZON", 600.0, mode="NET BANKING"),
+        txn(9, 50.0, "ZOMATO", 550.0),
+        txn(28, 1000.0, "EMPLOYER", 1550.0, mode="NEFT", type="CREDIT"),
+        txn(3, 40.0, "UBER", 1510.0, month=6),
+    ], path)
+    yield path
+    close_all()
+
+
+def call(tool, **args):
+    return tool.invoke({**ACCOUNT, **args})
+
+
+def test_spend_by_period_uses_whole_months_or_days(db_path):
+    monthly = call(spend_by_period_tool, start_date="01-05-2025", end_date="30-06-2025")
+    assert "2025-05-01" in monthly and "450" in monthly
+    assert "2025-06-01" in monthly and "40" in monthly
+
+    daily = call(spend_by_period_tool, start_date="01-05-2025", end_date="04-05-2025", granularity="day")
+    assert "2025-05-02" in daily and "300" not in daily
+
+    credits = call(spend_by_period_tool, start_date="2025-05-01", end_date="2025-05-31", type="credit")
+    assert "1000" in credits
+
+
+def test_top_receivers_and_modes(db_path):
+    top = call(top_receivers_tool, start_date="01-05-2025", end_date="31-05-2025", limit=1)
+    assert "AMAZON" in top and "ZOMATO" not in top
+
+    modes = call(mode_breakdown_tool, start_date="01-05-2025", end_date="31-05-2025")
+    assert modes.index("NET BANKING") < modes.index("UPI")
+    assert "66.7" in modes and "33.3" in modes
+
+
+def test_balance_trend_reports_the_closing_balance(db_path):
+    trend = call(balance_trend_tool, start_date="01-05-2025", end_date="30-06-2025")
+    rows = [line for line in trend.splitlines() if "2025-" in line]
+    assert "1550" in rows[0] and "550" in rows[0]
+    assert "1510" in rows[1]
+
+
+def test_bad_arguments_come_back_as_messages(db_path):
+    assert call(spend_by_period_tool, start_date="May", end_date="30-06-2025").startswith("Invalid arguments")
+    assert "granularity" in call(balance_trend_tool, start_date="01-05-2025", end_date="30-06-2025",
+                                 granularity="hour")
+    assert call(top_receivers_tool, start_date="01-01-2024", end_date="31-01-2024") == "No data found."
@@ -0,0 +1,183 @@
+import base64
+import os
+from datetime import date
+
+import pytest
+
+import artifact_cache
+import duckdb_tools
+import metrics
+from db_pool import close_all
+from pdf_extract import shutdown_pool
+from test_pdf_extract import write_pdf
+from utils import download_pdf_attachments, decrypt_statement, parse_icici_statement
+
+ROWS = [
+    "01-04-2025 B/F 1000.00",
+    "02-04-2025NET BANKING BIL/ONL/1 100.00 900.00",
+]
+
+
+class FakeClient:
+    def __init__(self, data):
+        self.data = data
+        self.calls = 0
+
+    def get_attachment(self, message_id, attachment_id):
+        self.calls += 1
+        return {"data": self.data}
+
+
+@pytest.fixture(autouse=True)
+def cache_db(tmp_path, monkeypatch):
+    path = str(tmp_path / "finance.db")
+    monkeypatch.setattr(artifact_cache, "CACHE_DB_PATH", path)
+    monkeypatch.setattr(duckdb_tools, "DB_PATH", path)
+    metrics.reset()
+    yield path
+    close_all()
+    shutdown_pool()
+
+
+def attachment_message(tmp_path):
+    source = tmp_path / "source.pdf"
+    write_pdf(str(source), [ROWS])
+    data = base64.urlsafe_b64encode(source.read_bytes()).decode()
+    msg = {"id": "m1", "payload": {"parts": [{"filename": "Statement.pdf", "body": {"attachmentId": "a1"}}]}}
+    return msg, FakeClient(data)
+
+
+def test_second_download_is_served_from_cache(tmp_path):
+    msg, client = attachment_message(tmp_path)
+    output_dir = str(tmp_path / "downloads")
+
+    first = download_pdf_attachments(msg, client, output_dir)
+    second = download_pdf_attachments(msg, client, output_dir)
+
+    assert first == second == [os.path.join(output_dir, "m1", "Statement.pdf")]
+    assert client.calls == 1
+    assert metrics.snapshot()["counters"]["artifact_cache.download.hit"] == 1
+
+
+def test_attachments_with_the_same_name_do_not_overwrite_each_other(tmp_path):
+    output_dir = str(tmp_path / "downloads")
+    statements = {}
+    for msg_id, month in (("m1", b"April"), ("m2", b"May")):
+        msg = {"id": msg_id, "payload": {"parts": [{"filename": "Statement.pdf", "body": {"attachmentId": "a1"}}]}}
+        statements[msg_id] = msg
+        download_pdf_attachments(msg, FakeClient(base64.urlsafe_b64encode(b"%PDF " + month).decode()), output_dir)
+
+    [again] = download_pdf_attachments(statements["m1"], FakeClient(None), output_dir)
+
+    with open(again, "rb") as f:
+        assert f.read() == b"%PDF April"
+    assert metrics.snapshot()["counters"]["artifact_cache.download.hit"] == 1
+
+
+def test_same_bytes_in_another_message_keep_their_own_entry(tmp_path):
+    msg, client = attachment_message(tmp_path)
+    other = {**msg, "id": "m2"}
+    output_dir = str(tmp_path / "downloads")
+
+    [first] = download_pdf_attachments(msg, client, output_dir)
+    [second] = download_pdf_attachments(other, client, output_dir)
+
+    assert artifact_cache.lookup_attachment("m1", "a1")["pdf_path"] == first
+    assert artifact_cache.lookup_attachment("m2", "a1")["pdf_path"] == second != first
+
+
+def test_changed_file_is_not_a_cache_hit(tmp_path):
+    msg, client = attachment_message(tmp_path)
+    output_dir = str(tmp_path / "downloads")
+    [path] = download_pdf_attachments(msg, client, output_dir)
+    with open(path, "wb") as f:
+        f.write(b"%PDF overwritten")
+
+    assert artifact_cache.lookup_attachment("m1", "a1") is None
+    download_pdf_attachments(msg, client, output_dir)
+    assert client.calls == 2
+
+
+def test_decrypt_reuses_the_decrypted_copy(tmp_path, monkeypatch):
+    path = str(tmp_path / "Statement.pdf")
+    write_pdf(path, [ROWS])
+
+    decrypted = decrypt_statement(path, "secret")
+    monkeypatch.setattr("utils.decrypt_with_pikepdf", lambda *args: pytest.fail("decrypted twice"))
+
+    assert decrypt_statement(path, "secret") == decrypted
+
+
+def test_already_ingested_statement_is_not_parsed_again(tmp_path, monkeypatch):
+    path = str(tmp_path / "Statement_decrypted.pdf")
+    write_pdf(path, [ROWS])
+    monkeypatch.setattr("utils.store_transactions_to_duckdb",
+                        lambda txns, db, **kwargs: duckdb_tools.store_transactions_to_duckdb(txns, duckdb_tools.DB_PATH,
+                                                                                             **kwargs))
+
+    first = parse_icici_statement(path, "ICICI", "XXXXXXXX6193")
+    second = parse_icici_statement(path, "ICICI", "XXXXXXXX6193")
+    other_account = artifact_cache.lookup_parse(path, "ICICI", "XXXXXXXX9469")
+
+    assert first.startswith("Inserted 2 new transactions")
+    assert second.startswith("Statement already ingested: 2 transactions")
+    assert other_account is None
+
+
+def test_eviction_drops_least_recently_used_files(tmp_path):
+    paths = []
+    for i in range(3):
+        path = tmp_path / f"s{i}.pdf"
+        path.write_bytes(bytes([i]) * 100)
+        artifact_cache.record_download(f"m{i}", "a", path.name, str(path), path.read_bytes())
+        paths.append(path)
+    artifact_cache.lookup_attachment("m0", "a")
+
+    assert artifact_cache.evict(max_bytes=10_000, max_entries=2, grace_seconds=0) == 1
+    assert not paths[1].exists()
+    assert paths[0].exists() and paths[2].exists()
+
+    assert artifact_cache.evict(max_bytes=150, max_entries=10, grace_seconds=0) == 1
+    assert artifact_cache.stats()["entries"] == 1
+
+
+def test_eviction_keeps_recently_used_and_shared_files(tmp_path):
+    path = tmp_path / "s.pdf"
+    path.write_bytes(b"%PDF shared")
+    # The same statement mailed twice
+    for msg_id in ("m1", "m2"):
+        artifact_cache.record_download(msg_id, "a", path.name, str(path), path.read_bytes())
+
+    assert artifact_cache.evict(max_bytes=0, max_entries=0) == 0
+    assert artifact_cache.lookup_attachment("m1", "a")["pdf_path"] == str(path)
+
+    assert artifact_cache.evict(max_bytes=10_000, max_entries=1, grace_seconds=0) == 1
+    assert path.exists()
+    assert artifact_cache.lookup_attachment("m1", "a") is not None
+
+
+def test_changed_decrypted_copy_is_not_a_cache_hit(tmp_path):
+    path = str(tmp_path / "Statement.pdf")
+    write_pdf(path, [ROWS])
+    decrypted = decrypt_statement(path, "secret")
+    with open(decrypted, "ab") as f:
+        f.write(b"tampered")
+
+    assert artifact_cache.lookup_decrypted(path) is None
+    assert metrics.snapshot()["counters"]["artifact_cache.decrypt.miss"] == 2
+
+
+def test_stored_statement_covers_the_period_of_its_mail(tmp_path, monkeypatch):
+    msg, client = attachment_message(tmp_path)
+    msg["payload"]["headers"] = [{"name": "Subject",
+                                  "value": "ICICI Bank statement from 01-04-2025 to 30-04-2025"}]
+    monkeypatch.setattr("utils.store_transactions_to_duckdb",
+                        lambda txns, db, **kwargs: duckdb_tools.store_transactions_to_duckdb(txns, duckdb_tools.DB_PATH,
+                                                                                             **kwargs))
+    [path] = download_pdf_attachments(msg, client, str(tmp_path / "downloads"))
+
+    parse_icici_statement(decrypt_statement(path, "secret"), "ICICI", "XXXXXXXX6193")
+
+    # The rows are dated 1 and 2 April; the statement still covers the whole month
+    assert duckdb_tools.is_range_covered("ICICI", "XXXXXXXX6193", date(2025, 4, 1), date(2025, 4, 30),
+                                         duckdb_tools.DB_PATH)
@@ -0,0 +1,320 @@
+import asyncio
+import json
+import threading
+import time
+from datetime import date
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import duckdb_tools
+import metrics
+from db_pool import get_pool, close_all, run_db
+from duckdb_tools import (init_duckdb, store_transactions_to_duckdb, query_duckdb_tool, covered_ranges, is_range_covered,
+                          check_monthly_rollup, rebuild_monthly_rollup)
+
+
+def make_txn(day, amount, description, balance, account_no="XXXXXXXX6193"):
+    return {
+        "date": date(2025, 5, day),
+        "description": description,
+        "amount": amount,
+        "balance": balance,
+        "mode": "UPI",
+        "type": "DEBIT",
+        "receiver": description.split("/")[1] if "/" in description else "",
+        "bank": "ICICI",
+        "account_no": account_no,
+    }
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    path = str(tmp_path / "finance.db")
+    monkeypatch.setattr(duckdb_tools, "DB_PATH", path)
+    init_duckdb(path)
+    yield path
+    close_all()
+
+
+def test_pool_reuses_one_connection_per_database(db_path):
+    store_transactions_to_duckdb([make_txn(1, 100.0, "UPI/ZOMATO/food", 900.0)], db_path)
+    for _ in range(3):
+        query_duckdb_tool.invoke({"query": "SELECT count(*) AS n FROM transactions"})
+
+    stats = get_pool(db_path).stats()
+    assert stats["connections_opened"] == 1
+    assert stats["read_cursors_opened"] == 3
+    assert stats["reads"] == 3
+    assert stats["active_connections"] == 1
+    assert stats["writes"] == 2
+
+
+def test_duplicates_are_skipped_inside_duckdb(db_path):
+    batch = [
+        make_txn(1, 100.0, "UPI/ZOMATO/food", 900.0),
+        make_txn(2, 50.0, "UPI/SWIGGY/food", 850.0),
+        make_txn(2, 50.0, "UPI/SWIGGY/food", 850.0),
+    ]
+    assert store_transactions_to_duckdb(batch, db_path).startswith("Inserted 2 new transactions out of 3")
+
+    again = batch[:2] + [make_txn(3, 20.0, "UPI/UBER/ride", 830.0)]
+    assert store_transactions_to_duckdb(again, db_path).startswith("Inserted 1 new transactions out of 3")
+
+
+def test_same_entry_on_another_account_is_not_a_duplicate(db_path):
+    store_transactions_to_duckdb([make_txn(1, 100.0, "UPI/ZOMATO/food", 900.0)], db_path)
+    result = store_transactions_to_duckdb(
+        [make_txn(1, 100.0, "UPI/ZOMATO/food", 900.0, account_no="XXXXXXXX9469")], db_path
+    )
+    assert result.startswith("Inserted 1 new")
+
+
+def test_narrower_dedup_key_collapses_existing_rows(db_path):
+    store_transactions_to_duckdb([
+        make_txn(1, 100.0, "UPI/ZOMATO/food", 900.0),
+        make_txn(1, 100.0, "UPI/ZOMATO/food", 900.0, account_no="XXXXXXXX9469"),
+    ], db_path)
+
+    metrics.reset()
+    init_duckdb(db_path, key_columns=["date", "amount", "description"])
+    with get_pool(db_path).read() as con:
+        assert con.execute("SELECT count(*) FROM transactions").fetchone()[0] == 1
+    assert metrics.snapshot()["counters"]["duckdb.rekey_dropped"] == 1
+    init_duckdb(db_path)
+
+
+def test_identical_payments_on_one_day_are_both_kept(db_path):
+    result = store_transactions_to_duckdb([
+        make_txn(1, 100.0, "UPI/ZOMATO/food", 900.0),
+        make_txn(1, 100.0, "UPI/ZOMATO/food", 800.0),
+    ], db_path)
+
+    assert result.startswith("Inserted 2 new transactions out of 2")
+
+
+def test_failed_rekey_loses_no_rows(db_path, monkeypatch):
+    store_transactions_to_duckdb([
+        make_txn(1, 100.0, "UPI/ZOMATO/food", 900.0),
+        make_txn(1, 100.0, "UPI/ZOMATO/food", 900.0, account_no="XXXXXXXX9469"),
+    ], db_path)
+
+    def crash(con):
+        raise RuntimeError("crashed while rekeying")
+    with monkeypatch.context() as patched, pytest.raises(RuntimeError):
+        patched.setattr(duckdb_tools, "_rebuild_rollup", crash)
+        init_duckdb(db_path, key_columns=["date", "amount", "description"])
+
+    with get_pool(db_path).read() as con:
+        assert con.execute("SELECT count(*) FROM transactions_hot").fetchone()[0] == 2
+        assert con.execute("SELECT value FROM finmate_meta WHERE key = 'dedup_key'").fetchone()[0] == \
+            ",".join(duckdb_tools.DEDUP_KEY_COLUMNS)
+    assert check_monthly_rollup(db_path) == []
+
+
+def test_read_cursor_never_persists_changes(db_path):
+    store_transactions_to_duckdb([make_txn(1, 100.0, "UPI/ZOMATO/food", 900.0)], db_path)
+    query_duckdb_tool.invoke({"query": "DELETE FROM transactions"})
+
+    result = query_duckdb_tool.invoke({"query": "SELECT count(*) AS n FROM transactions"})
+    assert "1" in result
+
+
+def test_statements_that_end_the_read_transaction_are_rejected(db_path):
+    store_transactions_to_duckdb([make_txn(1, 100.0, "UPI/ZOMATO/food", 900.0)], db_path)
+
+    for query in ("SELECT 1; COMMIT; DELETE FROM transactions_hot", "COMMIT", "DELETE FROM transactions"):
+        assert json.loads(query_duckdb_tool.invoke({"query": query}))["error"] == "not_read_only"
+    with get_pool(db_path).read() as con:
+        assert con.execute("SELECT count(*) FROM transactions_hot").fetchone()[0] == 1
+
+
+def test_reads_from_many_threads_use_their_own_cursor(db_path):
+    store_transactions_to_duckdb([make_txn(1, 100.0, "UPI/ZOMATO/food", 900.0)], db_path)
+    results = []
+
+    def worker():
+        results.append(query_duckdb_tool.invoke({"query": "SELECT sum(amount) AS total FROM transactions"}))
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(results) == 4
+    assert all("100" in r for r in results)
+    assert get_pool(db_path).stats()["read_cursors_opened"] == 4
+
+
+def test_reads_from_short_lived_executors_leave_no_cursor_open(db_path):
+    store_transactions_to_duckdb([make_txn(1, 100.0, "UPI/ZOMATO/food", 900.0)], db_path)
+
+    def count():
+        with get_pool(db_path).read() as con:
+            return con.execute("SELECT count(*) FROM transactions").fetchone()[0]
+
+    # Like bulk_ingest, which starts a new executor per call
+    for _ in range(3):
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            assert list(pool.map(lambda _: count(), range(3))) == [1, 1, 1]
+
+    assert get_pool(db_path).stats()["active_connections"] == 1
+
+
+def test_pool_reopens_after_close(db_path):
+    store_transactions_to_duckdb([make_txn(1, 100.0, "UPI/ZOMATO/food", 900.0)], db_path)
+    get_pool(db_path).close()
+
+    result = query_duckdb_tool.invoke({"query": "SELECT count(*) AS n FROM transactions"})
+    assert "1" in result
+
+
+def test_store_records_the_ingested_span_per_account(db_path):
+    store_transactions_to_duckdb([
+        make_txn(2, 100.0, "UPI/ZOMATO/food", 900.0),
+        make_txn(20, 50.0, "UPI/SWIGGY/food", 850.0),
+        make_txn(5, 10.0, "UPI/UBER/ride", 840.0, account_no="XXXXXXXX9469"),
+    ], db_path)
+
+    assert covered_ranges("icici", "XXXXXXXX6193", db_path) == [(date(2025, 5, 2), date(2025, 5, 20))]
+    assert is_range_covered("ICICI", "XXXXXXXX9469", date(2025, 5, 5), date(2025, 5, 5), db_path)
+    assert not is_range_covered("ICICI", "XXXXXXXX6193", date(2025, 5, 1), date(2025, 5, 31), db_path)
+
+
+def test_back_to_back_statement_periods_merge(db_path):
+    store_transactions_to_duckdb([make_txn(2, 100.0, "UPI/ZOMATO/food", 900.0)], db_path,
+                                 coverage=[("ICICI", "XXXXXXXX6193", date(2025, 4, 1), date(2025, 4, 30)),
+                                           ("ICICI", "XXXXXXXX6193", date(2025, 5, 1), date(2025, 5, 31)),
+                                           ("ICICI", "XXXXXXXX6193", date(2025, 7, 1), date(2025, 7, 31))])
+
+    assert covered_ranges("ICICI", "XXXXXXXX6193", db_path) == [
+        (date(2025, 4, 1), date(2025, 5, 31)), (date(2025, 7, 1), date(2025, 7, 31)),
+    ]
+    assert is_range_covered("ICICI", "XXXXXXXX6193", date(2025, 4, 15), date(2025, 5, 31), db_path)
+    assert not is_range_covered("ICICI", "XXXXXXXX6193", date(2025, 5, 1), date(2025, 7, 31), db_path)
+
+
+def test_monthly_rollup_follows_incremental_inserts(db_path):
+    store_transactions_to_duckdb([
+        make_txn(1, 100.0, "UPI/ZOMATO/food", 900.0),
+        make_txn(2, 50.0, "UPI/ZOMATO/food", 850.0),
+        make_txn(3, 20.0, "ATM withdrawal", 830.0),
+    ], db_path)
+    # Duplicates must not be counted twice
+    store_transactions_to_duckdb([make_txn(2, 50.0, "UPI/ZOMATO/food", 850.0),
+                                  make_txn(4, 30.0, "UPI/ZOMATO/food", 800.0)], db_path)
+
+    result = query_duckdb_tool.invoke({"query": """
+        SELECT receiver, txn_count, total_amount FROM monthly_rollup
+        WHERE month = DATE '2025-05-01' AND type = 'DEBIT' ORDER BY receiver
+    """})
+    assert "ZOMATO" in result and "180" in result
+    assert check_monthly_rollup(db_path) == []
+
+
+def test_rollup_mismatch_is_reported_and_rebuilt(db_path):
+    store_transactions_to_duckdb([make_txn(1, 100.0, "UPI/ZOMATO/food", 900.0)], db_path)
+    with get_pool(db_path).write() as con:
+        con.execute("UPDATE monthly_rollup SET total_amount = 1")
+
+    mismatches = check_monthly_rollup(db_path)
+    assert len(mismatches) == 1 and mismatches[0][5] == "ZOMATO"
+
+    rebuild_monthly_rollup(db_path)
+    assert check_monthly_rollup(db_path) == []
+
+
+def test_rollup_drift_is_repaired_by_the_periodic_check(db_path):
+    store_transactions_to_duckdb([make_txn(1, 100.0, "UPI/ZOMATO/food", 900.0)], db_path)
+    with get_pool(db_path).write() as con:
+        con.execute("DELETE FROM monthly_rollup")
+    metrics.reset()
+
+    async def one_check():
+        watcher = asyncio.create_task(duckdb_tools.watch_monthly_rollup(interval=60, db_path=db_path))
+        while "monthly_rollup.checks" not in metrics.snapshot()["counters"]:
+            await asyncio.sleep(0.01)
+        watcher.cancel()
+    asyncio.run(one_check())
+
+    assert metrics.snapshot()["counters"]["monthly_rollup.drift"] == 1
+    assert check_monthly_rollup(db_path) == []
+    assert duckdb_tools.verify_monthly_rollup(db_path) == 0
+
+
+def test_rekeying_rebuilds_the_rollup(db_path):
+    store_transactions_to_duckdb([
+        make_txn(1, 100.0, "UPI/ZOMATO/food", 900.0),
+        make_txn(1, 100.0, "UPI/ZOMATO/food", 900.0, account_no="XXXXXXXX9469"),
+    ], db_path)
+
+    init_duckdb(db_path, key_columns=["date", "amount", "description"])
+    assert check_monthly_rollup(db_path) == []
+    init_duckdb(db_path)
+
+
+def test_large_results_are_truncated_with_a_summary(db_path, monkeypatch):
+    monkeypatch.setattr(duckdb_tools, "QUERY_ROW_LIMIT", 5)
+    metrics.reset()
+    store_transactions_to_duckdb([make_txn(day, float(day), f"UPI/SHOP{day}/x", 1000.0 - day) for day in range(1, 31)],
+                                 db_path)
+
+    result = query_duckdb_tool.invoke({"query": "SELECT date, amount, receiver FROM transactions ORDER BY date;"})
+
+    lines = result.splitlines()
+    assert lines[0] == "date|amount|receiver"
+    assert lines[1] == "2025-05-01|1|SHOP1"
+    assert "showing the first 5 of 30 rows" in result
+    assert "amount|30|465|1.0|30.0" in result
+    counters = metrics.snapshot()["counters"]
+    assert counters["tool_result.query_duckdb_tool.truncated"] == 1
+    assert counters["tool_result.query_duckdb_tool.bytes"] == len(result.encode())
+
+
+def test_summary_mode_returns_only_column_statistics(db_path):
+    store_transactions_to_duckdb([make_txn(1, 100.0, "UPI/ZOMATO/food", 900.0),
+                                  make_txn(2, 50.5, "UPI/SWIGGY/food", 849.5)], db_path)
+
+    result = query_duckdb_tool.invoke({"query": "SELECT amount, receiver FROM transactions", "summary": True})
+
+    assert result.startswith("2 rows.")
+    assert "amount|2|150.5|50.5|100.0" in result
+    assert "receiver|2||SWIGGY|ZOMATO" in result
+
+
+def test_plans_over_the_estimated_row_limit_are_rejected(db_path, monkeypatch):
+    monkeypatch.setattr(duckdb_tools, "MAX_ESTIMATED_ROWS", 1_000_000)
+    metrics.reset()
+
+    result = query_duckdb_tool.invoke({"query": "SELECT count(*) FROM range(100000) a, range(100000) b"})
+
+    error = json.loads(result)
+    assert error["error"] == "too_expensive"
+    assert error["estimated_rows"] > 1_000_000 and error["hint"]
+    assert metrics.snapshot()["counters"]["query_guard.rejected"] == 1
+    assert query_duckdb_tool.invoke({"query": "SELECT count(*) AS n FROM range(1000)"}) == "n\n1000"
+
+
+def test_slow_queries_are_interrupted(db_path, monkeypatch):
+    monkeypatch.setattr(duckdb_tools, "MAX_ESTIMATED_ROWS", 10 ** 15)
+    monkeypatch.setattr(duckdb_tools, "QUERY_TIMEOUT_SECONDS", 0.2)
+    metrics.reset()
+
+    start = time.perf_counter()
+    result = query_duckdb_tool.invoke({"query": "SELECT count(*) FROM range(100000000) a, range(1000000) b"})
+
+    assert time.perf_counter() - start < 5
+    assert json.loads(result)["error"] == "timeout"
+    assert metrics.snapshot()["counters"]["query_guard.timeout"] == 1
+    # The pooled cursor keeps working afterwards
+    assert query_duckdb_tool.invoke({"query": "SELECT 42 AS answer"}) == "answer\n42"
+
+
+def test_awaited_tool_runs_on_the_duckdb_executor(db_path):
+    store_transactions_to_duckdb([make_txn(1, 100.0, "UPI/ZOMATO/food", 900.0)], db_path)
+
+    result = asyncio.run(query_duckdb_tool.ainvoke({"query": "SELECT sum(amount) AS total FROM transactions"}))
+
+    assert result == "total\n100"
+    assert asyncio.run(run_db(threading.current_thread)).name.startswith("duckdb")
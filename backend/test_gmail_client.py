@@ -0,0 +1,184 @@
+import base64
+import json
+import os
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import pytest
+from googleapiclient.errors import HttpError
+
+import artifact_cache
+import metrics
+import utils
+from db_pool import close_all
+from gmail_client import GmailClient
+
+
+class FakeGmail:
+    """Local stand-in for the Gmail REST API: paged message lists, messages and attachments."""
+
+    def __init__(self, page_size=2, delay=0.0):
+        self.messages = {}
+        self.attachments = {}
+        self.page_size = page_size
+        self.delay = delay
+        self.failures = {}
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def add_message(self, msg_id, subject="Statement", pdf_bytes=None):
+        parts = []
+        if pdf_bytes is not None:
+            self.attachments[(msg_id, f"att-{msg_id}")] = base64.urlsafe_b64encode(pdf_bytes).decode()
+            parts.append({"filename": f"{msg_id}.pdf", "body": {"attachmentId": f"att-{msg_id}"}})
+        self.messages[msg_id] = {
+            "id": msg_id,
+            "payload": {"headers": [{"name": "Subject", "value": subject}], "parts": parts},
+        }
+
+    def fail(self, path, *statuses):
+        """The next requests to `path` answer with these statuses, in order."""
+        self.failures[path] = list(statuses)
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _respond(self, path, query):
+        with self._lock:
+            pending = self.failures.get(path)
+            if pending:
+                return pending.pop(0), {"error": {"code": 503, "message": "try again"}}
+        if path == "/gmail/v1/users/me/messages":
+            ids = sorted(self.messages)
+            start = int(query.get("pageToken", ["0"])[0])
+            page = {"messages": [{"id": i} for i in ids[start:start + self.page_size]]}
+            if start + self.page_size < len(ids):
+                page["nextPageToken"] = str(start + self.page_size)
+            return 200, page
+        m = re.fullmatch(r"/gmail/v1/users/me/messages/([^/]+)/attachments/([^/]+)", path)
+        if m and m.groups() in self.attachments:
+            return 200, {"data": self.attachments[m.groups()]}
+        m = re.fullmatch(r"/gmail/v1/users/me/messages/([^/]+)", path)
+        if m and m.group(1) in self.messages:
+            return 200, self.messages[m.group(1)]
+        return 404, {"error": {"code": 404, "message": "not found"}}
+
+    def _handler(self):
+        gmail = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                with gmail._lock:
+                    gmail.requests.append(url.path)
+                    gmail.in_flight += 1
+                    gmail.max_in_flight = max(gmail.max_in_flight, gmail.in_flight)
+                try:
+                    time.sleep(gmail.delay)
+                    status, body = gmail._respond(url.path, parse_qs(url.query))
+                finally:
+                    with gmail._lock:
+                        gmail.in_flight -= 1
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+def write_token(path):
+    with open(path, "w") as f:
+        json.dump({"token": "fake", "refresh_token": "fake", "client_id": "fake", "client_secret": "fake",
+                   "expiry": "2099-01-01T00:00:00Z"}, f)
+
+
+@pytest.fixture
+def gmail():
+    fake = FakeGmail()
+    yield fake
+    fake.close()
+
+
+@pytest.fixture
+def client(gmail, tmp_path):
+    token = str(tmp_path / "token.json")
+    write_token(token)
+    metrics.reset()
+    client = GmailClient(token_path=token, api_endpoint=gmail.url, workers=4, backoff=0.01)
+    yield client
+    client.close()
+
+
+def test_list_messages_follows_page_tokens(gmail, client):
+    for i in range(5):
+        gmail.add_message(f"m{i}")
+
+    assert [m["id"] for m in client.list_messages("statement")] == ["m0", "m1", "m2", "m3", "m4"]
+    assert gmail.requests.count("/gmail/v1/users/me/messages") == 3
+    assert len(client.list_messages("statement", limit=3)) == 3
+
+
+def test_rate_limits_and_server_errors_are_retried(gmail, client):
+    gmail.add_message("m1")
+    gmail.fail("/gmail/v1/users/me/messages/m1", 429, 503)
+
+    assert client.get_message("m1")["id"] == "m1"
+    assert metrics.snapshot()["counters"]["gmail.retries"] == 2
+
+    with pytest.raises(HttpError):
+        client.get_message("missing")
+    assert metrics.snapshot()["counters"]["gmail.retries"] == 2
+
+
+def test_messages_are_fetched_concurrently(gmail, client):
+    gmail.delay = 0.2
+    for i in range(4):
+        gmail.add_message(f"m{i}")
+
+    start = time.perf_counter()
+    messages = client.get_messages(["m3", "m0", "m2", "m1"])
+
+    assert [m["id"] for m in messages] == ["m3", "m0", "m2", "m1"]
+    assert gmail.max_in_flight > 1
+    assert time.perf_counter() - start < 0.6
+
+
+def test_service_is_rebuilt_only_when_the_token_changes(client):
+    first = client.service
+    assert client.service is first
+    assert metrics.snapshot()["counters"]["gmail.service_built"] == 1
+
+    stat = os.stat(client.token_path)
+    os.utime(client.token_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+    assert client.service is not first
+
+
+def test_search_downloads_every_attachment(gmail, client, tmp_path, monkeypatch):
+    monkeypatch.setattr(artifact_cache, "CACHE_DB_PATH", str(tmp_path / "finance.db"))
+    monkeypatch.setattr(utils, "get_gmail_client", lambda: client)
+    monkeypatch.chdir(tmp_path)
+    for i in range(3):
+        gmail.add_message(f"m{i}", pdf_bytes=b"%PDF-1.4 statement " + bytes([i]))
+
+    # Three messages over two result pages: every one is fetched, not just the first
+    found = utils.search_gmail_with_pdfs("May 2025")
+    close_all()
+
+    assert sorted(found) == [f"Downloaded: {os.path.join('downloads', f'm{i}', f'm{i}.pdf')}" for i in range(3)]
+    assert (tmp_path / "downloads" / "m2" / "m2.pdf").read_bytes().endswith(b"statement \x02")
@@ -0,0 +1,103 @@
+import asyncio
+from datetime import date
+
+import pytest
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.runnables import RunnableLambda
+
+import duckdb_tools
+import graph
+import response_cache
+from db_pool import close_all
+from graph import build_graph, query_period
+from schemas import QueryInfo
+
+QUERY = QueryInfo(intent="total spending", bank="ICICI", account_no="XXXXXXXX6193", month="May", year="2025",
+                  date_range="01-05-2025 to 31-05-2025")
+
+
+class FakeLLM(GenericFakeChatModel):
+    """Answers with the names of the bound tools and the last prompt message."""
+
+    def bind_tools(self, tools, **kwargs):
+        names = [t.name for t in tools]
+        return RunnableLambda(lambda messages: AIMessage(content=f"{names} | {messages[-1].content}"))
+
+    def with_structured_output(self, schema, **kwargs):
+        return RunnableLambda(lambda messages: QUERY)
+
+
+class AsyncOnlyLLM(FakeLLM):
+    """Like FakeLLM, but fails when called synchronously."""
+
+    def bind_tools(self, tools, **kwargs):
+        names = [t.name for t in tools]
+
+        def blocking(messages):
+            raise AssertionError("the LLM was invoked synchronously")
+
+        async def answer(messages):
+            return AIMessage(content=f"{names} | {messages[-1].content}")
+
+        return RunnableLambda(blocking, afunc=answer)
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    path = str(tmp_path / "finance.db")
+    monkeypatch.setattr(duckdb_tools, "DB_PATH", path)
+    monkeypatch.setattr(graph, "is_range_covered",
+                        lambda bank, account_no, start, end: duckdb_tools.is_range_covered(bank, account_no, start, end, path))
+    monkeypatch.setattr(graph, "get_llm", lambda model: FakeLLM(messages=iter([])))
+    response_cache.clear()
+    yield path
+    close_all()
+    response_cache.clear()
+
+
+def run(state):
+    return build_graph("fake").invoke(state)
+
+
+def confirmed_state():
+    return {"messages": [HumanMessage(content="yes, proceed")], "validated_query": QUERY.model_dump()}
+
+
+def test_query_period_from_range_or_month():
+    assert query_period(QUERY) == (date(2025, 5, 1), date(2025, 5, 31))
+    assert query_period(QueryInfo(month="sept", year="2024")) == (date(2024, 9, 1), date(2024, 9, 30))
+    assert query_period(QueryInfo(month="May")) is None
+
+
+def test_covered_range_goes_straight_to_querying(db_path):
+    duckdb_tools.store_transactions_to_duckdb(
+        [{"date": date(2025, 5, 3), "description": "UPI/ZOMATO/", "amount": 10.0, "balance": 90.0, "mode": "UPI",
+          "type": "DEBIT", "receiver": "ZOMATO", "bank": "ICICI", "account_no": "XXXXXXXX6193"}],
+        db_path, coverage=[("ICICI", "XXXXXXXX6193", date(2025, 5, 1), date(2025, 5, 31))],
+    )
+
+    final = run(confirmed_state())
+
+    assert final["data_available"] is True
+    answer = final["messages"][-1].content
+    tools = answer.split(" | ")[0]
+    assert "query_duckdb_tool" in tools and "spend_by_period_tool" in tools
+    assert "fetch_gmail_pdfs" not in tools
+    assert "already stored in DuckDB" in answer
+
+
+def test_missing_range_keeps_the_gmail_tools(db_path):
+    final = run(confirmed_state())
+
+    assert final["data_available"] is False
+    assert "fetch_gmail_pdfs" in final["messages"][-1].content
+
+
+def test_ainvoke_awaits_the_llm(db_path, monkeypatch):
+    monkeypatch.setattr(graph, "get_llm", lambda model: AsyncOnlyLLM(messages=iter([])))
+
+    final = asyncio.run(build_graph("fake").ainvoke(confirmed_state()))
+
+    assert final["data_available"] is False
+    assert "fetch_gmail_pdfs" in final["messages"][-1].content
@@ -0,0 +1,62 @@
+from graph_registry import GraphRegistry
+
+
+def make_registry(max_size=2):
+    built = []
+
+    def builder(model):
+        built.append(model)
+        return object()
+
+    return GraphRegistry(builder=builder, max_size=max_size), built
+
+
+def test_graph_built_once_per_model():
+    registry, built = make_registry()
+    first = registry.get("ollama:qwen3")
+    second = registry.get("ollama:qwen3")
+
+    assert first is second
+    assert built == ["ollama:qwen3"]
+    stats = registry.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert "ollama:qwen3" in stats["build_ms"]
+
+
+def test_least_recently_used_graph_is_evicted():
+    registry, built = make_registry(max_size=2)
+    registry.get("a")
+    registry.get("b")
+    registry.get("a")
+    registry.get("c")
+
+    assert registry.stats()["models"] == ["a", "c"]
+    registry.get("b")
+    assert built == ["a", "b", "c", "b"]
+
+
+def test_invalidate_forces_rebuild():
+    registry, built = make_registry()
+    registry.get("a")
+    registry.get("b")
+
+    assert registry.invalidate("a") == 1
+    registry.get("a")
+    assert built == ["a", "b", "a"]
+    assert registry.invalidate() == 2
+    assert registry.stats()["size"] == 0
+
+
+def test_warm_up_skips_failing_models():
+    def builder(model):
+        if model == "bad":
+            raise ValueError("Unsupported model")
+        return object()
+
+    registry = GraphRegistry(builder=builder)
+    results = registry.warm_up(["good", "bad"])
+
+    assert results["good"] == "ok"
+    assert results["bad"].startswith("error")
+    assert registry.stats()["models"] == ["good"]
@@ -0,0 +1,58 @@
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+
+import metrics
+from history import compact_history, estimate_tokens, reasoning_of
+
+
+def tool_turn(n, result_chars=2000):
+    call_id = f"call-{n}"
+    return [
+        HumanMessage(content=f"question {n}", id=f"h{n}"),
+        AIMessage(content=f"<think>step {n}</think>checking", id=f"a{n}",
+                  tool_calls=[{"name": "query_duckdb_tool", "args": {"query": "SELECT 1"}, "id": call_id}]),
+        ToolMessage(content="x" * result_chars, tool_call_id=call_id, id=f"t{n}"),
+        AIMessage(content=f"answer {n}", id=f"r{n}"),
+    ]
+
+
+def test_think_blocks_and_old_tool_results_are_trimmed():
+    messages = tool_turn(1) + tool_turn(2)
+
+    compacted, stats = compact_history(messages, budget=100_000)
+
+    assert len(compacted) == len(messages)
+    assert compacted[1].content == "checking"
+    assert len(compacted[2].content) < 300
+    # The current turn keeps its full tool result
+    assert compacted[6].content == "x" * 2000
+    assert stats["tokens_after"] < stats["tokens_before"]
+    assert messages[1].content.startswith("<think>")
+
+
+def test_oldest_turns_are_dropped_over_budget():
+    messages = [AIMessage(content="<plan>...</plan>", id="plan")]
+    for n in range(1, 6):
+        messages += tool_turn(n)
+
+    compacted, stats = compact_history(messages, budget=800)
+
+    assert stats["turns_dropped"] >= 1
+    assert stats["tokens_after"] <= estimate_tokens(messages)
+    assert isinstance(compacted[1], SystemMessage)
+    assert "question 1" in compacted[1].content
+    assert compacted[-4:][0].content == "question 5"
+    # Every remaining tool result still follows the AI message that called it
+    ids = [m.tool_call_id for m in compacted if isinstance(m, ToolMessage)]
+    calls = [c["id"] for m in compacted if isinstance(m, AIMessage) for c in m.tool_calls]
+    assert ids == calls
+
+
+def test_reasoning_is_extracted_once_per_message():
+    metrics.reset()
+    msg = AIMessage(content="<think>a</think>text<think>b</think>", id="cached-msg")
+
+    assert reasoning_of(msg) == "<think>a</think>\n<think>b</think>\n"
+    assert reasoning_of(msg) == "<think>a</think>\n<think>b</think>\n"
+    counters = metrics.snapshot()["counters"]
+    assert counters["history.reasoning_cache.miss"] == 1
+    assert counters["history.reasoning_cache.hit"] == 1
@@ -0,0 +1,57 @@
+from datetime import date
+
+from icici_parser import parse_icici_pages
+from benchmarks.bench_parser import synthetic_pages, legacy_parse_pages
+
+PAGE_ONE = [
+    "DATE MODE PARTICULARS DEPOSITS WITHDRAWALS BALANCE",
+    "01-05-2025 B/F 10,000.00",
+    "UPI/ZOMATO/512345678/",
+    "02-05-2025 Payment 250.00 9,750.00",
+    "UPI/123456789012",
+    "03-05-2025NET BANKING BIL/ONL/000123 1,000.00 8,750.00",
+]
+PAGE_TWO = [
+    "DATE MODE PARTICULARS DEPOSITS WITHDRAWALS BALANCE",
+    "04-05-2025MOBILE BANKING MMT/IMPS/5123 2,000.00 10,750.00",
+    "Int.Pd:01-04-2025 to 30-04-2025",
+    "05-05-2025 35.00 10,785.00",
+    "",
+    "06-05-2025ICICI DIRECT SIP/ACH 500.00 10,285.00",
+]
+
+
+def test_each_line_format_is_parsed():
+    df = parse_icici_pages([PAGE_ONE, PAGE_TWO], "ICICI", "XXXXXXXX6193")
+
+    assert list(df["mode"]) == ["B/F", "UPI", "NET BANKING", "MOBILE BANKING", "Interest Credit", "ICICI DIRECT"]
+    assert list(df["amount"]) == [0.0, 250.0, 1000.0, 2000.0, 35.0, 500.0]
+    assert df["date"].iloc[1].date() == date(2025, 5, 2)
+    assert df["description"].iloc[1] == "UPI/ZOMATO/512345678/ Payment UPI/123456789012"
+    assert df["receiver"].iloc[1] == "ZOMATO"
+    assert df["receiver"].iloc[4] == "ICICI"
+    assert set(df["account_no"]) == {"XXXXXXXX6193"}
+
+
+def test_running_balance_carries_across_pages():
+    df = parse_icici_pages([PAGE_ONE, PAGE_TWO], "ICICI", "XXXXXXXX6193")
+
+    # The first row of page two is compared with the last balance of page one
+    assert list(df["type"]) == ["BALANCE", "DEBIT", "DEBIT", "CREDIT", "CREDIT", "DEBIT"]
+
+
+def test_matches_previous_parser_on_synthetic_statement():
+    pages = synthetic_pages(20)
+    legacy = legacy_parse_pages(pages, "ICICI", "XXXXXXXX6193")
+    rows = parse_icici_pages(pages, "ICICI", "XXXXXXXX6193").to_dict("records")
+
+    assert len(rows) == len(legacy)
+    for old, new in zip(legacy, rows):
+        new["date"] = new["date"].date()
+        assert new == old
+
+
+def test_empty_statement_gives_empty_frame():
+    df = parse_icici_pages([[], ["no transactions here"]], "ICICI", "XXXXXXXX6193")
+    assert df.empty
+    assert "account_no" in df.columns
@@ -0,0 +1,86 @@
+import pytest
+
+import artifact_cache
+import ingest
+from db_pool import get_pool, close_all
+from pdf_extract import shutdown_pool
+from test_pdf_extract import write_pdf
+from test_gmail_client import FakeGmail, write_token
+from gmail_client import GmailClient
+
+
+def add_statement(gmail, msg_id, tmp_path, period, rows):
+    path = tmp_path / f"{msg_id}.pdf"
+    write_pdf(str(path), [rows])
+    gmail.add_message(msg_id, f"ICICI Bank Statement from {period} for XXXXXXXX6193", path.read_bytes())
+
+
+@pytest.fixture
+def gmail(tmp_path, monkeypatch):
+    fake = FakeGmail()
+    token = str(tmp_path / "token.json")
+    write_token(token)
+    client = GmailClient(token_path=token, api_endpoint=fake.url, backoff=0.01)
+    monkeypatch.setattr(ingest, "get_gmail_client", lambda: client)
+    monkeypatch.setattr(ingest, "get_password_for_bank", lambda bank: "secret")
+    monkeypatch.setattr(artifact_cache, "CACHE_DB_PATH", str(tmp_path / "finance.db"))
+    yield fake
+    client.close()
+    fake.close()
+    close_all()
+    shutdown_pool()
+
+
+def test_bulk_ingest_stores_all_statements_in_range(gmail, tmp_path):
+    add_statement(gmail, "m1", tmp_path, "01-04-2025 to 30-04-2025", [
+        "01-04-2025 B/F 1000.00",
+        "02-04-2025NET BANKING BIL/ONL/1 100.00 900.00",
+    ])
+    add_statement(gmail, "m2", tmp_path, "01-05-2025 to 31-05-2025", [
+        "01-05-2025 B/F 900.00",
+        "03-05-2025MOBILE BANKING MMT/IMPS/2 50.00 850.00",
+    ])
+    add_statement(gmail, "m3", tmp_path, "01-07-2025 to 31-07-2025", [
+        "01-07-2025 B/F 850.00",
+    ])
+    db_path = str(tmp_path / "finance.db")
+
+    report = ingest.bulk_ingest("01-04-2025", "31-05-2025", ["XXXXXXXX6193"], workers=2,
+                                output_dir=str(tmp_path / "downloads"), db_path=db_path)
+
+    assert report["errors"] == []
+    assert report["statements"] == 2
+    assert report["stages"]["parse"]["items"] == 4
+    assert report["store_result"].startswith("Inserted 4 new transactions")
+    assert set(report["stages"]) == {"search", "download", "decrypt", "parse", "store"}
+    with get_pool(db_path).read() as con:
+        assert con.execute("SELECT count(DISTINCT account_no) FROM transactions").fetchone()[0] == 1
+    assert "statement(s)" in ingest.format_report(report)
+
+
+def test_second_run_reuses_the_cached_statements(gmail, tmp_path, monkeypatch):
+    add_statement(gmail, "m1", tmp_path, "01-04-2025 to 30-04-2025", [
+        "01-04-2025 B/F 1000.00",
+        "02-04-2025NET BANKING BIL/ONL/1 100.00 900.00",
+    ])
+    monkeypatch.setattr(ingest, "parse_icici_transactions", counting(ingest.parse_icici_transactions))
+    args = ("01-04-2025", "30-04-2025", ["XXXXXXXX6193"])
+    kwargs = {"workers": 2, "output_dir": str(tmp_path / "downloads"), "db_path": str(tmp_path / "finance.db")}
+
+    first = ingest.bulk_ingest(*args, **kwargs)
+    second = ingest.bulk_ingest(*args, **kwargs)
+
+    assert first["store_result"].startswith("Inserted 2 new transactions")
+    assert second["cached"] == 1
+    assert second["store_result"] == "No new transactions to insert"
+    assert ingest.parse_icici_transactions.calls == 1
+    # The second run found the attachment in the artifact cache
+    assert gmail.requests.count("/gmail/v1/users/me/messages/m1/attachments/att-m1") == 1
+
+
+def counting(fn):
+    def wrapper(*args, **kwargs):
+        wrapper.calls += 1
+        return fn(*args, **kwargs)
+    wrapper.calls = 0
+    return wrapper
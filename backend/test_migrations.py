@@ -0,0 +1,135 @@
+from datetime import date
+
+import duckdb
+import pytest
+
+import duckdb_tools
+import migrations
+from analytics_tools import balance_trend_tool
+from db_pool import close_all, get_pool
+from duckdb_tools import check_monthly_rollup, export_cold_years, init_duckdb, store_transactions_to_duckdb
+
+
+def txn(day, amount, balance, account_no="XXXXXXXX6193", year=2025, type="DEBIT", receiver="ZOMATO"):
+    return {"date": date(year, 5, day), "description": f"UPI/{receiver}/{year}{day}", "amount": amount,
+            "balance": balance, "mode": "UPI", "type": type, "receiver": receiver, "bank": "ICICI",
+            "account_no": account_no}
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    path = str(tmp_path / "finance.db")
+    monkeypatch.setattr(duckdb_tools, "DB_PATH", path)
+    monkeypatch.setattr(duckdb_tools, "COLD_STORAGE_DIR", str(tmp_path / "cold"))
+    yield path
+    close_all()
+
+
+def test_legacy_table_is_migrated_in_place(db_path):
+    con = duckdb.connect(db_path)
+    con.execute("""
+        CREATE TABLE transactions (date DATE, description VARCHAR, amount DOUBLE, balance DOUBLE,
+                                   mode VARCHAR, type VARCHAR, receiver VARCHAR)
+    """)
+    con.execute("""
+        INSERT INTO transactions VALUES
+            ('2025-05-09', 'UPI/SWIGGY/1', 50, 850, 'UPI', 'debit', 'SWIGGY'),
+            ('2025-05-02', 'UPI/ZOMATO/1', 100, 900, 'UPI', 'DEBIT', 'ZOMATO'),
+            ('2025-05-02', 'NEFT/SALARY', 1000, 1900, 'NEFT', 'CREDIT', 'EMPLOYER')
+    """)
+    con.close()
+
+    init_duckdb(db_path)
+
+    with get_pool(db_path).read() as cur:
+        assert migrations.schema_version(cur) == len(migrations.MIGRATIONS)
+        types = dict(cur.execute(
+            "SELECT column_name, data_type FROM information_schema.columns WHERE table_name = 'transactions_hot'"
+        ).fetchall())
+        rows = cur.execute("SELECT date, type, seq FROM transactions_hot").fetchall()
+        kind = cur.execute("SELECT table_type FROM information_schema.tables WHERE table_name = 'transactions'").fetchone()
+    assert types["type"].startswith("ENUM")
+    assert kind == ("VIEW",)
+    # Stored in date order, with the original insert order kept in seq
+    assert [(r[0].day, r[1], r[2]) for r in rows] == [(2, "DEBIT", 2), (2, "CREDIT", 3), (9, "DEBIT", 1)]
+    assert check_monthly_rollup(db_path) == []
+
+
+def test_new_rows_are_clustered_and_ordered_by_seq(db_path):
+    store_transactions_to_duckdb([txn(9, 50.0, 850.0), txn(2, 100.0, 900.0, account_no="XXXXXXXX9469"),
+                                  txn(2, 10.0, 990.0)], db_path)
+    store_transactions_to_duckdb([txn(3, 5.0, 985.0), txn(3, 5.0, 980.0, receiver="UBER")], db_path)
+
+    with get_pool(db_path).read() as con:
+        rows = con.execute("SELECT account_no, date, seq FROM transactions_hot").fetchall()
+    assert [r[0] for r in rows] == ["XXXXXXXX6193"] * 2 + ["XXXXXXXX9469"] + ["XXXXXXXX6193"] * 2
+    assert [r[2] for r in rows] == [3, 1, 2, 4, 5]
+
+    duckdb_tools.recluster_transactions(db_path)
+    with get_pool(db_path).read() as con:
+        rows = con.execute("SELECT account_no, day(date), seq FROM transactions_hot").fetchall()
+    assert rows == [("XXXXXXXX6193", 2, 3), ("XXXXXXXX6193", 3, 4), ("XXXXXXXX6193", 3, 5),
+                    ("XXXXXXXX6193", 9, 1), ("XXXXXXXX9469", 2, 2)]
+    assert "980" in balance_trend_tool.invoke({"bank": "ICICI", "account_no": "XXXXXXXX6193",
+                                               "start_date": "03-05-2025", "end_date": "03-05-2025"})
+
+
+def test_cold_years_are_read_through_the_same_view(db_path, tmp_path):
+    store_transactions_to_duckdb([txn(2, 100.0, 900.0, year=2023), txn(3, 20.0, 880.0, year=2024),
+                                  txn(4, 30.0, 850.0, year=2025)], db_path)
+
+    moved = export_cold_years(2025, db_path)
+
+    assert moved == [("XXXXXXXX6193", 2023, 1), ("XXXXXXXX6193", 2024, 1)]
+    assert (tmp_path / "cold" / "account_no=XXXXXXXX6193" / "year=2023").is_dir()
+    with get_pool(db_path).read() as con:
+        assert con.execute("SELECT count(*) FROM transactions_hot").fetchone()[0] == 1
+        assert con.execute("SELECT sum(amount) FROM transactions WHERE type = 'DEBIT'").fetchone()[0] == 150.0
+    assert check_monthly_rollup(db_path) == []
+
+    # Re-ingesting an exported statement does not duplicate it
+    result = store_transactions_to_duckdb([txn(2, 100.0, 900.0, year=2023)], db_path)
+    assert result.startswith("Inserted 0 new")
+
+    # A fresh process finds the cold files from the stored settings
+    close_all()
+    duckdb_tools._initialized.clear()
+    init_duckdb(db_path)
+    assert duckdb_tools.query_duckdb_tool.invoke({"query": "SELECT count(*) AS n FROM transactions"}) == "n\n3"
+
+
+def test_failed_export_leaves_no_cold_files(db_path, tmp_path, monkeypatch):
+    store_transactions_to_duckdb([txn(2, 100.0, 900.0, year=2023), txn(4, 30.0, 850.0)], db_path)
+
+    def fail(con, cold_dir=None):
+        raise duckdb.IOException("disk full")
+
+    with monkeypatch.context() as m:
+        m.setattr(migrations, "create_transactions_view", fail)
+        with pytest.raises(duckdb.IOException):
+            export_cold_years(2025, db_path)
+
+    assert not list((tmp_path / "cold").rglob("*.parquet"))
+    assert not list(tmp_path.glob(".cold-staging-*"))
+    with get_pool(db_path).read() as con:
+        assert con.execute("SELECT count(*) FROM transactions").fetchone()[0] == 2
+
+    # A later export of the same partition keeps the earlier file
+    export_cold_years(2025, db_path)
+    store_transactions_to_duckdb([txn(9, 20.0, 880.0, year=2023)], db_path)
+    export_cold_years(2025, db_path)
+    assert len(list((tmp_path / "cold").rglob("*.parquet"))) == 2
+    with get_pool(db_path).read() as con:
+        assert con.execute("SELECT count(*) FROM transactions").fetchone()[0] == 3
+
+
+def test_cold_dedup_reads_only_the_batch_partitions(db_path, tmp_path):
+    store_transactions_to_duckdb([txn(2, 100.0, 900.0, year=2023),
+                                  txn(3, 20.0, 880.0, account_no="XXXXXXXX9999", year=2023)], db_path)
+    export_cold_years(2025, db_path)
+    # Unreadable, so a query that opens another partition fails (the schema comes from the first file)
+    other = tmp_path / "cold" / "account_no=XXXXXXXX9999" / "year=2023" / "broken.parquet"
+    other.write_text("not parquet")
+
+    assert store_transactions_to_duckdb([txn(2, 100.0, 900.0, year=2023)], db_path).startswith("Inserted 0 new")
+    assert store_transactions_to_duckdb([txn(5, 40.0, 860.0, year=2024)], db_path).startswith("Inserted 1 new")
@@ -0,0 +1,73 @@
+import pikepdf
+import pytest
+
+from pdf_extract import extract_pdf_pages, shutdown_pool
+from icici_parser import parse_icici_pages
+
+
+def write_pdf(path, pages):
+    """Writes a PDF with one page per list of text lines, in a standard (non-embedded) font."""
+    pdf = pikepdf.new()
+    font = pdf.make_indirect(pikepdf.Dictionary(
+        Type=pikepdf.Name.Font, Subtype=pikepdf.Name.Type1, BaseFont=pikepdf.Name.Helvetica
+    ))
+    for lines in pages:
+        ops = ["BT", "/F1 10 Tf", "14 TL", "40 800 Td"]
+        for line in lines:
+            ops.append(f"({line}) Tj T*")
+        ops.append("ET")
+        page = pdf.add_blank_page(page_size=(595, 842))
+        page.Resources = pikepdf.Dictionary(Font=pikepdf.Dictionary(F1=font))
+        page.Contents = pdf.make_stream("\n".join(ops).encode())
+    pdf.save(path)
+
+
+@pytest.fixture(scope="module", autouse=True)
+def stop_pool():
+    yield
+    shutdown_pool()
+
+
+def statement_pages(count):
+    pages = []
+    balance = 10000.00
+    for p in range(count):
+        lines = [f"{p + 1:02d}-05-2025 B/F {balance:.2f}"] if p == 0 else []
+        for r in range(3):
+            balance -= 10
+            lines.append(f"{p + 1:02d}-05-2025NET BANKING BIL/ONL/{p}{r} 10.00 {balance:.2f}")
+        pages.append(lines)
+    return pages
+
+
+def test_parallel_extraction_keeps_page_order(tmp_path):
+    path = str(tmp_path / "statement.pdf")
+    write_pdf(path, statement_pages(5))
+
+    serial = extract_pdf_pages(path, workers=1)
+    parallel = extract_pdf_pages(path, workers=3)
+
+    assert parallel == serial
+    assert len(parallel) == 5
+    assert parallel[4][-1].startswith("05-05-2025NET BANKING BIL/ONL/42")
+
+
+def test_balance_continuity_across_worker_boundaries(tmp_path):
+    path = str(tmp_path / "statement.pdf")
+    write_pdf(path, statement_pages(4))
+
+    df = parse_icici_pages(extract_pdf_pages(path, workers=2), "ICICI", "XXXXXXXX6193")
+
+    assert len(df) == 13
+    assert list(df["type"]) == ["BALANCE"] + ["DEBIT"] * 12
+
+
+def test_single_page_statement_skips_the_pool(tmp_path, monkeypatch):
+    path = str(tmp_path / "statement.pdf")
+    write_pdf(path, statement_pages(1))
+
+    def no_pool(workers):
+        raise AssertionError("pool should not be used for one page")
+
+    monkeypatch.setattr("pdf_extract._get_pool", no_pool)
+    assert len(extract_pdf_pages(path, workers=4)) == 1
@@ -0,0 +1,110 @@
+from datetime import datetime
+
+import pytest
+from langchain_core.messages import HumanMessage
+from langchain_core.runnables import RunnableLambda
+
+import graph
+import metrics
+from query_extractor import complete_query_info, extract_query_info, merge_query_info, missing_fields
+from schemas import QueryInfo
+from test_graph import FakeLLM, QUERY, db_path  # noqa: F401
+
+
+def test_fields_are_extracted_from_plain_text():
+    q = extract_query_info("How much did I spend in Sept 2024 on my icici account XXXXXXXX6193?")
+
+    assert (q.bank, q.account_no, q.month, q.year) == ("ICICI", "XXXXXXXX6193", "September", "2024")
+    assert q.intent == "get spending details"
+    assert missing_fields(q) == []
+
+
+def test_plain_account_numbers_are_masked_and_ranges_kept():
+    q = extract_query_info("HDFC 123456789469 statement 01-04-2025 to 15-05-2025")
+
+    assert q.account_no == "XXXXXXXX9469"
+    assert q.month == "April and May"
+    assert q.year == "2025"
+    assert q.date_range == "01-04-2025 to 15-05-2025"
+
+
+def test_may_as_a_word_is_not_a_month():
+    assert extract_query_info("What may I ask about?").month is None
+    assert extract_query_info("spending in May").month == "May"
+    assert missing_fields(extract_query_info("yes, proceed")) == ["bank", "month", "account_no"]
+
+
+def test_derived_fields_are_completed():
+    merged = merge_query_info(extract_query_info("May and June"), {"bank": "ICICI", "account_no": "XXXXXXXX6193"})
+
+    q = complete_query_info(merged, today=datetime(2025, 7, 1))
+
+    assert q.year == "2025"
+    assert q.date_range == "01-05-2025 to 30-06-2025"
+    assert q.query_hint == "subject:ICICI Bank Statement from 01-05-2025 to 30-06-2025 for XXXXXXXX6193"
+
+
+class CountingLLM(FakeLLM):
+    calls: list = []
+
+    def with_structured_output(self, schema, **kwargs):
+        def parse(messages):
+            self.calls.append(messages[-1].content)
+            return QueryInfo(bank="ICICI", account_no="XXXXXXXX6193")
+        return RunnableLambda(parse)
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    fake = CountingLLM(messages=iter([]), calls=[])
+    monkeypatch.setattr(graph, "get_llm", lambda model: fake)
+    metrics.reset()
+    return fake
+
+
+def validate(text):
+    return graph.build_graph("fake").invoke({"messages": [HumanMessage(content=text)]})
+
+
+def test_complete_messages_skip_the_llm(llm):
+    final = validate("Total spending of ICICI XXXXXXXX6193 in May 2025")
+
+    assert llm.calls == []
+    assert final["validated_query"].date_range == QUERY.date_range
+    assert final["awaiting_confirmation"]
+    assert metrics.snapshot()["counters"]["query_extractor.fast_path"] == 1
+
+
+def test_incomplete_messages_fall_back_to_the_llm(llm):
+    final = validate("spending in May 2025 please")
+
+    assert llm.calls == ["spending in May 2025 please"]
+    q = final["validated_query"]
+    assert (q.bank, q.account_no, q.month, q.year) == ("ICICI", "XXXXXXXX6193", "May", "2025")
+    assert metrics.snapshot()["counters"]["query_extractor.llm_fallback"] == 1
+
+
+@pytest.mark.parametrize("date_range, hint_range", [
+    ("15-05-2025 to 20-05-2025", "from 15-05-2025 to 20-05-2025"),
+    ("01-12-2024 to 31-01-2025", "from 01-12-2024 to 31-01-2025"),
+])
+def test_confirm_turn_keeps_the_stored_range(llm, db_path, date_range, hint_range):
+    asked = validate(f"ICICI XXXXXXXX6193 spending {date_range}")
+    assert asked["validated_query"].date_range == date_range
+
+    state = {**asked, "messages": asked["messages"] + [HumanMessage(content="yes, proceed")]}
+    confirmed = graph.build_graph("fake").invoke(state)
+
+    q = confirmed["validated_query"]
+    assert q.date_range == date_range
+    assert hint_range in q.query_hint
+    assert llm.calls == []
+
+
+def test_new_month_replaces_the_stored_range(llm):
+    asked = validate("ICICI XXXXXXXX6193 spending 15-05-2025 to 20-05-2025")
+    state = {**asked, "messages": asked["messages"] + [HumanMessage(content="what about June?")]}
+
+    q = graph.build_graph("fake").invoke(state)["validated_query"]
+
+    assert q.date_range == "01-06-2025 to 30-06-2025"
@@ -0,0 +1,83 @@
+from datetime import date
+
+from langchain_core.runnables import RunnableLambda
+
+import duckdb_tools
+import graph
+import response_cache
+from test_graph import FakeLLM, confirmed_state, db_path, run  # noqa: F401
+
+
+class UnusedLLM(FakeLLM):
+    def bind_tools(self, tools, **kwargs):
+        def fail(messages):
+            raise AssertionError("the LLM should not be called")
+        return RunnableLambda(fail)
+
+
+def store(db_path, day, amount):
+    duckdb_tools.store_transactions_to_duckdb(
+        [{"date": date(2025, 5, day), "description": f"UPI/ZOMATO/{day}", "amount": amount, "balance": 90.0,
+          "mode": "UPI", "type": "DEBIT", "receiver": "ZOMATO", "bank": "ICICI", "account_no": "XXXXXXXX6193"}],
+        db_path, coverage=[("ICICI", "XXXXXXXX6193", date(2025, 5, 1), date(2025, 5, 31))],
+    )
+
+
+def test_data_version_moves_only_on_new_rows(db_path):
+    assert duckdb_tools.data_version("ICICI", "XXXXXXXX6193", db_path) == 0
+    store(db_path, 3, 10.0)
+    store(db_path, 3, 10.0)
+    assert duckdb_tools.data_version("icici", "XXXXXXXX6193", db_path) == 1
+    store(db_path, 4, 20.0)
+    assert duckdb_tools.data_version("ICICI", "XXXXXXXX6193", db_path) == 2
+
+
+def test_repeated_question_is_answered_from_the_cache(db_path, monkeypatch):
+    store(db_path, 3, 10.0)
+    first = run(confirmed_state())
+    assert response_cache.stats()["entries"] == 1
+
+    monkeypatch.setattr(graph, "get_llm", lambda model: UnusedLLM(messages=iter([])))
+    second = run(confirmed_state())
+
+    assert second["cached_response"] is True
+    assert second["messages"][-1].content == first["messages"][-1].content
+    assert response_cache.stats()["hits"] == 1
+
+
+def test_new_transactions_invalidate_the_answer(db_path):
+    store(db_path, 3, 10.0)
+    run(confirmed_state())
+    store(db_path, 4, 20.0)
+
+    final = run(confirmed_state())
+
+    assert final["cached_response"] is False
+    assert response_cache.stats()["misses"] == 2
+
+
+def test_other_question_about_the_same_month_is_not_served_from_the_cache(db_path):
+    store(db_path, 3, 10.0)
+
+    def asked(question):
+        return {**confirmed_state(), "question": question, "awaiting_confirmation": True}
+
+    first = run(asked("total spending in May 2025"))
+    again = run(asked("Total spending  in May 2025"))
+    other = run(asked("How much did I spend on Zomato in May 2025"))
+
+    assert first["question"] == "total spending in May 2025"
+    assert again["cached_response"] is True
+    assert other["cached_response"] is False
+    assert response_cache.stats()["entries"] == 2
+
+
+def test_least_recently_used_answers_are_evicted(monkeypatch):
+    monkeypatch.setattr(response_cache, "RESPONSE_CACHE_SIZE", 2)
+    response_cache.clear()
+    for n in range(3):
+        response_cache.put(("q", n), f"answer {n}")
+    assert response_cache.get(("q", 0)) is None
+    assert response_cache.get(("q", 2)) == "answer 2"
+    assert response_cache.stats() == {"entries": 2, "max_entries": 2, "hits": 1, "misses": 1, "hit_rate": 0.5}
+    response_cache.clear()
@@ -0,0 +1,124 @@
+import asyncio
+import time
+from typing import Annotated
+from typing_extensions import TypedDict
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.graph import StateGraph, START, END
+from langgraph.graph.message import add_messages
+
+import duckdb_tools
+import graph
+import sessions
+from db_pool import close_all
+from sessions import SessionSaver
+from streaming import stream_chat_tokens
+from test_graph import FakeLLM, QUERY
+
+
+class State(TypedDict):
+    messages: Annotated[list, add_messages]
+
+
+def echo_graph():
+    def reply(state):
+        return {"messages": [AIMessage(content=f"seen {len(state['messages'])}")]}
+
+    builder = StateGraph(State)
+    builder.add_node("chatbot", reply)
+    builder.add_edge(START, "chatbot")
+    builder.add_edge("chatbot", END)
+    return builder.compile()
+
+
+@pytest.fixture
+def session_db(tmp_path, monkeypatch):
+    path = str(tmp_path / "sessions.db")
+    monkeypatch.setattr(sessions, "SESSION_DB_PATH", path)
+    yield path
+    sessions.close()
+
+
+def turn(bound, thread_id, text):
+    return bound.invoke({"messages": [HumanMessage(content=text)]}, sessions.session_config(thread_id))
+
+
+def test_thread_resumes_from_the_stored_checkpoint(session_db):
+    bound = sessions.session_graph(echo_graph())
+
+    turn(bound, "t1", "hello")
+    final = turn(bound, "t1", "again")
+    other = turn(bound, "t2", "hello")
+
+    assert final["messages"][-1].content == "seen 3"
+    assert other["messages"][-1].content == "seen 1"
+
+    # A new process reads the same file
+    reopened = echo_graph().copy(update={"checkpointer": SessionSaver(session_db)})
+    assert turn(reopened, "t1", "third")["messages"][-1].content == "seen 5"
+
+
+def test_streamed_turns_use_the_async_checkpointer(session_db):
+    bound = sessions.session_graph(echo_graph())
+
+    async def run(text):
+        state = {"messages": [HumanMessage(content=text)]}
+        return [c async for c in stream_chat_tokens(bound, state, sessions.session_config("t1"))]
+
+    asyncio.run(run("hello"))
+    assert asyncio.run(run("again")) == ["seen 3"]
+
+
+def test_compaction_keeps_only_the_latest_checkpoint(session_db):
+    bound = sessions.session_graph(echo_graph())
+    for text in ("one", "two", "three"):
+        turn(bound, "t1", text)
+    saver = sessions.get_checkpointer()
+    assert len(list(saver.list(sessions.session_config("t1")))) > 1
+
+    sessions.compact_thread("t1")
+
+    assert len(list(saver.list(sessions.session_config("t1")))) == 1
+    assert turn(bound, "t1", "four")["messages"][-1].content == "seen 7"
+
+
+def test_idle_threads_are_evicted(session_db):
+    bound = sessions.session_graph(echo_graph())
+    turn(bound, "old", "hello")
+    time.sleep(0.05)
+    turn(bound, "new", "hello")
+
+    assert sessions.evict_idle(ttl_seconds=0.04) == 1
+    assert sessions.get_checkpointer().get_tuple(sessions.session_config("old")) is None
+    assert sessions.stats()["threads"] == 1
+
+
+def test_finance_graph_does_not_repeat_the_plan(session_db, tmp_path, monkeypatch):
+    db_path = str(tmp_path / "finance.db")
+    monkeypatch.setattr(duckdb_tools, "DB_PATH", db_path)
+    monkeypatch.setattr(graph, "is_range_covered",
+                        lambda bank, account_no, start, end: duckdb_tools.is_range_covered(bank, account_no, start, end, db_path))
+    monkeypatch.setattr(graph, "get_llm", lambda model: FakeLLM(messages=iter([])))
+    bound = sessions.session_graph(graph.build_graph("fake"))
+
+    bound.invoke({"messages": [HumanMessage(content="spending in May")], "validated_query": QUERY.model_dump()},
+                 sessions.session_config("t1"))
+    final = turn(bound, "t1", "yes, proceed")
+    close_all()
+
+    plans = [m for m in final["messages"] if isinstance(m, AIMessage) and m.content.startswith("<plan>")]
+    assert len(plans) == 1
+    assert final["validated_query"].account_no == "XXXXXXXX6193"
+    assert final["messages"][-1].content.startswith("\n[")
+
+
+def test_deleted_session_starts_over(session_db):
+    bound = sessions.session_graph(echo_graph())
+    turn(bound, "t1", "hello")
+    turn(bound, "t2", "hello")
+
+    sessions.delete_session("t1")
+
+    assert sessions.stats()["threads"] == 1
+    assert turn(bound, "t1", "again")["messages"][-1].content == "seen 1"
@@ -0,0 +1,31 @@
+import os
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Must only be imported on first use, see "Startup budget" in the README
+LAZY_MODULES = ["langchain_ollama", "langchain_google_genai", "googleapiclient", "pikepdf", "pdfplumber", "pandas"]
+
+
+# Imports main and runs the app's startup and shutdown, as uvicorn does
+LIFESPAN_CODE = f"""
+import asyncio, sys, main
+
+async def serve():
+    async with main.lifespan(main.app):
+        pass
+
+asyncio.run(serve())
+print('loaded:', [m for m in {LAZY_MODULES!r} if m in sys.modules])
+"""
+
+
+def test_starting_the_app_leaves_providers_and_ingestion_stacks_unloaded(tmp_path):
+    env = {k: v for k, v in os.environ.items() if k != "FINMATE_WARMUP_MODELS"}
+    env["PYTHONPATH"] = BACKEND_DIR
+    # The databases and the log are created in the working directory
+    result = subprocess.run([sys.executable, "-c", LIFESPAN_CODE], cwd=tmp_path, env=env,
+                            capture_output=True, text=True, check=True)
+
+    assert "loaded: []" in result.stdout.splitlines()
@@ -0,0 +1,152 @@
+import asyncio
+import json
+from typing import Annotated, Optional
+from typing_extensions import TypedDict
+
+from fastapi.testclient import TestClient
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.tools import tool
+from langgraph.graph import StateGraph, START, END
+from langgraph.graph.message import add_messages
+from langgraph.prebuilt import tools_condition
+
+import admission
+from schemas import QueryInfo
+from streaming import ThinkSplitter, TokenBatcher, stream_chat_events, stream_chat_tokens
+from tool_runner import ToolRunner
+
+
+class State(TypedDict):
+    messages: Annotated[list, add_messages]
+    validated_query: Optional[QueryInfo]
+
+
+def build_test_graph(node_name, answer):
+    llm = GenericFakeChatModel(messages=iter([AIMessage(content=answer)]))
+
+    def chatbot(state):
+        return {"messages": [llm.invoke(state["messages"])]}
+
+    def clarify(state):
+        return {"messages": [AIMessage(content=answer)]}
+
+    builder = StateGraph(State)
+    builder.add_node(node_name, chatbot if node_name == "chatbot" else clarify)
+    builder.add_edge(START, node_name)
+    builder.add_edge(node_name, END)
+    return builder.compile()
+
+
+async def collect(graph, state):
+    return [chunk async for chunk in stream_chat_tokens(graph, state)]
+
+
+def test_chatbot_tokens_are_streamed_with_trailer():
+    graph = build_test_graph("chatbot", "total spending is 500")
+    state = {
+        "messages": [{"role": "user", "content": "spending in May"}],
+        "validated_query": QueryInfo(bank="ICICI"),
+    }
+    chunks = asyncio.run(collect(graph, state))
+
+    assert len(chunks) > 2
+    assert "".join(chunks[:-1]) == "total spending is 500"
+    assert chunks[-1].startswith("<END::validated_query:")
+    assert '"bank": "ICICI"' in chunks[-1]
+
+
+def test_non_streaming_node_message_is_sent_once():
+    graph = build_test_graph("clarify", "Please provide the bank")
+    state = {"messages": [{"role": "user", "content": "hello"}], "validated_query": None}
+    chunks = asyncio.run(collect(graph, state))
+
+    assert chunks == ["Please provide the bank"]
+
+
+async def collect_events(graph, state):
+    return [json.loads(line) async for line in stream_chat_events(graph, state, trace_id="t-1")]
+
+
+def test_think_tags_split_across_chunks():
+    splitter = ThinkSplitter()
+    pieces = []
+    for chunk in ["<th", "ink>why</th", "ink>answer <", "b>"]:
+        pieces += splitter.feed(chunk)
+    pieces += splitter.flush()
+
+    assert pieces == [("think", "why"), ("token", "answer "), ("token", "<b>")]
+
+
+def test_tokens_are_coalesced_into_batches():
+    batcher = TokenBatcher(chunk_chars=10, flush_seconds=60)
+    events = []
+    for _ in range(12):
+        events += batcher.add("token", "ab")
+    events += batcher.add("think", "x") + batcher.flush()
+
+    assert [e["text"] for e in events] == ["ababababab", "ababababab", "abab", "x"]
+    assert events[-1]["type"] == "think"
+
+
+def test_chatbot_answer_is_sent_as_events():
+    graph = build_test_graph("chatbot", "<think>user wants May</think>total spending is 500 in May 2025")
+    state = {
+        "messages": [{"role": "user", "content": "spending in May"}],
+        "validated_query": QueryInfo(bank="ICICI"),
+    }
+    events = asyncio.run(collect_events(graph, state))
+    tokens = [e for e in events if e["type"] == "token"]
+
+    assert "".join(e["text"] for e in events if e["type"] == "think") == "user wants May"
+    assert "".join(e["text"] for e in tokens) == "total spending is 500 in May 2025"
+    # GenericFakeChatModel streams word by word; the client gets fewer, larger updates
+    assert len(tokens) < len("total spending is 500 in May 2025".split(" "))
+    assert events[-2] == {"type": "validated_query", "data": QueryInfo(bank="ICICI").model_dump()}
+    assert events[-1]["type"] == "done" and events[-1]["trace_id"] == "t-1"
+    assert events[-1]["events"] == len(events) and events[-1]["first_token_ms"] is not None
+
+
+def test_tool_calls_are_reported():
+    @tool
+    def add(a: int, b: int) -> int:
+        """Adds two numbers."""
+        return a + b
+
+    llm = GenericFakeChatModel(messages=iter([AIMessage(content="The sum is 3")]))
+
+    async def chatbot(state):
+        if len(state["messages"]) == 1:
+            call = {"name": "add", "args": {"a": 1, "b": 2}, "id": "call_1"}
+            return {"messages": [AIMessage(content="", tool_calls=[call])]}
+        return {"messages": [await llm.ainvoke(state["messages"])]}
+
+    builder = StateGraph(State)
+    builder.add_node("chatbot", chatbot)
+    builder.add_node("tools", ToolRunner([add]).ainvoke)
+    builder.add_edge(START, "chatbot")
+    builder.add_conditional_edges("chatbot", tools_condition)
+    builder.add_edge("tools", "chatbot")
+    events = asyncio.run(collect_events(builder.compile(), {"messages": [{"role": "user", "content": "1+2"}]}))
+    types = [e["type"] for e in events]
+
+    assert types.index("tool_start") < types.index("tool_end") < types.index("token")
+    start, end = events[types.index("tool_start")], events[types.index("tool_end")]
+    assert (start["name"], start["args"]) == ("add", {"a": 1, "b": 2})
+    assert (end["id"], end["name"], end["status"]) == ("call_1", "add", "success")
+    assert "".join(e["text"] for e in events if e["type"] == "token") == "The sum is 3"
+    assert "validated_query" not in types and types[-1] == "done"
+
+
+def test_chat_endpoint_streams_ndjson(monkeypatch):
+    import main
+
+    monkeypatch.setattr(main, "get_graph", lambda model: build_test_graph("chatbot", "total spending is 500"))
+    response = TestClient(main.app).post("/chat", json={"messages": [{"role": "user", "content": "spending"}],
+                                                        "model": "fake:model", "events": True})
+    admission.reset()
+    events = [json.loads(line) for line in response.text.splitlines()]
+
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    assert "".join(e["text"] for e in events if e["type"] == "token") == "total spending is 500"
+    assert events[-1]["type"] == "done" and events[-1]["trace_id"] == response.headers["X-Trace-Id"]
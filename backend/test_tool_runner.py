@@ -0,0 +1,71 @@
+import asyncio
+import threading
+import time
+
+from langchain_core.messages import AIMessage, ToolMessage
+from langchain_core.tools import tool
+
+import tool_runner
+from tool_runner import ToolRunner
+
+running = []
+peak = []
+lock = threading.Lock()
+
+
+@tool
+def slow_lookup(account_no: str) -> str:
+    """Returns the account after a while."""
+    with lock:
+        running.append(account_no)
+        peak.append(len(running))
+    time.sleep(0.2)
+    with lock:
+        running.remove(account_no)
+    return f"balance of {account_no}"
+
+
+@tool
+def broken(account_no: str) -> str:
+    """Always fails."""
+    raise RuntimeError("statement is corrupt")
+
+
+def step(*calls):
+    tool_calls = [{"name": name, "args": {"account_no": account}, "id": f"call_{i}"}
+                  for i, (name, account) in enumerate(calls)]
+    return {"messages": [AIMessage(content="", tool_calls=tool_calls)]}
+
+
+def test_calls_of_one_step_run_together_in_call_order():
+    runner = ToolRunner([slow_lookup])
+    state = step(*(("slow_lookup", f"XXXXXXXX000{i}") for i in range(3)))
+
+    start = time.perf_counter()
+    messages = runner.invoke(state)["messages"]
+    elapsed = time.perf_counter() - start
+
+    assert elapsed < 0.5
+    assert [m.tool_call_id for m in messages] == ["call_0", "call_1", "call_2"]
+    assert messages[2].content == "balance of XXXXXXXX0002"
+
+
+def test_async_step_is_bounded_by_the_worker_count(monkeypatch):
+    monkeypatch.setattr(tool_runner, "TOOL_WORKERS", 2)
+    peak.clear()
+    runner = ToolRunner([slow_lookup])
+
+    messages = asyncio.run(runner.ainvoke(step(*(("slow_lookup", f"XXXXXXXX000{i}") for i in range(4)))))["messages"]
+
+    assert len(messages) == 4 and max(peak) == 2
+
+
+def test_failed_and_unknown_calls_become_error_messages():
+    runner = ToolRunner([slow_lookup, broken])
+
+    messages = runner.invoke(step(("broken", "X"), ("missing_tool", "X"), ("slow_lookup", "X")))["messages"]
+
+    assert all(isinstance(m, ToolMessage) for m in messages)
+    assert messages[0].status == "error" and "statement is corrupt" in messages[0].content
+    assert messages[1].status == "error" and "not a valid tool" in messages[1].content
+    assert messages[2].content == "balance of X"
@@ -0,0 +1,111 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+import pytest
+from fastapi.testclient import TestClient
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.runnables import RunnableLambda
+
+import duckdb_tools
+import graph
+import metrics
+import response_cache
+import tracing
+from db_pool import close_all
+from schemas import QueryInfo
+
+QUERY = QueryInfo(intent="total spending", bank="ICICI", account_no="XXXXXXXX6193", month="May", year="2025",
+                  date_range="01-05-2025 to 31-05-2025")
+USAGE = {"input_tokens": 120, "output_tokens": 30, "total_tokens": 150}
+
+
+class ToolCallingLLM(GenericFakeChatModel):
+    """Calls query_duckdb_tool once, then answers."""
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def with_structured_output(self, schema, **kwargs):
+        return RunnableLambda(lambda messages: QUERY)
+
+
+@pytest.fixture
+def traces(tmp_path, monkeypatch):
+    path = tmp_path / "traces.jsonl"
+    monkeypatch.setattr(tracing, "TRACE_PATH", str(path))
+    metrics.reset()
+    yield lambda: [json.loads(line) for line in path.read_text().splitlines()]
+    tracing.close()
+    metrics.reset()
+
+
+def test_spans_nest_and_are_written(traces):
+    with tracing.span("request", model="fake") as request:
+        with tracing.span("node.chatbot"):
+            pass
+        with pytest.raises(ValueError):
+            with tracing.span("tool.query"):
+                raise ValueError("bad sql")
+
+    records = {r["name"]: r for r in traces()}
+    assert records["request"]["parent_id"] is None and records["request"]["model"] == "fake"
+    assert {records["node.chatbot"]["trace_id"], records["tool.query"]["trace_id"]} == {request.trace_id}
+    assert records["node.chatbot"]["parent_id"] == request.span_id
+    assert records["tool.query"]["status"] == "error" and "bad sql" in records["tool.query"]["error"]
+    assert set(tracing.stage_latencies()) == {"request", "node.chatbot", "tool.query"}
+    assert tracing.current_span() is None
+
+
+def test_worker_threads_join_the_trace(traces):
+    with tracing.span("request") as request:
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            list(pool.map(tracing.in_context(tracing.traced("decrypt")(lambda i: i)), range(4)))
+
+    decrypts = [r for r in traces() if r["name"] == "decrypt"]
+    assert len(decrypts) == 4
+    assert all(r["trace_id"] == request.trace_id and r["parent_id"] == request.span_id for r in decrypts)
+
+
+def test_graph_run_traces_nodes_llm_calls_and_tools(traces, tmp_path, monkeypatch):
+    db_path = str(tmp_path / "finance.db")
+    monkeypatch.setattr(duckdb_tools, "DB_PATH", db_path)
+    monkeypatch.setattr(graph, "is_range_covered", lambda *args: True)
+    answers = iter([
+        AIMessage(content="", usage_metadata=USAGE,
+                  tool_calls=[{"name": "query_duckdb_tool", "args": {"query": "SELECT 1 AS one"}, "id": "call_1"}]),
+        AIMessage(content="The answer is 1", usage_metadata=USAGE),
+    ])
+    monkeypatch.setattr(graph, "get_llm", lambda model: ToolCallingLLM(messages=answers))
+    response_cache.clear()
+    duckdb_tools.init_duckdb(db_path)
+
+    with tracing.span("request") as request:
+        final = graph.build_graph("fake").invoke(
+            {"messages": [HumanMessage(content="yes, proceed")], "validated_query": QUERY.model_dump()})
+    close_all()
+    response_cache.clear()
+
+    assert final["messages"][-1].content.endswith("The answer is 1")
+    records = traces()
+    names = [r["name"] for r in records]
+    for name in ("node.planning", "node.validate", "node.confirm", "node.coverage", "node.chatbot", "node.tools",
+                 "tool.query_duckdb_tool", "duckdb.query", "request"):
+        assert name in names
+    assert names.count("llm.chatbot") == 2
+    assert all(r["trace_id"] == request.trace_id for r in records)
+    llm = next(r for r in records if r["name"] == "llm.chatbot")
+    assert (llm["input_tokens"], llm["output_tokens"]) == (120, 30)
+    by_id = {r["span_id"]: r for r in records}
+    assert by_id[next(r for r in records if r["name"] == "duckdb.query")["parent_id"]]["name"] == "tool.query_duckdb_tool"
+
+
+def test_metrics_endpoint_reports_stage_percentiles(traces):
+    from main import app
+
+    with tracing.span("node.chatbot"):
+        pass
+    body = TestClient(app).get("/metrics").json()
+    assert set(body["stages"]["node.chatbot"]) == {"count", "p50_ms", "p95_ms", "max_ms"}
+    assert "span.node.chatbot" in body["timings"]
@@ -0,0 +1,124 @@
+"""
+Tool execution node of the graph.
+
+Runs the tool calls of the last AI message at the same time, at most TOOL_WORKERS at once on
+a pool of its own, and returns their ToolMessages in call order. A step with several calls
+(three statements to decrypt, two accounts to query) takes about as long as its slowest
+call. Writers need no extra care here: store_transactions_to_duckdb goes through the
+DuckDB pool's write lock, so concurrent ingests only wait for each other while writing.
+"""
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import logging
+
+from langchain_core.messages import AIMessage, ToolMessage
+
+import metrics
+import tracing
+
+logger = logging.getLogger(__name__)
+
+# Tool calls of one step that run at the same time
+TOOL_WORKERS = int(os.getenv("FINMATE_TOOL_WORKERS", "4"))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def tool_executor() -> ThreadPoolExecutor:
+    """Pool the blocking tools run on, so they do not queue behind the app's default executor."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=TOOL_WORKERS, thread_name_prefix="tool")
+        return _executor
+
+
+def shutdown_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+        _executor = None
+
+
+def _error_message(call: dict, error: str) -> ToolMessage:
+    # Same shape as the prebuilt ToolNode's errors, so the LLM can correct the call
+    return ToolMessage(content=f"Error: {error}\n Please fix your mistakes.", name=call["name"],
+                       tool_call_id=call["id"], status="error")
+
+
+class ToolRunner:
+    def __init__(self, tools):
+        self.tools = {t.name: t for t in tools}
+
+    def _lookup(self, call: dict):
+        tool = self.tools.get(call["name"])
+        if tool is None:
+            raise LookupError(f"{call['name']} is not a valid tool, try one of [{', '.join(self.tools)}].")
+        return tool
+
+    def _run_one(self, call: dict, config) -> tuple:
+        start = time.perf_counter()
+        try:
+            with tracing.span(f"tool.{call['name']}"):
+                message = self._lookup(call).invoke({**call, "type": "tool_call"}, config)
+        except Exception as e:
+            logger.warning(f"Tool {call['name']} failed: {e}")
+            message = _error_message(call, repr(e))
+        return message, time.perf_counter() - start
+
+    async def _arun_one(self, call: dict, config, limit: asyncio.Semaphore) -> tuple:
+        async with limit:
+            tool = self.tools.get(call["name"])
+            if tool is None or not getattr(tool, "coroutine", None):
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(tool_executor(), tracing.in_context(self._run_one), call, config)
+            start = time.perf_counter()
+            try:
+                with tracing.span(f"tool.{call['name']}"):
+                    message = await tool.ainvoke({**call, "type": "tool_call"}, config)
+            except Exception as e:
+                logger.warning(f"Tool {call['name']} failed: {e}")
+                message = _error_message(call, repr(e))
+            return message, time.perf_counter() - start
+
+    def _result(self, calls: list, results: list, elapsed: float) -> dict:
+        timings = [seconds for _, seconds in results]
+        for call, seconds in zip(calls, timings):
+            logger.info(f"Tool {call['name']} took {seconds:.3f}s")
+        if len(calls) > 1:
+            logger.info(f"{len(calls)} tool calls in {elapsed:.3f}s (slowest {max(timings):.3f}s, "
+                        f"sum {sum(timings):.3f}s)")
+        metrics.incr("tools.calls", len(calls))
+        metrics.observe("tools.step", elapsed)
+        span = tracing.current_span()
+        if span is not None:
+            span.set(calls=len(calls), slowest_ms=round(max(timings, default=0) * 1000, 3),
+                     sum_ms=round(sum(timings) * 1000, 3))
+        return {"messages": [message for message, _ in results]}
+
+    @staticmethod
+    def _calls(state) -> list:
+        last = state["messages"][-1]
+        return list(last.tool_calls) if isinstance(last, AIMessage) else []
+
+    def invoke(self, state, config=None) -> dict:
+        calls = self._calls(state)
+        start = time.perf_counter()
+        if len(calls) <= 1:
+            results = [self._run_one(call, config) for call in calls]
+        else:
+            run_one = tracing.in_context(self._run_one)
+            results = list(tool_executor().map(lambda call: run_one(call, config), calls))
+        return self._result(calls, results, time.perf_counter() - start)
+
+    async def ainvoke(self, state, config=None) -> dict:
+        calls = self._calls(state)
+        start = time.perf_counter()
+        limit = asyncio.Semaphore(TOOL_WORKERS)
+        results = await asyncio.gather(*(self._arun_one(call, config, limit) for call in calls))
+        return self._result(calls, list(results), time.perf_counter() - start)
@@ -1,5 +1,7 @@
 from langchain.tools import tool
-from utils import search_gmail_with_pdfs, decrypt_with_pikepdf, parse_icici_statement, get_password_for_bank
+
+# The Gmail, PDF and pandas stacks behind these tools are imported when a tool first runs,
+# not when the graph is built, so starting the server does not pay for them
 
 @tool
 def add(a: int, b: int) -> int:
@@ -49,6 +51,7 @@ def fetch_gmail_pdfs(query: str) -> str:
     """
     try:
         print("Entering fetch_gmail_pdfs ...")
+        from utils import search_gmail_with_pdfs
         results = search_gmail_with_pdfs(query)
         return "\n\n".join(results)
     except Exception as e:
@@ -60,12 +63,12 @@ def decrypt_pdf_tool(path: str, bank: str = "ICICI") -> str:
     Decrypt a password-protected bank statement PDF using known password format.
     Currently supportly ICICI.
     """
+    from utils import decrypt_statement, get_password_for_bank
     password = get_password_for_bank(bank)
     if not password:
         return f"No password config found for bank: {bank}"
-    decrypted_path = path.replace(".pdf","_decrypted.pdf")
     try:
-        return decrypt_with_pikepdf(path, decrypted_path, password)
+        return decrypt_statement(path, password)
     except ValueError:
         return f"Failed to decrypt PDF with known password at {path}"
 
@@ -75,4 +78,26 @@ def extract_and_store_transactions_tool(path: str, bank: str, account_no: str) -
     It also takes the bank and account number from validated_query dictonary available.
     Finally store the list of transactions into DuckDB database."""
 
-    return parse_icici_statement(path, bank, account_no)
\ No newline at end of file
+    from utils import parse_icici_statement
+    return parse_icici_statement(path, bank, account_no)
+
+
+@tool
+def bulk_ingest_statements_tool(start_date: str, end_date: str, account_nos: list[str], bank: str = "ICICI") -> str:
+    """
+    Loads all bank statements of one or more accounts for a date range in a single step.
+    Searches Gmail, downloads, decrypts and parses every statement, and stores the transactions in DuckDB.
+    Use this instead of fetch_gmail_pdfs/decrypt_pdf_tool/extract_and_store_transactions_tool when
+    several months or several accounts are needed.
+
+    Args:
+        start_date: start of the range in dd-mm-yyyy format
+        end_date: end of the range in dd-mm-yyyy format
+        account_nos: masked account numbers, e.g. ["XXXXXXXX6193", "XXXXXXXX9469"]
+        bank: bank name, currently only ICICI
+    """
+    try:
+        from ingest import bulk_ingest, format_report
+        return format_report(bulk_ingest(start_date, end_date, account_nos, bank))
+    except Exception as e:
+        return f"Error during bulk ingestion: {e}"
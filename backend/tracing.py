@@ -0,0 +1,213 @@
+"""
+Per-request latency tracing.
+
+A span times one stage of a request: the request itself, a graph node, an LLM call or a
+tool (Gmail, decrypt, parse, DuckDB). The current span is kept in a contextvar, so a span
+opened inside another one joins its trace. Every finished span is observed in metrics as
+`span.<name>` (p50/p95 at /metrics) and, when FINMATE_TRACE_PATH is set, appended to that
+file as one JSON line.
+"""
+import asyncio
+import contextvars
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+import logging
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.runnables.config import ensure_config, merge_configs
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# JSONL file the finished spans are appended to; empty keeps them in metrics only
+TRACE_PATH = os.getenv("FINMATE_TRACE_PATH", "")
+
+_current = contextvars.ContextVar("finmate_span", default=None)
+_sink = None
+_sink_lock = threading.Lock()
+
+
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "started", "attrs")
+
+    def __init__(self, name: str, trace_id: str, parent_id: str = None, attrs: dict = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.started = time.time()
+        self.attrs = dict(attrs or {})
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def add(self, **counts):
+        """Adds to numeric attributes, e.g. the token counts of several LLM generations."""
+        for key, value in counts.items():
+            self.attrs[key] = self.attrs.get(key, 0) + (value or 0)
+
+
+def new_trace_id() -> str:
+    return uuid.uuid4().hex
+
+
+def current_span():
+    return _current.get()
+
+
+@contextmanager
+def span(name: str, trace_id: str = None, **attrs):
+    """
+    Times the block as span `name`, a child of the current span. Without a current span
+    (or with an explicit `trace_id`) it starts a trace. Yields the Span for adding attributes.
+    """
+    parent = _current.get()
+    if trace_id is None and parent is not None:
+        s = Span(name, parent.trace_id, parent.span_id, attrs)
+    else:
+        s = Span(name, trace_id or new_trace_id(), None, attrs)
+    token = _current.set(s)
+    status = "ok"
+    start = time.perf_counter()
+    try:
+        yield s
+    except (GeneratorExit, KeyboardInterrupt, asyncio.CancelledError):
+        status = "cancelled"
+        raise
+    except Exception as e:
+        status = "error"
+        s.attrs["error"] = f"{type(e).__name__}: {e}"[:200]
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        try:
+            _current.reset(token)
+        except ValueError:
+            # Closed from another context, e.g. a stream the client abandoned
+            pass
+        _finish(s, seconds, status)
+
+
+def traced(name: str, **attrs):
+    """Decorator running every call of the function (sync or async) in span `name`."""
+    def decorator(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(name, **attrs):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name, **attrs):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+async def trace_stream(chunks, name: str, trace_id: str = None, **attrs):
+    """Re-yields the async iterator `chunks` inside span `name`, so the span covers the whole stream."""
+    with span(name, trace_id=trace_id, **attrs):
+        async for chunk in chunks:
+            yield chunk
+
+
+def in_context(fn):
+    """
+    Wraps `fn` to run in a copy of the caller's context. Thread pools do not carry
+    contextvars, so without it spans opened by the workers would start traces of their own.
+    """
+    context = contextvars.copy_context()
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        # A Context can be entered by one thread at a time; every call gets its own copy
+        return context.copy().run(fn, *args, **kwargs)
+    return wrapper
+
+
+class TokenUsage(BaseCallbackHandler):
+    """Adds the token counts reported by the model to a span."""
+
+    def __init__(self, target: Span):
+        self.target = target
+
+    def on_llm_end(self, response, **kwargs):
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                self.target.add(input_tokens=usage.get("input_tokens", 0),
+                                output_tokens=usage.get("output_tokens", 0))
+
+
+def invoke_llm(runnable, messages, node: str):
+    """
+    Invokes `runnable` (a chat model, possibly with tools or structured output) in span
+    `llm.<node>`, recording the token usage. The callbacks of the enclosing graph run are
+    kept, so token streaming still works.
+    """
+    with span(f"llm.{node}") as s:
+        config = merge_configs(ensure_config(), {"callbacks": [TokenUsage(s)]})
+        return runnable.invoke(messages, config)
+
+
+async def ainvoke_llm(runnable, messages, node: str):
+    """Async invoke_llm: awaits the model without holding a thread."""
+    with span(f"llm.{node}") as s:
+        config = merge_configs(ensure_config(), {"callbacks": [TokenUsage(s)]})
+        return await runnable.ainvoke(messages, config)
+
+
+def _finish(s: Span, seconds: float, status: str):
+    metrics.observe(f"span.{s.name}", seconds)
+    if status != "ok":
+        metrics.incr(f"span.{s.name}.{status}")
+    if not TRACE_PATH:
+        return
+    record = {
+        "trace_id": s.trace_id,
+        "span_id": s.span_id,
+        "parent_id": s.parent_id,
+        "name": s.name,
+        "start": round(s.started, 6),
+        "duration_ms": round(seconds * 1000, 3),
+        "status": status,
+        **s.attrs,
+    }
+    _write(json.dumps(record, default=str))
+
+
+def _write(line: str):
+    global _sink
+    try:
+        with _sink_lock:
+            if _sink is None or _sink.name != TRACE_PATH:
+                if _sink is not None:
+                    _sink.close()
+                _sink = open(TRACE_PATH, "a", encoding="utf-8")
+            _sink.write(line + "\n")
+            _sink.flush()
+    except OSError as e:
+        logger.warning(f"Could not write trace to {TRACE_PATH}: {e}")
+
+
+def stage_latencies() -> dict:
+    """p50/p95/max latency per span name, from metrics."""
+    timings = metrics.snapshot()["timings"]
+    return {name[len("span."):]: summary for name, summary in timings.items() if name.startswith("span.")}
+
+
+def close():
+    global _sink
+    with _sink_lock:
+        if _sink is not None:
+            _sink.close()
+        _sink = None
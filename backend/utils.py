@@ -1,23 +1,27 @@
 import os
+import re
 import base64
 import pprint
+import tempfile
 import mimetypes
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
 from email import message_from_bytes
+from datetime import datetime
 import pikepdf
-import pdfplumber
 import json
-import re
-from datetime import datetime
 from duckdb_tools import store_transactions_to_duckdb
+from icici_parser import parse_icici_pages
+from pdf_extract import extract_pdf_pages
+import artifact_cache
+import tracing
+from gmail_client import get_gmail_client
 
 # from logger import setup_logger
 # logger = setup_logger()
 import logging
 logger = logging.getLogger(__name__)
 
-SCOPES = ["https://www.googleapis.com/auth/gmail.readonly"]
+# Statement period in the subject of a bank statement mail
+SUBJECT_PERIOD_RE = re.compile(r"from (\d{2}-\d{2}-\d{4}) to (\d{2}-\d{2}-\d{4})")
 
 def print_email_summary(message):
     logger.info(f"Enetering print_email_summary()")
@@ -43,15 +47,14 @@ def print_email_summary(message):
 
     if body_data:
         decoded_bytes = base64.urlsafe_b64decode(body_data.encode("UTF-8"))
-        logger.info(f"Body:\n {decoded_bytes.decode("utf-8", errors="replace")}")
+        logger.info(f"Body:\n {decoded_bytes.decode('utf-8', errors='replace')}")
     else:
         logger.info(f"No plain text body found")
 
 def extract_message_from_query(query):
     logger.info(f"Entering extract_message_from_query() with query: {query}")
-    service = get_gmail_service()
-    results = service.users().messages().list(userId="me", q=query).execute()
-    messages = results.get("messages", [])
+    client = get_gmail_client()
+    messages = client.list_messages(query)
 
     if not messages:
         logger.info(f" NO messages found for query : {query}")
@@ -59,38 +62,68 @@ def extract_message_from_query(query):
     
     logger.info(f"✅ Found {len(messages)} message(s) for query")
     
-    for i, msg_data in enumerate(messages[:3], 1):
-        msg_id = msg_data["id"]
-        msg = service.users().messages().get(userId="me", id=msg_id, format="full").execute()
-
-        print(f"🔍 Processing message {i} (ID: {msg_id})")
+    for i, msg in enumerate(client.get_messages([m["id"] for m in messages[:3]]), 1):
+        print(f"🔍 Processing message {i} (ID: {msg['id']})")
         print_email_summary(msg)
 
-def save_pdf_from_message(msg, service, output_dir="downloads"):
+def get_message_subject(message):
+    headers = message.get("payload", {}).get("headers", [])
+    return next((h["value"] for h in headers if h["name"].lower() == "subject"), "(No Subject)")
+
+def statement_period(subject: str):
+    """Returns the (start, end) dates of the statement period in the mail subject, or None."""
+    m = SUBJECT_PERIOD_RE.search(subject or "")
+    if not m:
+        return None
+    return tuple(datetime.strptime(value, "%d-%m-%Y").date() for value in m.groups())
+
+def save_pdf_from_message(msg, client, output_dir="downloads"):
     logger.info(f"Entering save_pdf_from_message() ...")
+    found_pdfs = [f"Downloaded: {path}" for path in download_pdf_attachments(msg, client, output_dir)]
+    logger.info(f"PDFs found : {found_pdfs}")
+    logger.info(f"Exitting save_pdf_from_message() ...")
+    return found_pdfs
+
+def download_pdf_attachments(msg, client, output_dir="downloads"):
+    """
+    Writes every PDF attachment of the message to `output_dir/<message id>/` and returns the file paths.
+    `client` is a GmailClient. Banks reuse attachment names every month ("Statement.pdf"),
+    so each message gets a directory of its own.
+    """
     found_pdfs = []
     payload = msg.get("payload", {})
     parts = payload.get("parts", [])
+    # Kept with the download, so storing the statement later can record the whole period as covered
+    period = statement_period(get_message_subject(msg))
 
     def process_part(part):
         filename = part.get("filename")
         body = part.get("body", {})
         if filename and filename.endswith(".pdf"):
+            # Inline attachments have no id; the file name identifies them within the message
+            att_key = body.get("attachmentId") or filename
+            cached = artifact_cache.lookup_attachment(msg["id"], att_key)
+            if cached:
+                logger.info(f"Using cached download for {filename}: {cached['pdf_path']}")
+                found_pdfs.append(cached["pdf_path"])
+                return
+
             file_data = body.get("data")
             if not file_data and "attachmentId" in body:
-                att_id = body["attachmentId"]
-                att = service.users().messages().attachments().get(
-                    userId="me", messageId=msg["id"], id=att_id
-                ).execute()
-                file_data = att["data"]
+                file_data = client.get_attachment(msg["id"], body["attachmentId"])["data"]
 
             if file_data:
                 file_data_decoded = base64.urlsafe_b64decode(file_data)
-                os.makedirs(output_dir, exist_ok=True)
-                file_path = os.path.join(output_dir, filename)
-                with open(file_path, "wb") as f:
+                message_dir = os.path.join(output_dir, os.path.basename(msg["id"]))
+                os.makedirs(message_dir, exist_ok=True)
+                file_path = os.path.join(message_dir, os.path.basename(filename))
+                # Written under a temporary name and renamed, so a concurrent fetch never reads a partial file
+                fd, tmp_path = tempfile.mkstemp(dir=message_dir, suffix=".part")
+                with os.fdopen(fd, "wb") as f:
                     f.write(file_data_decoded)
-                found_pdfs.append(f"Downloaded: {file_path}")
+                os.replace(tmp_path, file_path)
+                artifact_cache.record_download(msg["id"], att_key, filename, file_path, file_data_decoded, period)
+                found_pdfs.append(file_path)
 
     if parts:
         for part in parts:
@@ -103,35 +136,30 @@ def save_pdf_from_message(msg, service, output_dir="downloads"):
         # Handle singlepart email with direct attachment
         process_part(payload)
 
-    logger.info(f"PDFs found : {found_pdfs}")
-    logger.info(f"Exitting save_pdf_from_message() ...")
     return found_pdfs
 
 
 def get_gmail_service():
-    
-    creds = Credentials.from_authorized_user_file("token.json", SCOPES)
-    service = build("gmail", "v1", credentials=creds)
-    return service
+    """The cached Gmail discovery service; use get_gmail_client() to execute requests from threads."""
+    return get_gmail_client().service
 
-def search_gmail_with_pdfs(query: str):
+def search_gmail_with_pdfs(query: str, limit: int = None):
+    """Downloads the PDFs of every matching statement email (or the first `limit`), following result pages."""
     logger.info(f"Entering search_gmail_with_pdfs...")
     query = "from:(estatement@icicibank.com) label:inbox " + query
-    service = get_gmail_service()
+    client = get_gmail_client()
     logger.info(f"Search Query : {query} ")
-    results = service.users().messages().list(userId="me", q=query).execute()
-    messages = results.get("messages", [])
+    messages = client.list_messages(query, limit)
 
     logger.info(f"✅ Found {len(messages)} message(s) for query")
 
-    output = []
-    for msg_meta in messages[:1]:
-        msg = service.users().messages().get(userId="me", id=msg_meta["id"], format="full").execute()
-        #pprint.pprint(msg)
+    def fetch_and_save(msg_id):
+        msg = client.get_message(msg_id)
         print_email_summary(msg)
-        found = save_pdf_from_message(msg, service)
-        output.extend(found)
-    
+        return save_pdf_from_message(msg, client)
+
+    # Message bodies and their attachments are fetched concurrently, one message per worker
+    output = [path for found in client.map(fetch_and_save, [m["id"] for m in messages]) for path in found]
     return output if output else ["No PDFs found"]
 
 def get_password_for_bank(bank):
@@ -158,186 +186,41 @@ def decrypt_with_pikepdf(input_path, output_path, password):
     except pikepdf._qpdf.PasswordError:
         raise ValueError("Incorrect password or unsupported encryption")
     
+@tracing.traced("decrypt")
+def decrypt_statement(path, password):
+    """Decrypts the statement next to the original, reusing a cached decrypted copy of the same bytes."""
+    cached = artifact_cache.lookup_decrypted(path)
+    if cached:
+        logger.info(f"Using cached decrypted file for {path}: {cached['decrypted_path']}")
+        return cached["decrypted_path"]
+    decrypted_path = decrypt_with_pikepdf(path, path.replace(".pdf","_decrypted.pdf"), password)
+    artifact_cache.record_decrypt(path, decrypted_path)
+    return decrypted_path
+
 def parse_icici_statement(path, bank, account_no):
     logger.info(f"Entering parse_icici__statement() ...")
-    transactions = []
-    last_bal = 0
-    with pdfplumber.open(path) as pdf:
-        for page_num, page in enumerate(pdf.pages):
-            logger.info(f"\n📄 Processing page {page_num + 1}")
-            text = page.extract_text()
-            
-            if not text:
-                continue
-            lines = text.split("\n")
-            logger.info(f"Extracted {len(lines)} lines from page {page_num + 1}")
-            #print(f"number of lines: {len(lines)} : \n {lines}") 
-            # for line in lines:
-            #     print(line)
-            # exit(0)
-            i = 0
-            while i < len(lines):
-                line = lines[i].strip()
-
-                # Skip header
-                if line.startswith("DATE MODE PARTICULARS"):
-                    i += 1
-                    continue
-                # Handle balance forward (e.g., 01-04-2025 B/F 9841.12)
-                bf_match = re.match(r"^(\d{2}-\d{2}-\d{4})\s+B/F\s+([\d,]+\.\d{2})$", line)
-                if bf_match:
-                    transactions.append({
-                        "date": bf_match.group(1),
-                        "description": "Balance Forward",
-                        "amount": 0.0,
-                        "balance": float(bf_match.group(2).replace(',', '')),
-                        "mode": "B/F",
-                        "type": "BALANCE",
-                        "receiver":"",
-                        "bank": bank,
-                        "account_no": account_no
-                    })
-                    last_bal = float(bf_match.group(2).replace(',', ''))
-                    i += 1
-                    continue
-
-                # Handle UPI transactions
-                # Handle generic UPI transaction spread across 3 lines (date in middle)
-                upi_txn_match = re.match(
-                    r"^(\d{2}-\d{2}-\d{4})\s+(?:(.*?)\s+)?([\d,]+\.\d{2})\s+([\d,]+\.\d{2})$",
-                    line
-                    )
-                
-                if upi_txn_match:
-                    date = upi_txn_match.group(1)
-                    middle_desc = upi_txn_match.group(2).strip() if upi_txn_match.group(2) else ""
-                    amount = float(upi_txn_match.group(3).replace(",", ""))
-                    balance = float(upi_txn_match.group(4).replace(",", ""))
-
-                    prev_desc = lines[i - 1].strip() if i - 1 >= 0 else ""
-                    next_desc = lines[i + 1].strip() if i + 1 < len(lines) else ""
-
-                    full_description = " ".join([prev_desc, middle_desc, next_desc]).strip()
-                    
-                    #print(f"Full Description: {full_description}")
-                    # if "/" in full_description and len(full_description.split("/")) > 1:
-                    #     receiver = full_description.split("/")[1]
-                    #     mode = full_description.split("/")[0]
-                    # else:
-                    parts = full_description.split("/")
-                    if len(parts) > 1:
-                        mode = parts[0].strip()
-                        receiver = parts[1].strip()
-                    else:
-                        if "Int.Pd" in full_description or "interest" in full_description.lower():
-                            mode = "Interest Credit"
-                            receiver = bank
-                        else:
-                            mode = "Unknown"
-                            receiver = "Unknown"
-                       
-                        
-                    # receiver = full_description.split("/")[1]
-                    # mode = full_description.split("/")[0]
-
-                    # # Heuristic: treat as UPI if 'UPI' is present in the description
-                    # mode = "UPI" if "UPI" in full_description.upper() else "SIP" if "ACH" in full_description.upper() else "NEFT" if "NEFT" in full_description.upper() else "UNKNOWN"
-
-                    transactions.append({
-                        "date": date,
-                        "description": full_description,
-                        "amount": amount,
-                        "balance": balance,
-                        "mode": mode,
-                        "type": "DEBIT" if last_bal > balance else "CREDIT",
-                        "receiver": receiver,
-                        "bank": bank,
-                        "account_no": account_no    
-                    })
-                    last_bal = balance
-                    i += 2  # Skip the next line which we consumed
-                    continue
-
-                # Handle NET BANKING transactions
-                netbank_match = re.match(
-                    r"^(\d{2}-\d{2}-\d{4})NET BANKING\s+(.*?)\s+([\d,]+\.\d{2})\s+([\d,]+\.\d{2})$",
-                    line
-                )   
-                if netbank_match:
-                    date = netbank_match.group(1)
-                    description = netbank_match.group(2).strip()
-                    amount = float(netbank_match.group(3).replace(",", ""))
-                    balance = float(netbank_match.group(4).replace(",", ""))
-
-                    transactions.append({
-                        "date": date,
-                        "description": description,
-                        "amount": amount,
-                        "balance": balance,
-                        "mode": "NET BANKING",
-                        "type": "DEBIT" if last_bal > balance else "CREDIT",
-                        "receiver": "",
-                        "bank": bank,
-                        "account_no": account_no
-                    })
-                    last_bal = balance
-                    i += 1
-                    continue
-
-                # Handle MOBILE BANKING transactions
-                mobile_match = re.match(
-                    r"^(\d{2}-\d{2}-\d{4})MOBILE BANKING\s+(.+?)\s+([\d,]+\.\d{2})\s+([\d,]+\.\d{2})$",
-                    line
-                )
-                if mobile_match:
-                    date = mobile_match.group(1)
-                    description = mobile_match.group(2).strip()
-                    amount = float(mobile_match.group(3).replace(",", ""))
-                    balance = float(mobile_match.group(4).replace(",", ""))
-                    transactions.append({
-                        "date": date,
-                        "description": description,
-                        "amount": amount,
-                        "balance": balance,
-                        "mode": "MOBILE BANKING",
-                        "type": "DEBIT" if last_bal > balance else "CREDIT",
-                        "receiver": "",
-                        "bank": bank,
-                        "account_no": account_no
-                    })
-                    last_bal = balance
-                    i += 1
-                    continue
-                # Handle ICICI DIRECT transactions
-                icici_direct_match = re.match(
-                    r"^(\d{2}-\d{2}-\d{4})ICICI DIRECT\s+(.+?)\s+([\d,]+\.\d{2})\s+([\d,]+\.\d{2})$",
-                    line
-                )   
-                if icici_direct_match:
-                    date = icici_direct_match.group(1)
-                    description = icici_direct_match.group(2).strip()
-                    amount = float(icici_direct_match.group(3).replace(",", ""))
-                    balance = float(icici_direct_match.group(4).replace(",", ""))
-                    transactions.append({
-                        "date": date,
-                        "description": description,
-                        "amount": amount,
-                        "balance": balance,
-                        "mode": "ICICI DIRECT",
-                        "type": "DEBIT" if last_bal > balance else "CREDIT",
-                        "receiver": "",
-                        "bank": bank,
-                        "account_no": account_no
-                    })
-                    last_bal = balance
-                    i += 1
-                    continue
-                i += 1
-    for row in transactions:
-        row['date'] = datetime.strptime(row['date'], '%d-%m-%Y').date()
-        # row['bank'] = bank
-        # row['account_no'] = account_no
-    return store_transactions_to_duckdb(transactions,"finance.db")
+    cached = artifact_cache.lookup_parse(path, bank, account_no)
+    if cached:
+        return (
+            f"Statement already ingested: {cached['parsed_rows']} transactions from "
+            f"{cached['parsed_start']} to {cached['parsed_end']} are in DuckDB database. Check the database now."
+        )
+    transactions = parse_icici_transactions(path, bank, account_no)
+    # The period of the mail the statement came in covers the days without transactions too
+    period = artifact_cache.lookup_period(path)
+    coverage = [(bank, account_no, *period)] if period else None
+    result = store_transactions_to_duckdb(transactions,"finance.db", coverage=coverage)
+    artifact_cache.record_parse(path, transactions, bank, account_no)
+    return result
+
+@tracing.traced("parse")
+def parse_icici_transactions(path, bank, account_no):
+    """Parses a decrypted ICICI statement PDF into a transactions DataFrame without storing it."""
+    # Pages are extracted in parallel but come back in order, so last_bal carries across pages
+    pages = extract_pdf_pages(path)
+    logger.info(f"Extracted {sum(len(lines) for lines in pages)} lines from {len(pages)} page(s)")
+
+    return parse_icici_pages(pages, bank, account_no)
 
 
 
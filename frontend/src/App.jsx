@@ -13,69 +13,122 @@ const MODELS = [
   "ollama:qwen3"
 ];
 const DEBUG_MODE = true;
+// NDJSON events from /chat; false reads the plain-text stream with its validated_query trailer
+const USE_EVENT_STREAM = true;
+const TRAILER_MARKER = "<END::validated_query:";
 
-function createTagFilteringStreamHandler({
-  onData,
-  tagsToFilter = ["think"],
-  enabled = true,
-}) {
-  if (!enabled) {
-    return (chunk) => {
-      onData(chunk);
-    };
+// Adds a piece of streamed text to the message, extending its last part when the kind matches
+function appendPart(parts, kind, text) {
+  const last = parts[parts.length - 1];
+  if (last && last.kind === kind) {
+    return [...parts.slice(0, -1), { kind, text: last.text + text }];
   }
-  let buffer = "";
-  let skipping = false;
-  let currentTag = "";
-
-  const startTags = tagsToFilter.map((tag) => `<${tag}>`);
-  const endTags = tagsToFilter.map((tag) => `</${tag}>`);
-
-  return (chunk) => {
-    buffer += chunk;
-    let output = "";
-
-    while (buffer.length > 0) {
-      if (!skipping) {
-        const nextStart = startTags
-          .map((tag) => buffer.indexOf(tag))
-          .filter((i) => i !== -1)
-          .sort((a, b) => a - b)[0];
-
-        if (nextStart === 0) {
-          const matchedTag = startTags.find((tag) => buffer.startsWith(tag));
-          currentTag = matchedTag;
-          skipping = true;
-          buffer = buffer.slice(matchedTag.length);
-          continue;
-        }
-
-        if (nextStart > 0) {
-          output += buffer.slice(0, nextStart);
-          buffer = buffer.slice(nextStart);
-          continue;
-        }
-
-        output += buffer;
-        buffer = "";
-      } else {
-        const closingTag = `</${currentTag.slice(1)}`; // e.g., </think>
-        const endIdx = buffer.indexOf(closingTag);
-        if (endIdx === -1) {
-          buffer = ""; // Still in hidden block, discard buffer
-          return;
-        } else {
-          buffer = buffer.slice(endIdx + closingTag.length);
-          skipping = false;
-          currentTag = "";
-        }
-      }
-    }
+  return [...parts, { kind, text }];
+}
 
-    if (output) {
-      onData(output);
-    }
+// Applies one event of the /chat NDJSON stream to the AI message being built
+function applyEvent(msg, event) {
+  switch (event.type) {
+    case "token":
+      return { ...msg, showDots: false, parts: appendPart(msg.parts, "text", event.text) };
+    case "think":
+      return DEBUG_MODE ? { ...msg, parts: appendPart(msg.parts, "think", event.text) } : msg;
+    case "tool_start":
+      return { ...msg, tools: [...msg.tools, { id: event.id, name: event.name, status: "running" }] };
+    case "tool_end":
+      return {
+        ...msg,
+        tools: msg.tools.map((t) => (t.id === event.id ? { ...t, status: event.status, ms: event.ms } : t)),
+      };
+    case "error":
+      return { ...msg, showDots: false, parts: appendPart(msg.parts, "text", `\n\n_Error: ${event.detail}_`) };
+    default:
+      return msg;
+  }
+}
+
+// Think and text parts of a plain-text answer; an unclosed <think> runs to the end
+function splitThink(content) {
+  return content
+    .split(/(<think>[\s\S]*?(?:<\/think>|$))/)
+    .filter(Boolean)
+    .map((section) => section.startsWith("<think>")
+      ? { kind: "think", text: section.replace(/<\/?think>/g, "") }
+      : { kind: "text", text: section })
+    .filter((part) => DEBUG_MODE || part.kind === "text");
+}
+
+// Length of the longest end of `text` that could be the start of the trailer marker
+function partialMarker(text) {
+  for (let size = Math.min(TRAILER_MARKER.length - 1, text.length); size > 0; size--) {
+    if (text.endsWith(TRAILER_MARKER.slice(0, size))) return size;
+  }
+  return 0;
+}
+
+// Reads the NDJSON event stream, calling onEvent for every event and onRead after every network read
+async function readEvents(res, onEvent, onRead) {
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder("utf-8");
+  // One JSON event per line; a read can end in the middle of a line
+  let pending = "";
+  const handleLine = (line) => {
+    if (line.trim()) onEvent(JSON.parse(line));
   };
+
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    pending += decoder.decode(value, { stream: true });
+    const lines = pending.split("\n");
+    pending = lines.pop();
+    lines.forEach(handleLine);
+    onRead();
+  }
+  handleLine(pending + decoder.decode());
+}
+
+// Reads the plain-text stream: answer text, then the <END::validated_query:{...}> trailer
+async function readText(res, onText, onValidatedQuery) {
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder("utf-8");
+  // The marker can be split across reads, so a tail that may start it is held back
+  let pending = "";
+  let trailer = null;
+
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    const chunk = decoder.decode(value, { stream: true });
+    if (trailer !== null) {
+      trailer += chunk;
+      continue;
+    }
+    pending += chunk;
+    const markerIdx = pending.indexOf(TRAILER_MARKER);
+    if (markerIdx !== -1) {
+      onText(pending.slice(0, markerIdx));
+      trailer = pending.slice(markerIdx);
+      pending = "";
+      continue;
+    }
+    const ready = pending.length - partialMarker(pending);
+    onText(pending.slice(0, ready));
+    pending = pending.slice(ready);
+  }
+
+  if (trailer === null) {
+    onText(pending + decoder.decode());
+    return;
+  }
+  trailer += decoder.decode();
+  console.log("Raw chunk for validated query: ", trailer);
+  const json = trailer.slice(trailer.indexOf("{"), trailer.lastIndexOf("}") + 1);
+  try {
+    onValidatedQuery(JSON.parse(json));
+  } catch (e) {
+    console.error("Failed to parse validated_query", e);
+  }
 }
 
 function mergeValidateQuery(oldQuery, newQuery) {
@@ -96,6 +149,8 @@ function App() {
   const [loading, setLoading] = useState(false);
   const [selectedModel, setSelectedModel] = useState(MODELS[0]);
   const [validatedQuery, setValidatedQuery] = useState(null);
+  // The server keeps the conversation for this thread, so only new messages are sent
+  const threadId = useRef(crypto.randomUUID());
 
   const handleSend = async (messageToSend = input) => {
     if (!messageToSend.trim()) return;
@@ -106,18 +161,15 @@ function App() {
     setInput("");
     setLoading(true);
 
-    let aiMsg = { role: "ai", content: "", showDots: true };
+    let aiMsg = { role: "ai", parts: [], tools: [], showDots: true };
     setMessages((prev) => [...prev, aiMsg]);
 
-    // Prepare messages to send (exclude streaming/placeholder ai message)
-    const messagesToSend = [...messages, userMsg].filter(
-      (msg) => msg.role === "user" || msg.role === "ai"
-    ).map(({ role, content }) => ({ role, content }));
+    const messagesToSend = [userMsg];
 
     console.log(`Details Sent from frontend: 
       ${ JSON.stringify(messagesToSend) },
       ${selectedModel}, 
-      ${validatedQuery}`);
+      ${threadId.current}`);
 
     try {
       const res = await fetch("http://localhost:8000/chat", {
@@ -126,51 +178,44 @@ function App() {
         body: JSON.stringify({
           messages: messagesToSend,
           model: selectedModel,
-          validated_query: validatedQuery
+          thread_id: threadId.current,
+          events: USE_EVENT_STREAM
         }),
       });
 
-      const reader = res.body.getReader();
-      const decoder = new TextDecoder("utf-8");
-     
-  
-      const filterStream = createTagFilteringStreamHandler({
-        tagsToFilter: ["think"],
-        enabled: !DEBUG_MODE,
-        onData: (filteredChunk) => {
-          if (filteredChunk.trim()) {
-            aiMsg.showDots = false;
-          }
-          aiMsg.content += filteredChunk;
-          setMessages((prev) => [...prev.slice(0, -1), { ...aiMsg }]);
-        },
-      });
-  
-      while (true) {
-        const { done, value } = await reader.read();
-        if (done) break;
-        const chunk = decoder.decode(value, { stream: true });
-  
-        //intercept for validated_query
-        if (chunk.startsWith("<END::validated_query:")) {
-          console.log("Raw chunk for validated query: ", chunk);
-          //const json = chunk.slice(24, -1);
-          const jsonStart = chunk.indexOf("{");
-          const jsonEnd = chunk.lastIndexOf("}") + 1;
-          const json = chunk.slice(jsonStart, jsonEnd);
-          try {
-            const parsed = JSON.parse(json)
-            //setValidatedQuery(parsed);
-            setValidatedQuery(prev => mergeValidateQuery(prev, parsed));
-          } catch (e) {
-            console.error("Failed to parse validated_query", e);
+      if (!res.ok) {
+        // e.g. a 429 while the model backend is busy
+        const body = await res.json().catch(() => ({}));
+        aiMsg = applyEvent(aiMsg, { type: "error", detail: body.detail || res.statusText });
+        setMessages((prev) => [...prev.slice(0, -1), aiMsg]);
+        return;
+      }
+
+      const render = () => setMessages((prev) => [...prev.slice(0, -1), aiMsg]);
+      const mergeQuery = (query) => setValidatedQuery(prev => mergeValidateQuery(prev, query));
+
+      if (USE_EVENT_STREAM) {
+        // One render per read, however many events it carried
+        await readEvents(res, (event) => {
+          if (event.type === "validated_query") {
+            mergeQuery(event.data);
+          } else if (event.type === "done") {
+            console.log(`Trace ${event.trace_id}: first token ${event.first_token_ms} ms, total ${event.elapsed_ms} ms`);
+          } else {
+            aiMsg = applyEvent(aiMsg, event);
           }
-          
-          continue;
-        }
-  
-        filterStream(chunk);
+        }, render);
+      } else {
+        let content = "";
+        await readText(res, (text) => {
+          if (!text) return;
+          content += text;
+          aiMsg = { ...aiMsg, showDots: !content.trim(), parts: splitThink(content) };
+          render();
+        }, mergeQuery);
       }
+      aiMsg = { ...aiMsg, showDots: false };
+      setMessages((prev) => [...prev.slice(0, -1), aiMsg]);
 
     } catch (err) {
       console.error("Error streaming response", err)
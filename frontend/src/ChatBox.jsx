@@ -43,30 +43,35 @@ export default function ChatBox({ messages, loading }) {
         {
             messages.map(
                 (msg, i) => {
-                    if (msg.role === "ai" && msg.content.includes("<think>")) {
+                    if (msg.role === "ai" && msg.parts) {
+                        // Streamed answers arrive already split into think and text parts
                         return (
                             <React.Fragment key={i}>
-                                {msg.content
-                                    .split(/(<think>.*?<\/think>)/gs)
-                                    .filter(Boolean)
-                                    .map((section, j) => {
-                                        if (section.startsWith("<think>")) {
-                                            const thinkContent = section.replace(/<\/?think>/g, "");
-                                            return (
-                                                <div key={`${i}-${j}`} className="message think">
-                                                    <Collapsible title="Thinking...">
-                                                      <em>{thinkContent}</em>
-                                                    </Collapsible>
-                                                </div>
-                                            );
-                                        } else {
-                                            return (
-                                                <div key={`${i}-${j}`} className="message ai">
-                                                    <ReactMarkDown>{section}</ReactMarkDown>
-                                                </div>
-                                            );
-                                        }
-                                    })}
+                                {msg.tools.length > 0 && (
+                                    <div className="message tool">
+                                        {msg.tools.map((tool) => (
+                                            <div key={tool.id}>
+                                                {tool.name}: {tool.status}{tool.ms !== undefined && ` (${Math.round(tool.ms)} ms)`}
+                                            </div>
+                                        ))}
+                                    </div>
+                                )}
+                                {msg.parts.map((part, j) => {
+                                    if (part.kind === "think") {
+                                        return (
+                                            <div key={`${i}-${j}`} className="message think">
+                                                <Collapsible title="Thinking...">
+                                                  <em>{part.text}</em>
+                                                </Collapsible>
+                                            </div>
+                                        );
+                                    }
+                                    return (
+                                        <div key={`${i}-${j}`} className="message ai">
+                                            <ReactMarkDown>{part.text}</ReactMarkDown>
+                                        </div>
+                                    );
+                                })}
                             </React.Fragment>
                         )
                     } else {